@@ -1 +1,12 @@
-from sf_permits import config  # noqa: F401
+import importlib
+
+
+def __getattr__(name: str):
+    # Submodules are imported on first access, so importing the package
+    # does not import the dependencies of every stage
+    try:
+        return importlib.import_module(f"sf_permits.{name}")
+    except ModuleNotFoundError as error:
+        if error.name != f"sf_permits.{name}":
+            raise
+        raise AttributeError(f"module 'sf_permits' has no attribute {name!r}") from None
@@ -0,0 +1,745 @@
+from collections.abc import Callable
+from dataclasses import asdict, dataclass, field
+from datetime import UTC, datetime
+from itertools import combinations
+import json
+import os
+from pathlib import Path
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Any
+
+import pandas as pd
+import typer
+
+from sf_permits.cleaning import (
+    COORDINATE_COLUMNS,
+    PUNCTUATION_REGEX,
+    cleaning_stages,
+    fix_street_name_spelling,
+    impute_group,
+    match,
+    read_location_layers,
+    street_names_index,
+    street_names_similar_batch,
+)
+from sf_permits.config import BENCHMARK_DATA_DIR, PROJ_ROOT, logger
+from sf_permits.dataset import (
+    infer_permit_dtypes,
+    iter_permits,
+    load_permits,
+    read_parquet,
+)
+from sf_permits.duplicates import detect_duplicates
+from sf_permits.instrumentation import peak_rss
+from sf_permits.partitioned import clean_partitioned
+from sf_permits.pipeline import (
+    Stage,
+    checkpoint_path,
+    code_digest,
+    run_pipeline,
+    stage_keys,
+)
+from sf_permits.profiling import (
+    DEFAULT_SKETCH_CAPACITY,
+    ColumnStatistics,
+    TableStatistics,
+    profile,
+    profile_attribute,
+    profile_chunks,
+    profile_table,
+)
+from sf_permits.synthetic import SyntheticPaths, write_synthetic_data
+from sf_permits.utils.string_similarity import (
+    get_matching_strings,
+    matching_recall,
+)
+
+app = typer.Typer()
+
+HISTORY_PATH = BENCHMARK_DATA_DIR / "history.jsonl"
+# Modules run as commands, whose start-up time is guarded
+ENTRY_POINTS = [
+    "sf_permits.cleaning",
+    "sf_permits.incremental",
+    "sf_permits.partitioned",
+    "sf_permits.duplicates",
+    "sf_permits.profiling",
+    "sf_permits.synthetic",
+    "sf_permits.benchmark",
+]
+# Slow dependencies which entry points should only import when used
+LAZY_MODULES = ["dotenv", "geopandas", "loguru", "shapely", "tqdm"]
+# Slowdown in the import time of an entry point which counts as a regression
+IMPORT_TIME_TOLERANCE = 0.25
+
+
+@dataclass
+class BenchmarkContext:
+    """
+    Synthetic data of one scale and the inputs of each cleaning stage.
+
+    Inputs are read from the checkpoints of the end-to-end pipeline run,
+    so the pipeline must be benchmarked before any single stage.
+    """
+
+    paths: SyntheticPaths
+    rows: int
+    workers: int
+    checkpoint_dir: Path
+    stages: list[Stage] = field(init=False)
+
+    def __post_init__(self):
+        self.stages = cleaning_stages(
+            self.paths.permits,
+            self.workers,
+            self.paths.neighbourhoods,
+            self.paths.zip_codes,
+            self.paths.street_names,
+        )
+
+    def stage_input(self, name: str) -> pd.DataFrame:
+        """Output of the stage before `name` in the last pipeline run."""
+        position = [stage.name for stage in self.stages].index(name)
+        key = stage_keys(self.stages)[position - 1]
+        return read_parquet(
+            checkpoint_path(
+                self.checkpoint_dir, position - 1, self.stages[position - 1], key
+            )
+        )
+
+
+@dataclass
+class BenchmarkResult:
+    """
+    Timings of a benchmark over several repeats.
+
+    Times are in seconds and memory in bytes; throughput is the number
+    of input rows per second in the fastest repeat. `peak_allocated` is
+    the peak of memory traced by Python during a separate run, which
+    includes NumPy but not Arrow allocations. `recall` is set only for
+    approximate methods, against the exact method they replace.
+    """
+
+    name: str
+    rows: int
+    times: list[float]
+    best: float
+    median: float
+    throughput: float
+    peak_allocated: int | None = None
+    peak_rss: int | None = None
+    recall: float | None = None
+
+    @classmethod
+    def from_times(cls, name: str, rows: int, times: list[float], **kwargs):
+        best = min(times)
+        return cls(
+            name,
+            rows,
+            times,
+            best,
+            statistics.median(times),
+            rows / best if best > 0 else float("inf"),
+            **kwargs,
+        )
+
+
+# Each benchmark prepares its inputs from the context and returns
+# the call which is timed, so preparation is not measured
+BENCHMARKS: dict[str, Callable[[BenchmarkContext], Callable[[], Any]]] = {}
+# Benchmarks of approximate methods also measure the recall of their
+# output against the exact method, which is not timed
+RECALLS: dict[str, Callable[[BenchmarkContext, Any], float]] = {}
+
+
+def benchmark(
+    name: str, recall: Callable[[BenchmarkContext, Any], float] | None = None
+) -> Callable:
+    """Register a benchmark of a single stage or function."""
+
+    def register(func: Callable[[BenchmarkContext], Callable[[], Any]]):
+        BENCHMARKS[name] = func
+        if recall is not None:
+            RECALLS[name] = recall
+        return func
+
+    return register
+
+
+def matching_inputs(context: BenchmarkContext) -> tuple[pd.Series, pd.Series]:
+    """External street names and distinct spellings, as matched in cleaning."""
+    spellings = context.stage_input("fix_street_names")["Street Name"].str.replace(
+        PUNCTUATION_REGEX, "", regex=True
+    )
+    spellings = pd.Series(spellings.dropna().unique())
+    street_df = pd.read_csv(context.paths.street_names).convert_dtypes()
+    external_street_names = (
+        street_df["StreetName"].str.lower()
+        + " "
+        + street_df["PostDirection"].str.lower().fillna("")
+    ).str.strip()
+    return external_street_names, spellings
+
+
+@benchmark("get_matching_strings")
+def bench_get_matching_strings(context: BenchmarkContext) -> Callable[[], Any]:
+    external_street_names, spellings = matching_inputs(context)
+    return lambda: get_matching_strings(
+        external_street_names,
+        spellings,
+        street_names_similar_batch,
+        vectorised=True,
+        workers=context.workers,
+    )
+
+
+def indexed_matching_recall(context: BenchmarkContext, output: Any) -> float:
+    """Recall of matches found with the street name index against a full scan."""
+    reference_indices, _ = BENCHMARKS["get_matching_strings"](context)()
+    indices, _ = output
+    return matching_recall(reference_indices, indices)
+
+
+@benchmark("get_matching_strings_indexed", recall=indexed_matching_recall)
+def bench_get_matching_strings_indexed(
+    context: BenchmarkContext,
+) -> Callable[[], Any]:
+    external_street_names, spellings = matching_inputs(context)
+    return lambda: get_matching_strings(
+        external_street_names,
+        spellings,
+        street_names_similar_batch,
+        index=street_names_index(spellings),
+        vectorised=True,
+        workers=context.workers,
+    )
+
+
+@benchmark("fix_street_name_spelling")
+def bench_fix_street_name_spelling(context: BenchmarkContext) -> Callable[[], Any]:
+    df = context.stage_input("fix_street_names")
+    return lambda: fix_street_name_spelling(
+        df.copy(), context.paths.street_names, context.workers
+    )
+
+
+@benchmark("match")
+def bench_match(context: BenchmarkContext) -> Callable[[], Any]:
+    df = context.stage_input("label_locations")
+    import geopandas as gpd
+
+    base = read_location_layers(context.paths.neighbourhoods, context.paths.zip_codes)
+    geometry = gpd.GeoSeries.from_xy(df["longitude"], df["latitude"])
+    return lambda: match(base["Neighborhood"], geometry)
+
+
+@benchmark("impute_group")
+def bench_impute_group(context: BenchmarkContext) -> Callable[[], Any]:
+    df = context.stage_input("impute_locations")
+    return lambda: impute_group(
+        df.copy(),
+        ["Block", "Lot"],
+        mean_columns=COORDINATE_COLUMNS,
+        mode_columns=["Street Name", "Street Suffix", "Supervisor District"],
+    )
+
+
+@benchmark("detect_duplicates")
+def bench_detect_duplicates(context: BenchmarkContext) -> Callable[[], Any]:
+    df = context.stage_input("drop_duplicates")
+    return lambda: detect_duplicates(df)
+
+
+@benchmark("clean_partitioned")
+def bench_clean_partitioned(context: BenchmarkContext) -> Callable[[], Any]:
+    # Four partitions, so stages which depend on other permits
+    # merge the summaries of several of them
+    return lambda: clean_partitioned(
+        context.paths.permits,
+        context.checkpoint_dir.parent / "partitions",
+        max(context.rows // 4, 1),
+        context.workers,
+        context.paths.neighbourhoods,
+        context.paths.zip_codes,
+        context.paths.street_names,
+    )
+
+
+def _profiled_permits(context: BenchmarkContext) -> pd.DataFrame:
+    path = context.paths.permits
+    return load_permits(path, schema=infer_permit_dtypes(path))
+
+
+@benchmark("profile")
+def bench_profile(context: BenchmarkContext) -> Callable[[], Any]:
+    df = _profiled_permits(context)
+    return lambda: profile(df, workers=context.workers)
+
+
+@benchmark("profile_attributes")
+def bench_profile_attributes(context: BenchmarkContext) -> Callable[[], Any]:
+    df = _profiled_permits(context)
+    return lambda: [profile_attribute(ColumnStatistics(df[column])) for column in df]
+
+
+@benchmark("profile_table")
+def bench_profile_table(context: BenchmarkContext) -> Callable[[], Any]:
+    df = _profiled_permits(context)
+    return lambda: profile_table(TableStatistics(df))
+
+
+@benchmark("profile_chunks")
+def bench_profile_chunks(context: BenchmarkContext) -> Callable[[], Any]:
+    schema = infer_permit_dtypes(context.paths.permits)
+    return lambda: profile_chunks(
+        iter_permits(context.paths.permits, schema=schema),
+        DEFAULT_SKETCH_CAPACITY,
+        approximate=False,
+    )
+
+
+def run_benchmark(
+    name: str, context: BenchmarkContext, repeat: int, trace_memory: bool = True
+) -> BenchmarkResult:
+    """
+    Time a registered benchmark `repeat` times, preparing it before each.
+
+    Memory is traced in an extra run, since tracing slows down
+    allocations and would distort the timings.
+    """
+    times = []
+    for _ in range(repeat):
+        call = BENCHMARKS[name](context)
+        start = time.perf_counter()
+        output = call()
+        times.append(time.perf_counter() - start)
+
+    recall = None
+    if name in RECALLS:
+        recall = RECALLS[name](context, output)
+        logger.info("{} has a recall of {:.4f}", name, recall)
+
+    peak_allocated = None
+    if trace_memory:
+        call = BENCHMARKS[name](context)
+        tracemalloc.start()
+        call()
+        _, peak_allocated = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return BenchmarkResult.from_times(
+        name,
+        context.rows,
+        times,
+        peak_allocated=peak_allocated,
+        peak_rss=peak_rss(),
+        recall=recall,
+    )
+
+
+def run_pipeline_benchmark(
+    context: BenchmarkContext, repeat: int
+) -> list[BenchmarkResult]:
+    """
+    Time every stage of the cleaning pipeline and the pipeline as a whole.
+
+    All stages are rerun each time, and the checkpoints of the last run
+    are left behind as the inputs of the single stage benchmarks.
+    """
+    stage_times = {stage.name: [] for stage in context.stages}
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _, reports = run_pipeline(
+            context.stages, context.checkpoint_dir, force={context.stages[0].name}
+        )
+        times.append(time.perf_counter() - start)
+        for report in reports:
+            stage_times[report.name].append(report.wall_time)
+
+    # Only the pipeline reports peak memory, since a stage can only
+    # raise the peak of the whole process
+    results = [
+        BenchmarkResult.from_times(f"stage:{name}", context.rows, stage_times[name])
+        for name in stage_times
+    ]
+    results.append(
+        BenchmarkResult.from_times("pipeline", context.rows, times, peak_rss=peak_rss())
+    )
+    return results
+
+
+def prepare_data(data_dir: Path, rows: int, seed: int) -> SyntheticPaths:
+    """Generate synthetic data of a scale, unless it was generated before."""
+    directory = data_dir / f"synthetic-{rows}-{seed}"
+    paths = SyntheticPaths.in_directory(directory)
+    if paths.exist():
+        logger.debug("Reusing synthetic data in {}", directory)
+        return paths
+    logger.info("Generating {} synthetic permits", rows)
+    return write_synthetic_data(directory, rows, seed)
+
+
+def import_time(module: str, repeat: int) -> dict:
+    """
+    Time the import of `module` in a fresh interpreter.
+
+    Uses the cumulative time reported by `python -X importtime`,
+    in seconds, in the fastest of `repeat` runs, along with the modules
+    of `LAZY_MODULES` which were imported eagerly.
+    """
+    times = []
+    for _ in range(repeat):
+        report = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stderr
+        imported = {}
+        for line in report.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                imported[name.strip()] = int(cumulative) / 1e6
+        times.append(imported[module])
+    return {
+        "time": min(times),
+        "eager": [name for name in LAZY_MODULES if name in imported],
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=PROJ_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path: Path) -> list[dict]:
+    if not path.exists():
+        return []
+    with path.open() as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def previous_run(run: dict, history: list[dict]) -> dict | None:
+    """The last run in `history` on the same scale, seed, workers and machine."""
+    return next(
+        (
+            record
+            for record in reversed(history)
+            if all(
+                record.get(key) == run[key]
+                for key in ("rows", "seed", "workers", "machine")
+            )
+        ),
+        None,
+    )
+
+
+def compare_with_history(run: dict, previous: dict | None) -> None:
+    """Log the change in throughput and import time since `previous`."""
+    if previous is None:
+        logger.info("No previous run with {} rows to compare with", run["rows"])
+        return
+    previous_results = {result["name"]: result for result in previous["results"]}
+    for result in run["results"]:
+        if (before := previous_results.get(result["name"])) is None:
+            continue
+        logger.info(
+            "{:<40} {:>12.0f} rows/s ({:+.1%} since {})",
+            result["name"],
+            result["throughput"],
+            result["throughput"] / before["throughput"] - 1,
+            previous["commit"] or previous["timestamp"],
+        )
+    previous_imports = previous.get("imports", {})
+    for module, imported in run.get("imports", {}).items():
+        if (before := previous_imports.get(module)) is None:
+            continue
+        logger.info(
+            "{:<40} {:>10.3f} s to import ({:+.1%} since {})",
+            module,
+            imported["time"],
+            imported["time"] / before["time"] - 1,
+            previous["commit"] or previous["timestamp"],
+        )
+
+
+def import_regressions(
+    run: dict, previous: dict | None, tolerance: float = IMPORT_TIME_TOLERANCE
+) -> list[str]:
+    """
+    Describe entry points which import slow dependencies eagerly or slowed down.
+
+    Import times are compared with `previous`, if it timed them, and
+    count as a regression if they grew by more than `tolerance`.
+    """
+    previous_imports = (previous or {}).get("imports", {})
+    regressions = []
+    for module, imported in run.get("imports", {}).items():
+        if imported["eager"]:
+            regressions.append(f"{module} imports {', '.join(imported['eager'])}")
+        before = previous_imports.get(module)
+        if before is not None and imported["time"] > (1 + tolerance) * before["time"]:
+            regressions.append(
+                f"{module} takes {imported['time']:.3f} s to import, "
+                f"up from {before['time']:.3f} s"
+            )
+    return regressions
+
+
+def stage_digests() -> dict[str, str]:
+    """Code digest of each cleaning stage and of incremental cleaning."""
+    from sf_permits.incremental import clean_permits
+
+    digests = {stage.name: code_digest(stage.func) for stage in cleaning_stages(Path())}
+    digests["incremental"] = code_digest(clean_permits)
+    return digests
+
+
+def unstable_digests() -> list[str]:
+    """
+    Describe code digests which differ between two fresh interpreters.
+
+    Interpreters are started with different hash seeds, so digests
+    which depend on memory addresses or on the order of sets differ.
+    Such digests invalidate checkpoints and incremental state on every run.
+    """
+    digests = []
+    for hash_seed in ("1", "2"):
+        output = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                (
+                    "import json; from sf_permits.benchmark import stage_digests; "
+                    "print(json.dumps(stage_digests()))"
+                ),
+            ],
+            env=os.environ | {"PYTHONHASHSEED": hash_seed},
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        digests.append(json.loads(output.splitlines()[-1]))
+    return [
+        f"{name} has a different code digest in every process"
+        for name, digest in digests[0].items()
+        if digests[1].get(name) != digest
+    ]
+
+
+def resume_differences(context: BenchmarkContext) -> list[str]:
+    """
+    Describe stages before which resuming changes the pipeline output.
+
+    The pipeline is run in full and then resumed from the checkpoint
+    before each later stage. Outputs must have the same values and
+    types, including the types of categories, since later stages
+    behave differently on columns which changed type in a checkpoint.
+    """
+    first = context.stages[0].name
+    full, _ = run_pipeline(context.stages, context.checkpoint_dir, force={first})
+    differences = []
+    for stage in context.stages[1:]:
+        resumed, _ = run_pipeline(
+            context.stages, context.checkpoint_dir, force={stage.name}
+        )
+        if not full.equals(resumed) or _types(full) != _types(resumed):
+            differences.append(
+                f"Resuming before stage {stage.name} gives a different output"
+            )
+    return differences
+
+
+def _types(df: pd.DataFrame) -> dict[str, tuple[str, str | None]]:
+    return {
+        column: (
+            str(dtype),
+            str(dtype.categories.dtype)
+            if isinstance(dtype, pd.CategoricalDtype)
+            else None,
+        )
+        for column, dtype in df.dtypes.items()
+    }
+
+
+def labelled_permits() -> tuple[pd.DataFrame, pd.Series]:
+    """
+    Permits labelled in the duplicate detection notebook.
+
+    The first rows are one permit split across lots and are duplicates,
+    while the last two are different permits filed at the same address,
+    made to agree on everything else. Returns the permits and the group
+    each of them should be in.
+    """
+    address = {
+        "Street Suffix": "av",
+        "Street Number Suffix": pd.NA,
+        "Unit Suffix": pd.NA,
+        "Description": "provide lift for ada access to 2nd floor",
+        "Filed Date": pd.Timestamp("2016-04-29"),
+    }
+    split = [
+        address
+        | {
+            "Permit Number": "201604296147",
+            "Street Name": "raymond",
+            "Street Number": 50,
+            "Unit": pd.NA,
+            "Block": "6237",
+            "Lot": lot,
+        }
+        for lot in ("009", "010", "011", "012", "013")
+    ]
+    same_address = [
+        address
+        | {
+            "Permit Number": number,
+            "Street Name": "market",
+            "Street Number": 1390,
+            "Unit": 0,
+            "Block": "0855",
+            "Lot": "001",
+        }
+        for number in ("201506179165", "201602240403")
+    ]
+    df = pd.DataFrame(split + same_address).convert_dtypes()
+    return df, pd.Series([0] * len(split) + [1, 2], index=df.index)
+
+
+def duplicate_errors(context: BenchmarkContext) -> list[str]:
+    """
+    Describe permits which duplicate detection links or separates wrongly.
+
+    The groups of the permits labelled in the notebook must be found
+    exactly, and no group in the synthetic data may merge permits with
+    different numbers, which are different permits even at one address.
+    """
+    errors = []
+    df, expected = labelled_permits()
+    groups, _ = detect_duplicates(df)
+    found = groups.reindex(df.index).fillna(pd.Series(df.index, index=df.index))
+    for i, j in combinations(df.index, 2):
+        if (expected[i] == expected[j]) != (found[i] == found[j]):
+            action = "separates" if expected[i] == expected[j] else "links"
+            errors.append(
+                f"Duplicate detection {action} labelled permits "
+                f"{df.at[i, 'Permit Number']} and {df.at[j, 'Permit Number']}"
+            )
+    df = context.stage_input("drop_duplicates")
+    groups, _ = detect_duplicates(df)
+    numbers = df.loc[groups.index, "Permit Number"].groupby(groups).nunique()
+    if (merged := int((numbers > 1).sum())) > 0:
+        errors.append(f"{merged} duplicate groups merge permits with different numbers")
+    return errors
+
+
+@app.command()
+def main(
+    rows: list[int] | None = None,
+    seed: int = 0,
+    repeat: int = 3,
+    workers: int = 1,
+    benchmarks: list[str] | None = None,
+    data_dir: Path = BENCHMARK_DATA_DIR,
+    history_path: Path = HISTORY_PATH,
+    trace_memory: bool = True,
+    check_imports: bool = True,
+    check_digests: bool = True,
+    check_duplicates: bool = True,
+):
+    """
+    Benchmark cleaning and profiling on synthetic data of each scale in `rows`.
+
+    The end-to-end pipeline and each of its stages are always timed,
+    followed by `benchmarks`, or all registered benchmarks if not given.
+    Synthetic data is generated once per scale and seed and reused,
+    so runs need no external data. Results are appended to
+    `history_path` and compared with the last comparable run.
+
+    The import time of each entry point is also measured, unless
+    `--no-check-imports` is given, and the run fails if any of them
+    imports a slow dependency eagerly or got slower to import. The run
+    also fails if the code digest of any stage differs between two
+    processes, or if resuming the pipeline from a checkpoint gives
+    a different output on the first scale, unless `--no-check-digests`
+    is given, and if duplicate detection links permits wrongly on the
+    first scale, unless `--no-check-duplicates` is given.
+    """
+    rows = rows or [10_000]
+    benchmarks = benchmarks or list(BENCHMARKS)
+    if unknown := set(benchmarks) - set(BENCHMARKS):
+        raise ValueError(
+            f"Unknown benchmarks {sorted(unknown)}, expected one of {list(BENCHMARKS)}"
+        )
+
+    history = load_history(history_path)
+    imports = {}
+    if check_imports:
+        logger.info("Timing imports of {} entry points", len(ENTRY_POINTS))
+        imports = {module: import_time(module, repeat) for module in ENTRY_POINTS}
+    regressions = []
+    if check_digests:
+        logger.info("Checking that code digests are the same in every process")
+        regressions.extend(unstable_digests())
+    for scale in rows:
+        paths = prepare_data(data_dir, scale, seed)
+        context = BenchmarkContext(
+            paths, scale, workers, paths.permits.parent / "checkpoints"
+        )
+
+        logger.info("Benchmarking cleaning pipeline on {} rows", scale)
+        results = run_pipeline_benchmark(context, repeat)
+        if check_digests and scale == rows[0]:
+            logger.info("Checking that resumed runs give the same output")
+            regressions.extend(resume_differences(context))
+        if check_duplicates and scale == rows[0]:
+            logger.info("Checking that duplicate detection links labelled permits")
+            regressions.extend(duplicate_errors(context))
+        for name in benchmarks:
+            logger.info("Benchmarking {} on {} rows", name, scale)
+            results.append(run_benchmark(name, context, repeat, trace_memory))
+
+        run = {
+            "timestamp": datetime.now(UTC).isoformat(),
+            "commit": git_commit(),
+            "machine": platform.node(),
+            "python": platform.python_version(),
+            "rows": scale,
+            "seed": seed,
+            "workers": workers,
+            "repeat": repeat,
+            "results": [asdict(result) for result in results],
+            "imports": imports,
+        }
+        previous = previous_run(run, history)
+        compare_with_history(run, previous)
+        regressions.extend(import_regressions(run, previous))
+        history.append(run)
+        history_path.parent.mkdir(parents=True, exist_ok=True)
+        with history_path.open("a") as f:
+            f.write(json.dumps(run) + "\n")
+        logger.success("Saved benchmark results to {}", history_path)
+
+    for regression in dict.fromkeys(regressions):
+        logger.error("Regression: {}", regression)
+    if regressions:
+        raise typer.Exit(code=1)
+
+
+if __name__ == "__main__":
+    app()
@@ -1,15 +1,17 @@
-from collections import defaultdict
+from collections.abc import Sequence
+from dataclasses import asdict
+import json
 from pathlib import Path
 from string import punctuation
-import warnings
+import time
+from typing import TYPE_CHECKING
 
-import geopandas as gpd
 import numpy as np
 import pandas as pd
-from tqdm import tqdm
 import typer
 
 from sf_permits.config import (
+    CHECKPOINT_DIR,
     CLEAN_DATASET_PATH,
     NEIGHBOURHOOD_SHAPEFILE_PATH,
     RAW_DATASET_PATH,
@@ -17,11 +19,26 @@ from sf_permits.config import (
     ZIP_CODE_SHAPEFILE_PATH,
     logger,
 )
+from sf_permits.dataset import STRING_DTYPE, load_permits
+from sf_permits.pipeline import Stage, run_pipeline
+from sf_permits.reference import load_reference
+from sf_permits.utils.consistency_rules import Rule, apply_rules
+from sf_permits.utils.functional_dependencies import impute_from_dependency
 from sf_permits.utils.string_similarity import (
+    JaroWinklerIndex,
     get_matching_strings,
     jaccard,
-    jaro_winkler,
+    jaccard_batch,
+    jaro_winkler_batch,
+    jaro_winkler_exceeds,
+    jaro_winkler_exceeds_batch,
 )
+from sf_permits.utils.unique_values import map_unique
+
+# Geometry libraries take long to import, so they are only imported
+# by the stages which match locations
+if TYPE_CHECKING:
+    import geopandas as gpd
 
 app = typer.Typer()
 
@@ -43,150 +60,270 @@ DUPLICATE_IDENTIFIERS = [
     "Unit",
     "Unit Suffix",
 ]
+COORDINATE_COLUMNS = ["latitude", "longitude"]
 PUNCTUATION_REGEX = r"[{}]".format(punctuation)
+NEIGHBOURHOOD_DISTRICT_MIN_CONFIDENCE = 0.5
+DISTRICT_NEIGHBOURHOOD_MIN_CONFIDENCE = 0.9
 STREET_NAME_JACCARD_JARO_SIMILARITY_THRESHOLD = 0.70
 STREET_NAME_DIRECT_JARO_SIMILARITY_THRESHOLD = 0.93
 STREET_NAME_REVERSE_JARO_SIMILARITY_THRESHOLD = 0.89
+# Groups whose statistics fill missing locations, in order, with the
+# columns filled with the mean and the mode of each group
+LOCATION_IMPUTATION_GROUPS = {
+    "block and lot": (
+        ["Block", "Lot"],
+        COORDINATE_COLUMNS,
+        ["Street Name", "Street Suffix", "Supervisor District"],
+    ),
+    "street name": (
+        ["Street Name"],
+        COORDINATE_COLUMNS,
+        ["Street Suffix", "Supervisor District"],
+    ),
+}
+# Each neighbourhood lies mostly within a single district, so we trust
+# the neighbourhood over the recorded district, while districts contain
+# several neighbourhoods, so we only fill missing neighbourhoods of
+# districts which are dominated by one. Each dependency is given as
+# determinant, dependent, minimum confidence and whether to overwrite.
+DISTRICT_DEPENDENCIES = [
+    (
+        "Neighborhood",
+        "Supervisor District",
+        NEIGHBOURHOOD_DISTRICT_MIN_CONFIDENCE,
+        True,
+    ),
+    (
+        "Supervisor District",
+        "Neighborhood",
+        DISTRICT_NEIGHBOURHOOD_MIN_CONFIDENCE,
+        False,
+    ),
+]
+# String columns with at most this many distinct values per non-missing
+# value are stored as categoricals
+CATEGORICAL_MAX_CARDINALITY = 0.05
+# Constraints between permit attributes, applied together once imputation
+# is complete; rows which violate a rule are dropped, unless it names
+# a column to repair by setting it missing
+CONSISTENCY_RULES = [
+    # Some permits are not assigned the "Complete" status yet
+    # are assigned a completion date
+    # We treat these as errors and so assign NA to them
+    Rule(
+        "completion_date_of_incomplete_permit",
+        {"Current Status": ("not in", ["complete"]), "Completed Date": ("present",)},
+        repair="Completed Date",
+    ),
+    Rule(
+        "missing_existing_stories",
+        {"Permit Type": ("in", [3, 4, 5]), "Number of Existing Stories": ("missing",)},
+    ),
+    Rule(
+        "unexpected_existing_stories",
+        {"Permit Type": ("in", [1, 2, 5]), "Number of Existing Stories": ("present",)},
+    ),
+    Rule(
+        "unexpected_existing_use",
+        {"Permit Type": ("in", [1, 2, 3, 4, 5]), "Existing Use": ("present",)},
+    ),
+    Rule(
+        "unexpected_estimated_cost",
+        {"Permit Type": ("in", [6]), "Estimated Cost": ("present",)},
+    ),
+]
 
 
 @app.command()
 def main(
     input_path: Path = RAW_DATASET_PATH,
     output_path: Path = CLEAN_DATASET_PATH,
+    workers: int = 1,
+    checkpoint_dir: Path = CHECKPOINT_DIR,
+    force: list[str] | None = None,
+    skip: list[str] | None = None,
+    profile_stage: str | None = None,
+    count_changes: bool = False,
 ):
+    """
+    Clean the dataset, resuming from the last valid stage checkpoint.
+
+    Stages given with `--force` are rerun along with every later stage,
+    while stages given with `--skip` are not applied. A report on the
+    performance of each stage is saved next to the output, along with
+    the profile of `--profile-stage` if given. With `--count-changes`,
+    the report also counts the cells changed by each stage.
+    """
     logger.info("Starting data cleaning")
+    start = time.perf_counter()
+    clean_df, stage_reports = run_pipeline(
+        cleaning_stages(input_path, workers),
+        checkpoint_dir,
+        force=set(force or []),
+        skip=set(skip or []),
+        profile_stage=profile_stage,
+        profile_path=(
+            output_path.with_name(f"{output_path.stem}.{profile_stage}")
+            if profile_stage is not None
+            else None
+        ),
+        count_changes=count_changes,
+    )
+    logger.success("Data cleaning complete")
+
+    logger.info("Saving clean data")
+    logger.debug("Saving clean data to {}", output_path)
+    clean_df.to_parquet(output_path)
+    logger.success("Saved clean data")
+
+    report_path = output_path.with_suffix(".report.json")
+    logger.debug("Saving run report to {}", report_path)
+    with report_path.open("w") as f:
+        json.dump(
+            {
+                "input_path": str(input_path),
+                "output_path": str(output_path),
+                "workers": workers,
+                "wall_time": time.perf_counter() - start,
+                "stages": [asdict(report) for report in stage_reports],
+            },
+            f,
+            indent=2,
+        )
+
+
+def cleaning_stages(
+    input_path: Path,
+    workers: int = 1,
+    neighbourhood_path: Path = NEIGHBOURHOOD_SHAPEFILE_PATH,
+    zip_code_path: Path = ZIP_CODE_SHAPEFILE_PATH,
+    street_names_path: Path = STREET_NAMES_PATH,
+) -> list[Stage]:
+    location_params = {
+        "neighbourhood_path": neighbourhood_path,
+        "zip_code_path": zip_code_path,
+    }
+    return [
+        Stage("load", load_raw_permits, {"input_path": input_path}),
+        # # Normalisation
+        Stage("normalise", normalise),
+        # # Error correction
+        # ## Using external location-based data
+        Stage("label_locations", label_permit_locations, location_params),
+        # ## Using external street name data
+        Stage(
+            "fix_street_names",
+            fix_street_name_spelling,
+            {"street_names_path": street_names_path},
+            options={"workers": workers},
+        ),
+        # Street names, neighbourhoods and zipcodes are now final except
+        # for imputation, so low-cardinality columns can be stored compactly
+        Stage(
+            "categorise",
+            string_to_categorical,
+            {
+                "max_cardinality": CATEGORICAL_MAX_CARDINALITY,
+                # Boolean columns are converted separately
+                "exclude": MISSING_AS_FALSE_COLUMNS,
+            },
+        ),
+        # # Missing value imputation
+        Stage("impute_locations", impute_locations),
+        # After imputing the location, we are able to use it to correct
+        # and impute `Neighborhood` and `Zipcode` as we did before
+        # so we apply the same function we did for error correction again,
+        # only on permits whose location was imputed
+        Stage(
+            "relabel_locations",
+            relabel_imputed_locations,
+            location_params,
+            requires={"labelled": ("label_locations", COORDINATE_COLUMNS)},
+        ),
+        # ## Exploit approximate functional dependency between `Neighborhood` and `Supervisor District`
+        Stage("fill_districts", fill_district_based_on_neighbourhood),
+        # # Outlier removal
+        # Inconsistent permits are dropped, and incorrect completion dates
+        # are removed, by checking all consistency rules at once
+        Stage("remove_inconsistencies", remove_permits_inconsistencies),
+        # # Duplicate removal
+        Stage("drop_duplicates", drop_duplicate_position_permits),
+    ]
+
+
+def load_raw_permits(input_path: Path) -> pd.DataFrame:
     logger.debug("Loading from {}", input_path)
-    raw_df = pd.read_csv(input_path)
+    raw_df = load_permits(input_path)
     logger.debug("Initial data has shape {}", raw_df.shape)
     # We start by deleting completely empty rows
     clean_df = raw_df.dropna(how="all", axis="index")
     logger.debug("Shape after dropping empty rows is {}", clean_df.shape)
+    return clean_df
 
-    logger.info("Starting normalisation")
-    # # Normalisation
-    clean_df = clean_df.convert_dtypes()
-    clean_df = decode_coordinates(clean_df)
-    clean_df = string_to_lower_case(clean_df)
-    clean_df = rename_columns(clean_df)
-    clean_df = assign_na_to_missing_street_name(clean_df)
-    clean_df = string_to_datetime(clean_df)
 
-    logger.success("Normalisation complete")
-    logger.info("Starting error correction")
-    # # Error correction
+def normalise(df: pd.DataFrame) -> pd.DataFrame:
+    df = decode_coordinates(df)
+    df = string_to_lower_case(df)
+    df = rename_columns(df)
+    df = assign_na_to_missing_street_name(df)
+    df = string_to_datetime(df)
+    return df
 
-    # Some permits are not assigned the "Complete" status yet
-    # are assigned a completion date
-    # We treat these as errors and so assign NA to them
-    clean_df = assign_na_completion_to_incomplete_permit(clean_df)
 
-    # ## Using external location-based data
-    neighbourhood_gdf: gpd.GeoDataFrame = gpd.read_file(NEIGHBOURHOOD_SHAPEFILE_PATH)
-    logger.info("Matching neighbourhood geometries")
-    clean_df = replace_matching_geometry_values(
-        clean_df, "Neighborhood", neighbourhood_gdf
-    )
+def read_location_layers(
+    neighbourhood_path: Path, zip_code_path: Path
+) -> dict[str, "gpd.GeoDataFrame"]:
+    return {
+        "Neighborhood": load_reference(neighbourhood_path, read_layer)["layer"],
+        "Zipcode": load_reference(zip_code_path, read_zip_code_layer)["layer"],
+    }
 
-    logger.info("Matching zipcode geometries")
-    zipcode_gdf: gpd.GeoDataFrame = gpd.read_file(
-        ZIP_CODE_SHAPEFILE_PATH, columns=["zip"]
-    )
-    clean_df = replace_matching_geometry_values(clean_df, "Zipcode", zipcode_gdf)
 
-    # ## Using external street name data
-    logger.info("Matching street names")
-    clean_df = fix_street_name_spelling(clean_df)
+def read_layer(path: Path) -> dict[str, "gpd.GeoDataFrame"]:
+    import geopandas as gpd
 
-    logger.success("Error correction complete")
-    logger.info("Starting missing value imputation")
-    # # Missing value imputation
-    report_missing_value_count(clean_df)
+    return {"layer": gpd.read_file(path)}
 
-    clean_df = string_to_boolean(clean_df)
-    report_missing_value_count(clean_df)
 
-    # ## Fill location using `Block` and `Lot`
-    logger.info("Imputing based on block and lot")
-    clean_df = impute_group(
-        clean_df,
-        ["Block", "Lot"],
-        mean_columns=("latitude", "longitude"),
-        mode_columns=(
-            "Street Name",
-            "Street Suffix",
-            "Supervisor District",
-        ),
-    )
-    report_missing_value_count(clean_df)
-
-    # ## Fill location using `Street Name`
-    logger.info("Imputing based on street name")
-    clean_df = impute_group(
-        clean_df,
-        "Street Name",
-        mean_columns=("latitude", "longitude"),
-        mode_columns=(
-            "Street Suffix",
-            "Supervisor District",
-        ),
-    )
-    report_missing_value_count(clean_df)
-
-    # After imputing the location, we are able to use it to correct
-    # and impute `Neighborhood` and `Zipcode` as we did before
-    # so we apply the same function we did for error correction again
-    logger.info("Reapplying neighbourhood matching")
-    clean_df = replace_matching_geometry_values(
-        clean_df, "Neighborhood", neighbourhood_gdf
-    )
-    logger.info("Reapplying zipcode matching")
-    clean_df = replace_matching_geometry_values(clean_df, "Zipcode", zipcode_gdf)
-    report_missing_value_count(clean_df)
+def read_zip_code_layer(path: Path) -> dict[str, "gpd.GeoDataFrame"]:
+    import geopandas as gpd
 
-    # ## Exploit approximate functional dependency between `Neighborhood` and `Supervisor District`
-    clean_df = fill_district_based_on_neighbourhood(clean_df)
-    report_missing_value_count(clean_df)
+    return {"layer": gpd.read_file(path, columns=["zip"])}
 
-    logger.success("Missing value imputation complete")
-    logger.info("Starting outlier removal")
-    # Outlier removal
-    clean_df = remove_permits_inconsistencies(clean_df)
 
-    logger.success("Outlier removal complete")
-    logger.info("Starting duplicate removal")
-    # Duplicate removal
-    clean_df = drop_duplicate_position_permits(clean_df)
+def label_permit_locations(
+    df: pd.DataFrame, neighbourhood_path: Path, zip_code_path: Path
+) -> pd.DataFrame:
+    logger.info("Matching neighbourhood and zipcode geometries")
+    return label_locations(df, read_location_layers(neighbourhood_path, zip_code_path))
 
-    logger.success("Duplicate removal complete")
 
-    logger.success("Data cleaning complete")
-    logger.info("Saving clean data")
-    logger.debug("Saving clean data to {}", output_path)
-    clean_df.to_parquet(output_path)
-    logger.success("Saved clean data")
+def impute_locations(df: pd.DataFrame) -> pd.DataFrame:
+    df = string_to_boolean(df)
+    for name, (group, mean_columns, mode_columns) in LOCATION_IMPUTATION_GROUPS.items():
+        logger.info("Imputing based on {}", name)
+        df = impute_group(df, group, mean_columns, mode_columns)
+    return df
 
 
-def remove_permits_inconsistencies(df: pd.DataFrame) -> pd.DataFrame:
-    df = df[
-        ~(df["Permit Type"].isin([3, 4, 5]) & df["Number of Existing Stories"].isnull())
-    ]
-    df = df.drop(
-        df[
-            (df["Number of Existing Stories"].notnull())
-            & (df["Permit Type"].isin([1, 2, 5]))
-        ].index
-    )
-    df = df.drop(
-        df[
-            (df["Existing Use"].notnull()) & (df["Permit Type"].isin([1, 2, 5, 3, 4]))
-        ].index
+def relabel_imputed_locations(
+    df: pd.DataFrame,
+    labelled: pd.DataFrame,
+    neighbourhood_path: Path,
+    zip_code_path: Path,
+) -> pd.DataFrame:
+    """Label the locations of permits whose coordinates differ from `labelled`."""
+    logger.info("Reapplying neighbourhood and zipcode matching")
+    df = label_locations(
+        df,
+        read_location_layers(neighbourhood_path, zip_code_path),
+        rows=coordinates_changed(df, labelled),
     )
-    df = df.drop(df[(df["Estimated Cost"].notnull()) & (df["Permit Type"] == 6)].index)
     return df
 
 
-def report_missing_value_count(df: pd.DataFrame) -> None:
-    logger.debug("Missing value count \n{}", df.isna().sum())
+def remove_permits_inconsistencies(df: pd.DataFrame) -> pd.DataFrame:
+    return apply_rules(df, CONSISTENCY_RULES)
 
 
 def string_to_boolean(df: pd.DataFrame) -> pd.DataFrame:
@@ -195,6 +332,48 @@ def string_to_boolean(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
+def string_to_categorical(
+    df: pd.DataFrame,
+    max_cardinality: float = CATEGORICAL_MAX_CARDINALITY,
+    exclude: Sequence[str] = (),
+) -> pd.DataFrame:
+    """
+    Store string columns with few distinct values as categoricals.
+
+    A column is converted if its number of distinct values is at most
+    `max_cardinality` times its number of non-missing values. Categories
+    are kept sorted, so sorting by a column gives the same order
+    as before the conversion.
+    """
+    for column in df.columns.difference(exclude, sort=False):
+        values = df[column]
+        if not (
+            pd.api.types.is_string_dtype(values.dtype)
+            or pd.api.types.is_object_dtype(values.dtype)
+        ):
+            continue
+        distinct_count = values.nunique()
+        if distinct_count > max_cardinality * values.count():
+            continue
+        df[column] = values.astype("category")
+        logger.debug(
+            "Stored {} with {} distinct values as categorical, from {} to {} bytes",
+            column,
+            distinct_count,
+            values.memory_usage(deep=True),
+            df[column].memory_usage(deep=True),
+        )
+    return df
+
+
+def with_categories(values: pd.Series, new_values: pd.Series) -> pd.Series:
+    """Add the values in `new_values` to the categories of `values`, if any."""
+    if not isinstance(values.dtype, pd.CategoricalDtype):
+        return values
+    categories = values.cat.categories.union(new_values.dropna().unique())
+    return values.cat.set_categories(categories.sort_values())
+
+
 def drop_duplicate_position_permits(df: pd.DataFrame) -> pd.DataFrame:
     return df.drop_duplicates(subset=DUPLICATE_IDENTIFIERS)
 
@@ -204,11 +383,6 @@ def assign_na_to_missing_street_name(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def assign_na_completion_to_incomplete_permit(df: pd.DataFrame) -> pd.DataFrame:
-    df.loc[df["Current Status"] != "complete", "Completed Date"] = pd.NA
-    return df
-
-
 def rename_columns(df: pd.DataFrame) -> pd.DataFrame:
     return df.rename(
         columns={
@@ -218,85 +392,163 @@ def rename_columns(df: pd.DataFrame) -> pd.DataFrame:
 
 
 def decode_coordinates(df: pd.DataFrame) -> pd.DataFrame:
-    coordinates = (
-        df["Location"]
-        .str.replace("(", "")
+    coordinates = map_unique(df["Location"], parse_coordinates)
+    df["latitude"] = coordinates[0]
+    df["longitude"] = coordinates[1]
+    return df
+
+
+def parse_coordinates(locations: pd.Series) -> pd.DataFrame:
+    """Split locations written as `(latitude, longitude)` into two columns."""
+    return (
+        locations.str.replace("(", "")
         .str.replace(")", "")
         .str.split(",", expand=True)
+        .reindex(columns=[0, 1])
         .astype("float")
     )
-    df["latitude"] = coordinates[0]
-    df["longitude"] = coordinates[1]
-    return df
 
 
 def fill_district_based_on_neighbourhood(df: pd.DataFrame) -> pd.DataFrame:
-    neighbourhood_district_records = (
-        df[["Neighborhood", "Supervisor District"]]
-        .dropna()
-        .drop_duplicates(
-            "Neighborhood"
-        )  # Keep only a single neighbourhood per district
-        .to_dict("records")
-    )
-    neighbourhood_district_map = {
-        record["Neighborhood"]: record["Supervisor District"]
-        for record in neighbourhood_district_records
-    }
-    for neighbourhood, district in neighbourhood_district_map.items():
-        df.loc[df["Neighborhood"] == neighbourhood, "Supervisor District"] = district
-        df.loc[df["Supervisor District"] == district, "Neighborhood"] = neighbourhood
+    for determinant, dependent, min_confidence, overwrite in DISTRICT_DEPENDENCIES:
+        df = impute_from_dependency(
+            df,
+            determinant,
+            dependent,
+            min_confidence=min_confidence,
+            overwrite=overwrite,
+        )
     return df
 
 
 def street_names_similar(base: str, target: str) -> bool:
-    return (
-        jaccard(base, target, normalise=False) >= 1
-        and jaro_winkler(base, target) > STREET_NAME_JACCARD_JARO_SIMILARITY_THRESHOLD
-    ) or (
-        jaro_winkler(base, target) > STREET_NAME_DIRECT_JARO_SIMILARITY_THRESHOLD
-        and jaro_winkler(base[::-1], target[::-1])
-        > STREET_NAME_REVERSE_JARO_SIMILARITY_THRESHOLD
+    # A shared word lowers the required similarity below the direct threshold,
+    # so the direct comparison cannot change the result in that case
+    if jaccard(base, target, normalise=False) >= 1:
+        return jaro_winkler_exceeds(
+            base, target, STREET_NAME_JACCARD_JARO_SIMILARITY_THRESHOLD
+        )
+    return jaro_winkler_exceeds(
+        base, target, STREET_NAME_DIRECT_JARO_SIMILARITY_THRESHOLD
+    ) and jaro_winkler_exceeds(
+        base[::-1], target[::-1], STREET_NAME_REVERSE_JARO_SIMILARITY_THRESHOLD
+    )
+
+
+def street_names_index(target: pd.Series) -> JaroWinklerIndex:
+    """Index of `target` which never misses a pair `street_names_similar` accepts."""
+    # Names sharing a word are compared with the lowest threshold,
+    # so the index must not prune pairs above it
+    return JaroWinklerIndex(
+        target,
+        min(
+            STREET_NAME_JACCARD_JARO_SIMILARITY_THRESHOLD,
+            STREET_NAME_DIRECT_JARO_SIMILARITY_THRESHOLD,
+        ),
     )
 
 
-def fix_street_name_spelling(df: pd.DataFrame) -> pd.DataFrame:
-    street_names = df["Street Name"].str.replace(PUNCTUATION_REGEX, "", regex=True)
+def street_names_similar_batch(base: str, target: pd.Series) -> np.ndarray:
+    """Vectorised equivalent of `street_names_similar` over many targets."""
+    target_values = target.to_numpy(dtype=object)
+    similar = np.zeros(len(target_values), dtype=bool)
+
+    word_match = jaccard_batch(base, target_values, normalise=False) >= 1
+    similar[word_match] = jaro_winkler_exceeds_batch(
+        base,
+        target_values[word_match],
+        STREET_NAME_JACCARD_JARO_SIMILARITY_THRESHOLD,
+    )
 
-    logger.debug("Loading external street names from {}", STREET_NAMES_PATH)
-    external_street_df = string_to_lower_case(
-        pd.read_csv(STREET_NAMES_PATH).convert_dtypes()
+    (no_word_match,) = np.nonzero(~word_match)
+    direct_match = no_word_match[
+        jaro_winkler_exceeds_batch(
+            base,
+            target_values[no_word_match],
+            STREET_NAME_DIRECT_JARO_SIMILARITY_THRESHOLD,
+        )
+    ]
+    # Only pairs similar in the direct order are compared in reverse
+    similar[direct_match] = jaro_winkler_exceeds_batch(
+        base[::-1],
+        [value[::-1] for value in target_values[direct_match]],
+        STREET_NAME_REVERSE_JARO_SIMILARITY_THRESHOLD,
     )
+    return similar
+
+
+def read_street_names(path: Path) -> dict[str, pd.DataFrame]:
+    """
+    Read the external street names in lower case, and normalised for matching.
+
+    Normalised names have no punctuation, and the name of the street
+    and its direction are concatenated in `StreetNameDirection`.
+    """
+    external_street_df = string_to_lower_case(pd.read_csv(path).convert_dtypes())
     normalised_external_street_df = external_street_df.copy()
     for string_column in normalised_external_street_df.select_dtypes("string"):
-        normalised_external_street_df[string_column] = normalised_external_street_df[
-            string_column
-        ].str.replace(PUNCTUATION_REGEX, "", regex=True)
-    # Python cannot infer the type, so we add the type hint
-    normalised_external_street_df: pd.DataFrame
-
+        normalised_external_street_df[string_column] = map_unique(
+            normalised_external_street_df[string_column], remove_punctuation
+        )
     normalised_external_street_df["StreetNameDirection"] = (
         normalised_external_street_df["StreetName"]
         + " "
         + normalised_external_street_df["PostDirection"].fillna("")
     )
+    return {
+        "external": external_street_df,
+        "normalised": normalised_external_street_df,
+    }
+
+
+def fix_street_name_spelling(
+    df: pd.DataFrame,
+    street_names_path: Path = STREET_NAMES_PATH,
+    workers: int = 1,
+) -> pd.DataFrame:
+    # Many permits share the same spelling, so we normalise and correct
+    # each distinct spelling once and then broadcast the results to all rows
+    street_names = map_unique(df["Street Name"], remove_punctuation)
+    spellings = pd.Series(street_names.dropna().unique(), name="Street Name")
+    logger.debug(
+        "{} distinct street names in {} rows", len(spellings), len(street_names)
+    )
+    correction_df = street_name_corrections(spellings, street_names_path, workers)
+    return apply_street_name_corrections(df, street_names, correction_df)
+
+
+def street_name_corrections(
+    spellings: pd.Series,
+    street_names_path: Path = STREET_NAMES_PATH,
+    workers: int = 1,
+) -> pd.DataFrame:
+    """
+    Match distinct normalised spellings to external street names.
+
+    Returns the `StreetName` and `StreetType` of the external street
+    matched to each spelling, indexed by spelling. Spellings which
+    match no street are left out.
+    """
+    spellings = spellings.reset_index(drop=True).rename("Street Name")
+    logger.debug("Loading external street names from {}", street_names_path)
+    street_tables = load_reference(street_names_path, read_street_names)
+    external_street_df = street_tables["external"]
+    normalised_external_street_df = street_tables["normalised"]
 
     # Match external names with existing ones
     # based on the full street name (name, type and direction)...
     full_name_match_df = normalised_external_street_df.reset_index(
         names="base_index"
-    ).merge(
-        street_names.reset_index(), left_on="FullStreetName", right_on="Street Name"
-    )
+    ).merge(spellings.reset_index(), left_on="FullStreetName", right_on="Street Name")
     # ... only the street name...
     street_name_match_df = normalised_external_street_df.reset_index(
         names="base_index"
-    ).merge(street_names.reset_index(), left_on="StreetName", right_on="Street Name")
+    ).merge(spellings.reset_index(), left_on="StreetName", right_on="Street Name")
     # ... and the street name with direction
     street_name_direction_match_df = normalised_external_street_df.reset_index(
         names="base_index"
     ).merge(
-        street_names.reset_index(),
+        spellings.reset_index(),
         left_on="StreetNameDirection",
         right_on="Street Name",
     )
@@ -308,11 +560,11 @@ def fix_street_name_spelling(df: pd.DataFrame) -> pd.DataFrame:
         ]
     ).unique()
     logger.debug("{} street names match exactly", len(match_indices))
-    non_match_indices = df.index.difference(match_indices)
+    non_match_indices = spellings.index.difference(match_indices)
     logger.debug("{} street names did not match exactly", len(non_match_indices))
     # Streets which are not matched are assumed to be incorrectly spelled
     # so we use string similarity to match them
-    wrong_street_names = street_names.loc[non_match_indices]
+    wrong_street_names = spellings.loc[non_match_indices]
 
     # Dataset street names mix name and direction,
     # so we concatenate them in the external dataset before comparing
@@ -326,129 +578,197 @@ def fix_street_name_spelling(df: pd.DataFrame) -> pd.DataFrame:
     matching_indices, _ = get_matching_strings(
         external_street_names,
         wrong_street_names,
-        street_names_similar,
-        block_length=0,
+        street_names_similar_batch,
+        index=street_names_index(wrong_street_names),
+        vectorised=True,
+        workers=workers,
     )
 
-    for match_df in (
-        full_name_match_df,
-        street_name_direction_match_df,
-        street_name_match_df,
-    ):
-        for base_index, index in match_df[["base_index", "index"]].itertuples(
-            index=False
-        ):
-            try:
-                matching_indices[base_index].append(index)
-            except KeyError:
-                matching_indices[base_index] = [index]
-
-    # We build matches as a map from base index to target index
-    # so we need to reverse it before continuing
-    reversed_matching_indices = defaultdict(list)
-    for base_index, target_indices in matching_indices.items():
-        for target_index in target_indices:
-            reversed_matching_indices[target_index].append(base_index)
-
-    # Each target may be matched to multiple base indices
-    # so we only keep the one with the highest similarity
-    unique_reversed_matching_indices: dict[int, int] = {}
-    for target_index, base_indices in reversed_matching_indices.items():
-        # Skip computing similarity if there is only one base index
-        if len(base_indices) == 1:
-            unique_reversed_matching_indices[target_index] = base_indices[0]
-            continue
-        jaro_similarities = [
-            jaro_winkler(
-                external_street_names.loc[base_index],
-                street_names.loc[target_index],
-            )
-            for base_index in base_indices
-        ]
-        unique_reversed_matching_indices[target_index] = base_indices[
-            np.argmax(jaro_similarities)
-        ]
+    match_df = pd.concat(
+        [
+            pd.DataFrame(
+                [
+                    (base_index, index)
+                    for base_index, indices in matching_indices.items()
+                    for index in indices
+                ],
+                columns=["base_index", "index"],
+            ),
+            full_name_match_df[["base_index", "index"]],
+            street_name_direction_match_df[["base_index", "index"]],
+            street_name_match_df[["base_index", "index"]],
+        ],
+        ignore_index=True,
+    )
 
-    final_match_df = (
-        pd.Series(unique_reversed_matching_indices, name="base_index")
-        .reset_index()
-        .rename(columns={"index": "target_index"})
+    # Each spelling may be matched to multiple base indices
+    # so we only keep the one with the highest similarity,
+    # breaking ties in favour of the base index matched first
+    match_df["similarity"] = jaro_winkler_batch(
+        external_street_names.loc[match_df["base_index"]].to_numpy(dtype=object),
+        spellings.loc[match_df["index"]].to_numpy(dtype=object),
     )
+    base_order = pd.Series(
+        np.arange(match_df["base_index"].nunique()),
+        index=match_df["base_index"].unique(),
+    )
+    match_df["base_order"] = match_df["base_index"].map(base_order)
+    final_match_df = match_df.sort_values(
+        ["index", "similarity", "base_order"], ascending=[True, False, True]
+    ).drop_duplicates("index")
 
     # Once we have all the matches, we replace the values of
     # `Street Name` and `Street Type` with those from the
     # external dataset
-    clean_street_df = final_match_df.join(
+    correction_df = final_match_df.join(
         external_street_df[["StreetName", "StreetType"]], on="base_index"
-    ).join(df, on="target_index", how="right")
-    clean_street_df["Street Name"] = clean_street_df["StreetName"].combine_first(
-        clean_street_df["Street Name"]
-    )
-    clean_street_df["Street Suffix"] = clean_street_df["StreetType"].combine_first(
-        clean_street_df["Street Suffix"]
-    )
-    clean_street_df = clean_street_df.drop(columns=["StreetName", "StreetType"])
+    ).set_index(spellings.loc[final_match_df["index"]].to_numpy())
+    logger.debug("Corrections for {} distinct street names", len(correction_df))
+    return correction_df[["StreetName", "StreetType"]]
+
+
+def apply_street_name_corrections(
+    df: pd.DataFrame, street_names: pd.Series, correction_df: pd.DataFrame
+) -> pd.DataFrame:
+    """Replace street names and suffixes whose normalised spelling was corrected."""
+    for column, external_column in (
+        ("Street Name", "StreetName"),
+        ("Street Suffix", "StreetType"),
+    ):
+        df[column] = (
+            map_unique(
+                street_names, lambda v, c=external_column: v.map(correction_df[c])
+            )
+            .combine_first(df[column])
+            .astype(df[column].dtype)
+        )
 
-    return clean_street_df
+    return df
 
 
-def replace_matching_geometry_values(
-    df: pd.DataFrame, column: str, base: gpd.GeoDataFrame
+def label_locations(
+    df: pd.DataFrame,
+    layers: dict[str, "gpd.GeoDataFrame"],
+    rows: pd.Series | None = None,
 ) -> pd.DataFrame:
-    geometry = gpd.GeoSeries.from_xy(df["longitude"], df["latitude"])
-    with warnings.catch_warnings():
-        warnings.filterwarnings("ignore", category=pd.errors.PerformanceWarning)
-        match_df = match(base, geometry)
-    df[column] = match_df.iloc[:, 0].combine_first(df[column]).str.lower()
+    """
+    Replace location columns with the regions which contain each permit.
+
+    `layers` maps each column to the layer of regions whose labels
+    it should hold. Point geometry is built once and matched
+    against all layers. If `rows` is given, only the permits
+    for which it is true are relabelled.
+    """
+    import geopandas as gpd
+
+    located_df = df if rows is None else df[rows]
+    logger.debug("Labelling {} permit locations", len(located_df))
+    geometry = gpd.GeoSeries.from_xy(located_df["longitude"], located_df["latitude"])
+    for column, base in layers.items():
+        # Labels are Arrow strings like other text, which also keeps
+        # their missing values the same after a checkpoint is read back
+        labels = (
+            match(base, geometry)
+            .combine_first(located_df[column])
+            .str.lower()
+            .astype(STRING_DTYPE)
+        )
+        if rows is None:
+            df[column] = labels
+        else:
+            df[column] = with_categories(df[column], labels)
+            df.loc[labels.index, column] = labels
     return df
 
 
-def match(base: gpd.GeoDataFrame, target: gpd.GeoSeries) -> pd.DataFrame:
+def coordinates_changed(df: pd.DataFrame, previous: pd.DataFrame) -> pd.Series:
+    """Whether the coordinates of each permit differ from those in `previous`."""
+    current = df[COORDINATE_COLUMNS]
+    previous = previous.reindex(index=current.index, columns=COORDINATE_COLUMNS)
+    changed = current.ne(previous) & ~(current.isna() & previous.isna())
+    return changed.any(axis="columns")
+
+
+def match(base: "gpd.GeoDataFrame", target: "gpd.GeoSeries") -> pd.Series:
     """
     Match points in target geometry to regions in base geometry.
 
     Assumes that `base` contains a single column (other than the geometry)
     specifying a label which should be associated with each point
     in `target`.
+
+    All points are matched with a single query to the spatial index
+    of `base`. Points on the boundary of a region are considered part
+    of it, and points covered by several regions, such as those on
+    a shared boundary, take the label of the first of them in `base`.
+    Points outside all regions are labelled NA.
     """
-    match_df = pd.DataFrame(index=target.index)
-    for id_, geometry in tqdm(
-        base.itertuples(index=False), total=base.shape[0], desc="Geometry"
-    ):
-        match_df[id_] = target.within(geometry)
-    return pd.from_dummies(match_df, default_category=pd.NA)
+    label_column = base.columns.drop(base.geometry.name)[0]
+    target_positions, base_positions = base.sindex.query(
+        target.values, predicate="covered_by"
+    )
+    # Sort by point and then region so the first entry of each point
+    # is the first region in `base` which covers it
+    order = np.lexsort((base_positions, target_positions))
+    target_positions = target_positions[order]
+    base_positions = base_positions[order]
+    first = np.ones(len(target_positions), dtype=bool)
+    first[1:] = target_positions[1:] != target_positions[:-1]
+
+    labels = np.full(len(target), pd.NA, dtype=object)
+    labels[target_positions[first]] = base[label_column].to_numpy()[
+        base_positions[first]
+    ]
+    return pd.Series(labels, index=target.index)
 
 
 def impute_group(
     df: pd.DataFrame,
     group: str | list[str],
-    mean_columns: list[str] = [],
-    mode_columns: list[str] = [],
-) -> pd.DataFrame:
-    if isinstance(group, list):
-        na_mask = df[group].isna().any(axis="columns")
-    else:
-        na_mask = df[group].isna()
-    group_df_list = [df[na_mask]]
-    for _, group_df in tqdm(df.groupby(group), desc="Group"):
-        group_df_list.append(impute(group_df, mean_columns, mode_columns))
-    group_df = pd.concat(group_df_list)
-    return group_df
-
-
-def impute(
-    df: pd.DataFrame, mean_columns: list[str] = [], mode_columns: list[str] = []
+    mean_columns: Sequence[str] = (),
+    mode_columns: Sequence[str] = (),
 ) -> pd.DataFrame:
-    imputed_df = df.copy()
+    """
+    Fill missing values with statistics of the group of each row.
+
+    Columns in `mean_columns` are filled with the mean of the group and
+    those in `mode_columns` with its most frequent value, preferring
+    the smallest value on ties as `Series.mode` does. Rows with missing
+    group keys are not imputed, and row order and index are preserved.
+
+    >>> df = pd.DataFrame(
+    ...     {
+    ...         "group": [1, 1, 1, 2, None],
+    ...         "mean": [None, 1.0, 3.0, None, None],
+    ...         "mode": ["b", "a", None, None, None],
+    ...     }
+    ... )
+    >>> impute_group(df, "group", mean_columns=["mean"], mode_columns=["mode"])
+       group  mean mode
+    0    1.0   2.0    b
+    1    1.0   1.0    a
+    2    1.0   3.0    a
+    3    2.0   NaN  NaN
+    4    NaN   NaN  NaN
+    """
+    grouped = df.groupby(group, sort=False, dropna=True, observed=True)
+    group_ids = grouped.ngroup()
     for column in mean_columns:
-        imputed_df.loc[:, column] = imputed_df[column].fillna(
-            imputed_df[column].mean(skipna=True)
-        )
+        df[column] = df[column].fillna(grouped[column].transform("mean"))
     for column in mode_columns:
-        imputed_df.loc[:, column] = imputed_df[column].fillna(
-            imputed_df[column].mode(dropna=True)
-        )
-    return imputed_df
+        df[column] = df[column].fillna(group_ids.map(group_mode(df[column], group_ids)))
+    return df
+
+
+def group_mode(values: pd.Series, group_ids: pd.Series) -> pd.Series:
+    """Most frequent non-missing value of each group, indexed by group ID."""
+    counts = (
+        pd.DataFrame({"group": group_ids, "value": values})
+        .value_counts(dropna=True)
+        .reset_index(name="count")
+        .sort_values(["group", "count", "value"], ascending=[True, False, True])
+    )
+    return counts.drop_duplicates("group").set_index("group")["value"]
 
 
 def string_to_datetime(
@@ -456,20 +776,32 @@ def string_to_datetime(
     like: str = "Date",
     format: str = r"%m/%d/%Y",
 ) -> pd.DataFrame:
-    date_df = df.filter(like=like)
-    logger.debug("Identified date columns: {}", date_df.columns)
-    date_df = date_df.apply(pd.to_datetime, errors="raise", format=format)
-    for date_column in date_df:
-        df[date_column] = date_df[date_column]
+    # Dates parsed when loading are left as they are
+    date_columns = [
+        column
+        for column in df.filter(like=like).columns
+        if not pd.api.types.is_datetime64_any_dtype(df[column].dtype)
+    ]
+    logger.debug("Identified date columns to parse: {}", date_columns)
+    # Permits share few distinct dates, so each is parsed only once
+    for date_column in date_columns:
+        df[date_column] = map_unique(
+            df[date_column],
+            lambda dates: pd.to_datetime(dates, errors="raise", format=format),
+        )
     logger.success("Date columns converted to datetime")
     return df
 
 
 def string_to_lower_case(df: pd.DataFrame) -> pd.DataFrame:
     for string_column in df.select_dtypes("string"):
-        df[string_column] = df[string_column].str.lower()
+        df[string_column] = map_unique(df[string_column], lambda v: v.str.lower())
     return df
 
 
+def remove_punctuation(values: pd.Series) -> pd.Series:
+    return values.str.replace(PUNCTUATION_REGEX, "", regex=True)
+
+
 if __name__ == "__main__":
     app()
@@ -1,14 +1,9 @@
+from functools import cache
 from pathlib import Path
-
-from dotenv import load_dotenv
-from loguru import logger
-
-# Load environment variables from .env file if it exists
-load_dotenv()
+from typing import Any
 
 # Paths
 PROJ_ROOT = Path(__file__).resolve().parents[1]
-logger.info(f"PROJ_ROOT path is: {PROJ_ROOT}")
 
 DATA_DIR = PROJ_ROOT / "data"
 RAW_DATA_DIR = DATA_DIR / "raw"
@@ -30,15 +25,55 @@ STREET_NAMES_PATH = EXTERNAL_DATA_DIR / "street-names.csv"
 RAW_DATASET_FILENAME = "building_permits.csv"
 RAW_DATASET_PATH = RAW_DATA_DIR / RAW_DATASET_FILENAME
 CLEAN_DATASET_PATH = CLEAN_DATA_DIR / "dataset.parquet"
+DUPLICATES_PATH = CLEAN_DATA_DIR / "duplicates.parquet"
 INTERIM_DATASET_PATH = INTERIM_DATA_DIR / "dataset.parquet"
+CHECKPOINT_DIR = INTERIM_DATA_DIR / "checkpoints"
+REFERENCE_CACHE_DIR = INTERIM_DATA_DIR / "reference"
+INCREMENTAL_STATE_DIR = INTERIM_DATA_DIR / "incremental"
+PARTITION_DIR = INTERIM_DATA_DIR / "partitions"
+BENCHMARK_DATA_DIR = DATA_DIR / "benchmark"
+
+
+@cache
+def setup():
+    """
+    Load environment variables and configure loguru, once per process.
+
+    This runs the first time `logger` is used rather than on import,
+    so entry points and worker processes which never log do not pay
+    for it, and importing the package has no side effects.
+    """
+    from dotenv import load_dotenv
+    from loguru import logger
+
+    # Load environment variables from .env file if it exists
+    load_dotenv()
+
+    # If tqdm is installed, configure loguru with tqdm.write
+    # https://github.com/Delgan/loguru/issues/135
+    try:
+        from tqdm import tqdm
+    except ModuleNotFoundError:
+        pass
+    else:
+        # Handlers configured before first use, which may have removed
+        # the default one, are left as they are
+        try:
+            logger.remove(0)
+        except ValueError:
+            pass
+        else:
+            logger.add(lambda msg: tqdm.write(msg, end=""), colorize=True)
+
+    logger.info(f"PROJ_ROOT path is: {PROJ_ROOT}")
+    return logger
+
+
+class _Logger:
+    """Loguru's logger, set up on first use."""
 
+    def __getattr__(self, name: str) -> Any:
+        return getattr(setup(), name)
 
-# If tqdm is installed, configure loguru with tqdm.write
-# https://github.com/Delgan/loguru/issues/135
-try:
-    from tqdm import tqdm
 
-    logger.remove(0)
-    logger.add(lambda msg: tqdm.write(msg, end=""), colorize=True)
-except ModuleNotFoundError:
-    pass
+logger = _Logger()
@@ -0,0 +1,258 @@
+from collections.abc import Iterator
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+from pyarrow import csv
+from pyarrow import parquet as pq
+
+from sf_permits.config import RAW_DATASET_PATH, logger
+
+DATE_FORMAT = r"%m/%d/%Y"
+DATE_DTYPE = "datetime64[ns]"
+STRING_DTYPE = "string[pyarrow]"
+DEFAULT_BLOCK_SIZE = 64 * 2**20
+# Types in which the pipeline expects each column of `building_permits.csv`.
+# Block and Lot are identifiers, so they are kept as strings with their
+# leading zeros rather than parsed as numbers. Other columns have the types
+# `convert_dtypes` infers on the full dataset: Existing Units and the stories
+# are Float64 since some of their values are fractional, while every value
+# of Proposed Units is whole.
+PERMIT_DTYPES: dict[str, str] = {
+    "Permit Number": STRING_DTYPE,
+    "Permit Type": "Int64",
+    "Permit Type Definition": STRING_DTYPE,
+    "Permit Creation Date": DATE_DTYPE,
+    "Block": STRING_DTYPE,
+    "Lot": STRING_DTYPE,
+    "Street Number": "Int64",
+    "Street Number Suffix": STRING_DTYPE,
+    "Street Name": STRING_DTYPE,
+    "Street Suffix": STRING_DTYPE,
+    "Unit": "Int64",
+    "Unit Suffix": STRING_DTYPE,
+    "Description": STRING_DTYPE,
+    "Current Status": STRING_DTYPE,
+    "Current Status Date": DATE_DTYPE,
+    "Filed Date": DATE_DTYPE,
+    "Issued Date": DATE_DTYPE,
+    "Completed Date": DATE_DTYPE,
+    "First Construction Document Date": DATE_DTYPE,
+    "Structural Notification": STRING_DTYPE,
+    "Number of Existing Stories": "Float64",
+    "Number of Proposed Stories": "Float64",
+    "Voluntary Soft-Story Retrofit": STRING_DTYPE,
+    "Fire Only Permit": STRING_DTYPE,
+    "Permit Expiration Date": DATE_DTYPE,
+    "Estimated Cost": "Float64",
+    "Revised Cost": "Float64",
+    "Existing Use": STRING_DTYPE,
+    "Existing Units": "Float64",
+    "Proposed Use": STRING_DTYPE,
+    "Proposed Units": "Int64",
+    "Plansets": "Int64",
+    "TIDF Compliance": STRING_DTYPE,
+    "Existing Construction Type": "Int64",
+    "Existing Construction Type Description": STRING_DTYPE,
+    "Proposed Construction Type": "Int64",
+    "Proposed Construction Type Description": STRING_DTYPE,
+    "Site Permit": STRING_DTYPE,
+    "Supervisor District": "Int64",
+    "Neighborhoods - Analysis Boundaries": STRING_DTYPE,
+    "Zipcode": "Int64",
+    "Location": STRING_DTYPE,
+    "Record ID": "Int64",
+}
+# Integers are parsed as floats, since some are written with decimals,
+# and checked when casting to the nullable integer type
+_ARROW_TYPES = {
+    STRING_DTYPE: pa.string(),
+    "Int64": pa.float64(),
+    "Float64": pa.float64(),
+    DATE_DTYPE: pa.timestamp("s"),
+}
+_PANDAS_TYPES = {
+    pa.string(): pd.StringDtype("pyarrow"),
+    pa.float64(): pd.Float64Dtype(),
+}
+# Arrow strings are kept in Arrow memory when converting back to pandas,
+# while other types are restored from the pandas metadata in the schema
+_ARROW_STRING_TYPES = {
+    pa.string(): pd.StringDtype("pyarrow"),
+    pa.large_string(): pd.StringDtype("pyarrow"),
+}
+
+
+def _permit_dtypes(
+    columns: list[str] | None,
+    parse_dates: bool,
+    schema: dict[str, str] | None = None,
+) -> dict[str, str]:
+    schema = PERMIT_DTYPES if schema is None else schema
+    dtypes = {
+        column: schema[column] for column in (schema if columns is None else columns)
+    }
+    if not parse_dates:
+        dtypes = {
+            column: STRING_DTYPE if dtype == DATE_DTYPE else dtype
+            for column, dtype in dtypes.items()
+        }
+    return dtypes
+
+
+def _convert_options(dtypes: dict[str, str]) -> csv.ConvertOptions:
+    return csv.ConvertOptions(
+        column_types={column: _ARROW_TYPES[dtype] for column, dtype in dtypes.items()},
+        include_columns=list(dtypes),
+        timestamp_parsers=[DATE_FORMAT],
+        strings_can_be_null=True,
+    )
+
+
+def load_permits(
+    path: Path = RAW_DATASET_PATH,
+    columns: list[str] | None = None,
+    parse_dates: bool = True,
+    schema: dict[str, str] | None = None,
+) -> pd.DataFrame:
+    """
+    Load the permits dataset with the types in `schema` or `PERMIT_DTYPES`.
+
+    The file is parsed by the multithreaded Arrow CSV reader,
+    only reading `columns` if given, and strings are kept in
+    Arrow memory. If not `parse_dates`, dates are loaded as strings.
+    """
+    dtypes = _permit_dtypes(columns, parse_dates, schema)
+    logger.debug("Loading {} columns from {}", len(dtypes), path)
+    table = csv.read_csv(
+        path,
+        read_options=csv.ReadOptions(use_threads=True),
+        convert_options=_convert_options(dtypes),
+    )
+    df = table.to_pandas(types_mapper=_PANDAS_TYPES.get).astype(dtypes)
+    logger.debug("Loaded data with shape {}", df.shape)
+    return df
+
+
+def iter_permits(
+    path: Path = RAW_DATASET_PATH,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    columns: list[str] | None = None,
+    parse_dates: bool = True,
+    schema: dict[str, str] | None = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Stream the permits dataset in chunks of about `block_size` bytes.
+
+    Chunks have the same types as the output of `load_permits`,
+    but only one of them is kept in memory at a time.
+    """
+    dtypes = _permit_dtypes(columns, parse_dates, schema)
+    logger.debug("Streaming {} columns from {}", len(dtypes), path)
+    reader = csv.open_csv(
+        path,
+        read_options=csv.ReadOptions(use_threads=True, block_size=block_size),
+        convert_options=_convert_options(dtypes),
+    )
+    for batch in reader:
+        yield batch.to_pandas(types_mapper=_PANDAS_TYPES.get).astype(dtypes)
+
+
+def infer_permit_dtypes(
+    path: Path = RAW_DATASET_PATH, block_size: int = DEFAULT_BLOCK_SIZE
+) -> dict[str, str]:
+    """
+    Infer the type of each column of the raw file from all of its values.
+
+    Columns whose values are all integers are Int64, other numeric
+    columns are Float64 and the rest are strings as written, dates
+    included. The file is streamed as strings, so unlike Arrow's own
+    inference, which only looks at the first block, a value far into
+    the file can still make a column less specific.
+    """
+    logger.debug("Inferring column types of {}", path)
+    reader = csv.open_csv(
+        path,
+        read_options=csv.ReadOptions(use_threads=True, block_size=block_size),
+        convert_options=csv.ConvertOptions(
+            column_types={name: pa.string() for name in PERMIT_DTYPES},
+            strings_can_be_null=True,
+        ),
+    )
+    candidates = ["Int64", "Float64", STRING_DTYPE]
+    dtypes = {}
+    for batch in reader:
+        for name, values in zip(batch.schema.names, batch.columns):
+            dtype = dtypes.setdefault(name, candidates[0])
+            while dtype != STRING_DTYPE and not _casts(values, dtype):
+                dtype = candidates[candidates.index(dtype) + 1]
+            dtypes[name] = dtype
+    return dtypes
+
+
+def _casts(values: pa.Array, dtype: str) -> bool:
+    target = pa.int64() if dtype == "Int64" else pa.float64()
+    try:
+        values.cast(target)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        return False
+    return True
+
+
+def to_arrow_buffer(df: pd.DataFrame) -> pa.Buffer:
+    """
+    Serialise `df` to an Arrow IPC stream.
+
+    Buffers are much cheaper to send to worker processes than
+    pickled DataFrames; the index is not kept.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def from_arrow_buffer(buffer: pa.Buffer) -> pd.DataFrame:
+    """Deserialise a DataFrame written by `to_arrow_buffer`."""
+    return _to_pandas(pa.ipc.open_stream(buffer).read_all())
+
+
+def _to_pandas(table: pa.Table) -> pd.DataFrame:
+    df = table.to_pandas(types_mapper=_ARROW_STRING_TYPES.get)
+    # Dictionaries of strings come back as categoricals of Python strings,
+    # while the pipeline only builds categoricals of Arrow strings
+    for name in table.column_names:
+        arrow_type = table.schema.field(name).type
+        if pa.types.is_dictionary(arrow_type) and arrow_type.value_type in (
+            _ARROW_STRING_TYPES
+        ):
+            values = df[name].array
+            df[name] = pd.Categorical.from_codes(
+                values.codes,
+                dtype=pd.CategoricalDtype(
+                    values.categories.astype(STRING_DTYPE), values.ordered
+                ),
+            )
+    return df
+
+
+def read_parquet(path: Path, columns: list[str] | None = None) -> pd.DataFrame:
+    """
+    Read a Parquet file written by pandas, keeping its types.
+
+    Strings are kept in Arrow memory as in `load_permits`, unless
+    they were written from a column of Python objects.
+    """
+    table = pq.read_table(path, columns=columns)
+    object_columns = [
+        column["name"]
+        for column in table.schema.pandas_metadata["columns"]
+        if column["numpy_type"] == "object" and column["name"] in table.column_names
+    ]
+    df = _to_pandas(table)
+    if object_columns:
+        objects = table.select(object_columns).to_pandas()
+        for column in object_columns:
+            df[column] = objects[column].to_numpy()
+    return df
@@ -0,0 +1,291 @@
+from collections.abc import Callable
+from dataclasses import asdict, dataclass, field
+import json
+from pathlib import Path
+import time
+
+import numpy as np
+import pandas as pd
+import typer
+
+from sf_permits.cleaning import PUNCTUATION_REGEX
+from sf_permits.config import CLEAN_DATASET_PATH, DUPLICATES_PATH, logger
+from sf_permits.utils.record_linkage import (
+    block_pairs,
+    connected_components,
+    unique_pairs,
+)
+from sf_permits.utils.string_similarity import jaro_winkler_batch
+from sf_permits.utils.unique_values import map_unique
+
+app = typer.Typer()
+
+# Blocks with more rows are placeholders, such as a number shared
+# by a batch of permits, and would dominate the number of candidate pairs
+MAX_BLOCK_SIZE = 50
+# Pairs are scored in batches to bound the memory of vectorised similarities
+SCORING_BATCH_SIZE = 200_000
+# Permit numbers are a date followed by a serial, so numbers which differ
+# by a single digit are usually different permits filed on the same day;
+# duplicates must share their number exactly
+PERMIT_NUMBER_COLUMN = "Permit Number"
+# Different permits are often filed at one address, so duplicates
+# must also agree on at least one column other than their address
+AGREEMENT_COLUMNS = ["Description", "Filed Date"]
+# Weight of each address column in the similarity of a pair
+COMPARISON_WEIGHTS = {
+    "Street Name": 2.0,
+    "Street Number": 1.0,
+    "Street Number Suffix": 0.5,
+    "Street Suffix": 0.5,
+    "Unit": 1.0,
+    "Unit Suffix": 0.5,
+}
+# Columns compared with Jaro-Winkler similarity, rather than for equality
+FUZZY_COLUMNS = ["Street Name"]
+# Similarity of a pair in which only one of the values is missing
+MISSING_SIMILARITY = 0.5
+# Rows of a permit split across lots in the notebook have equal
+# addresses, and the threshold still links variants missing one of
+# the unit, unit suffix or street suffix, which score 0.91 at worst
+MATCH_THRESHOLD = 0.9
+
+
+@dataclass
+class LinkageReport:
+    """
+    Size and speed of each step of duplicate detection.
+
+    The reduction ratio is the fraction of all pairs of rows which
+    were never compared, thanks to blocking. Times are in seconds and
+    throughput is in rows and candidate pairs per second overall.
+    """
+
+    rows: int
+    candidate_pairs: int
+    reduction_ratio: float
+    matched_pairs: int
+    duplicate_groups: int
+    duplicate_rows: int
+    blocking_time: float
+    scoring_time: float
+    clustering_time: float
+    rows_per_second: float
+    pairs_per_second: float
+    pairs_by_method: dict[str, int] = field(default_factory=dict)
+
+
+def blocking_methods(
+    max_block_size: int = MAX_BLOCK_SIZE,
+) -> dict[str, Callable[[pd.DataFrame], np.ndarray]]:
+    """
+    Ways of generating candidate pairs, each in near-linear time.
+
+    Only permits with the same number can be linked,
+    so they are the only ones blocked together.
+    """
+    return {
+        "permit number": lambda df: block_pairs(
+            normalise_text(df[PERMIT_NUMBER_COLUMN]), max_block_size
+        ),
+    }
+
+
+def detect_duplicates(
+    df: pd.DataFrame,
+    threshold: float = MATCH_THRESHOLD,
+    max_block_size: int = MAX_BLOCK_SIZE,
+) -> tuple[pd.Series, LinkageReport]:
+    """
+    Group permits which are likely to describe the same record.
+
+    Candidate pairs are generated by blocking, scored by the weighted
+    similarity of their addresses and linked if the score reaches
+    `threshold`, the permit numbers are equal and they agree on one of
+    `AGREEMENT_COLUMNS`. Linked rows form groups through transitive closure.
+
+    Rows without a permit number are never paired.
+
+    Returns the group of each row in a group of at least two rows,
+    labelled by the index of its first row, and a report on the run.
+    """
+    start = time.perf_counter()
+    pairs_by_method = {}
+    for name, method in blocking_methods(max_block_size).items():
+        pairs_by_method[name] = method(df)
+        logger.debug("{} candidate pairs by {}", len(pairs_by_method[name]), name)
+    pairs = unique_pairs(list(pairs_by_method.values()), len(df))
+    all_pairs = len(df) * (len(df) - 1) // 2
+    logger.info(
+        "{} candidate pairs out of {} ({:.4%})",
+        len(pairs),
+        all_pairs,
+        len(pairs) / all_pairs if all_pairs else 0,
+    )
+    blocked = time.perf_counter()
+
+    scores = score_pairs(df, pairs)
+    matches = pairs[(scores >= threshold) & linkable(df, pairs)]
+    logger.info(
+        "{} pairs match with similarity of at least {}", len(matches), threshold
+    )
+    scored = time.perf_counter()
+
+    labels = connected_components(matches, len(df))
+    group_sizes = np.bincount(labels, minlength=len(df))
+    in_group = group_sizes[labels] > 1
+    groups = pd.Series(df.index[labels[in_group]], index=df.index[in_group])
+    groups.name = "Duplicate Group"
+    end = time.perf_counter()
+
+    report = LinkageReport(
+        rows=len(df),
+        candidate_pairs=len(pairs),
+        reduction_ratio=1 - len(pairs) / all_pairs if all_pairs else 0.0,
+        matched_pairs=len(matches),
+        duplicate_groups=int((group_sizes > 1).sum()),
+        duplicate_rows=len(groups),
+        blocking_time=blocked - start,
+        scoring_time=scored - blocked,
+        clustering_time=end - scored,
+        rows_per_second=len(df) / (end - start),
+        pairs_per_second=len(pairs) / (end - start),
+        pairs_by_method={name: len(pairs) for name, pairs in pairs_by_method.items()},
+    )
+    logger.info(
+        "Found {} duplicate rows in {} groups at {:.0f} rows/s",
+        report.duplicate_rows,
+        report.duplicate_groups,
+        report.rows_per_second,
+    )
+    return groups, report
+
+
+def score_pairs(
+    df: pd.DataFrame, pairs: np.ndarray, batch_size: int = SCORING_BATCH_SIZE
+) -> np.ndarray:
+    """Weighted mean similarity of the address of each pair of rows."""
+    scores = np.zeros(len(pairs))
+    # Values are compared through their codes, so each distinct pair
+    # of values is scored once however many pairs of rows share it
+    columns = {
+        column: pd.factorize(normalise_text(df[column]))
+        for column in COMPARISON_WEIGHTS
+    }
+    for batch_start in range(0, len(pairs), batch_size):
+        batch = pairs[batch_start : batch_start + batch_size]
+        for column, (codes, uniques) in columns.items():
+            similarity = compare(
+                codes[batch[:, 0]],
+                codes[batch[:, 1]],
+                np.asarray(uniques, dtype=object) if column in FUZZY_COLUMNS else None,
+            )
+            scores[batch_start : batch_start + len(batch)] += (
+                COMPARISON_WEIGHTS[column] * similarity
+            )
+    return scores / sum(COMPARISON_WEIGHTS.values())
+
+
+def linkable(df: pd.DataFrame, pairs: np.ndarray) -> np.ndarray:
+    """
+    Whether each pair of rows may be linked regardless of its address.
+
+    Rows must have the same permit number and the same value
+    in at least one of `AGREEMENT_COLUMNS`, missing values never agreeing.
+    """
+
+    def equal(column: str) -> np.ndarray:
+        codes, _ = pd.factorize(normalise_text(df[column]))
+        left, right = codes[pairs[:, 0]], codes[pairs[:, 1]]
+        return (left >= 0) & (left == right)
+
+    agree = np.zeros(len(pairs), dtype=bool)
+    for column in AGREEMENT_COLUMNS:
+        agree |= equal(column)
+    return equal(PERMIT_NUMBER_COLUMN) & agree
+
+
+def compare(
+    left: np.ndarray, right: np.ndarray, uniques: np.ndarray | None = None
+) -> np.ndarray:
+    """
+    Similarity of aligned value codes, negative for missing values.
+
+    Values are compared for equality, or with Jaro-Winkler similarity
+    if the `uniques` the codes refer to are given. Two missing values
+    are equal, while a single missing value gets `MISSING_SIMILARITY`,
+    since variants often omit suffixes or units.
+    """
+    left_missing = left < 0
+    right_missing = right < 0
+    present = ~left_missing & ~right_missing
+    similarity = np.where(left_missing & right_missing, 1.0, MISSING_SIMILARITY)
+    if uniques is None:
+        similarity[present] = left[present] == right[present]
+        return similarity
+    inverse, value_pairs = pd.factorize(left[present] * len(uniques) + right[present])
+    similarity[present] = jaro_winkler_batch(
+        uniques[value_pairs // len(uniques)], uniques[value_pairs % len(uniques)]
+    )[inverse]
+    return similarity
+
+
+def normalise_text(values: pd.Series) -> pd.Series:
+    """Values as lower case strings without punctuation or whitespace."""
+    return map_unique(
+        values.astype("string"),
+        lambda v: (
+            v.str.lower()
+            .str.replace(PUNCTUATION_REGEX, "", regex=True)
+            .str.replace(r"\s+", "", regex=True)
+        ),
+    ).replace("", pd.NA)
+
+
+def drop_near_duplicates(df: pd.DataFrame, groups: pd.Series) -> pd.DataFrame:
+    """Keep only the first row of each group of duplicates."""
+    return df.drop(groups.index[groups.index != groups])
+
+
+@app.command()
+def main(
+    input_path: Path = CLEAN_DATASET_PATH,
+    output_path: Path = DUPLICATES_PATH,
+    threshold: float = MATCH_THRESHOLD,
+    max_block_size: int = MAX_BLOCK_SIZE,
+    deduplicated_path: Path | None = None,
+):
+    """
+    Detect near-duplicate permits in the clean dataset.
+
+    The identifiers of each row in a group of duplicates are saved to
+    `output_path`, along with its group, for review. A report on the
+    number of pairs compared and the speed of each step is saved next
+    to it. If `deduplicated_path` is given, the dataset with only the
+    first row of each group is saved there as well.
+    """
+    logger.info("Loading clean data from {}", input_path)
+    df = pd.read_parquet(input_path)
+    groups, report = detect_duplicates(df, threshold, max_block_size)
+
+    logger.debug("Saving duplicate groups to {}", output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    identifiers = [PERMIT_NUMBER_COLUMN, *COMPARISON_WEIGHTS, *AGREEMENT_COLUMNS]
+    df.loc[groups.index, identifiers].join(groups).sort_values(
+        [groups.name, *identifiers]
+    ).to_parquet(output_path)
+    report_path = output_path.with_suffix(".report.json")
+    logger.debug("Saving linkage report to {}", report_path)
+    with report_path.open("w") as f:
+        json.dump(asdict(report), f, indent=2)
+    logger.success("Saved duplicate groups")
+
+    if deduplicated_path is not None:
+        logger.debug("Saving deduplicated data to {}", deduplicated_path)
+        deduplicated_path.parent.mkdir(parents=True, exist_ok=True)
+        drop_near_duplicates(df, groups).to_parquet(deduplicated_path)
+        logger.success("Saved deduplicated data")
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,562 @@
+from collections.abc import Sequence
+from dataclasses import dataclass
+import hashlib
+import json
+from pathlib import Path
+
+import pandas as pd
+import typer
+
+from sf_permits.cleaning import (
+    CATEGORICAL_MAX_CARDINALITY,
+    COORDINATE_COLUMNS,
+    DISTRICT_DEPENDENCIES,
+    DUPLICATE_IDENTIFIERS,
+    LOCATION_IMPUTATION_GROUPS,
+    MISSING_AS_FALSE_COLUMNS,
+    apply_street_name_corrections,
+    coordinates_changed,
+    drop_duplicate_position_permits,
+    label_locations,
+    load_raw_permits,
+    normalise,
+    read_location_layers,
+    remove_permits_inconsistencies,
+    remove_punctuation,
+    street_name_corrections,
+    string_to_boolean,
+    string_to_categorical,
+)
+from sf_permits.config import (
+    CLEAN_DATASET_PATH,
+    INCREMENTAL_STATE_DIR,
+    NEIGHBOURHOOD_SHAPEFILE_PATH,
+    RAW_DATASET_PATH,
+    STREET_NAMES_PATH,
+    ZIP_CODE_SHAPEFILE_PATH,
+    logger,
+)
+from sf_permits.pipeline import code_digest, file_digest
+from sf_permits.utils.functional_dependencies import impute_from_dependency
+from sf_permits.utils.unique_values import map_unique
+
+app = typer.Typer()
+
+CORRECTION_COLUMNS = ["StreetName", "StreetType"]
+
+
+@dataclass
+class GroupStatistics:
+    """
+    Mergeable statistics of columns within the groups of `group`.
+
+    Sums and counts of non-missing values give the mean of each group,
+    and the number of rows holding each value its mode. Statistics
+    of disjoint sets of rows can be added, and subtracted once those
+    rows are removed, without revisiting any other row.
+    """
+
+    group: list[str]
+    mean_columns: list[str]
+    mode_columns: list[str]
+    sums: pd.DataFrame
+    counts: pd.DataFrame
+    value_counts: dict[str, pd.Series]
+
+    @classmethod
+    def from_frame(
+        cls,
+        df: pd.DataFrame,
+        group: list[str],
+        mean_columns: Sequence[str] = (),
+        mode_columns: Sequence[str] = (),
+    ) -> "GroupStatistics":
+        mean_columns, mode_columns = list(mean_columns), list(mode_columns)
+        grouped = df.groupby(group, dropna=True, observed=True)[mean_columns]
+        return cls(
+            group,
+            mean_columns,
+            mode_columns,
+            grouped.sum(),
+            grouped.count(),
+            {
+                column: df[[*group, column]].value_counts(dropna=True)
+                for column in mode_columns
+            },
+        )
+
+    def add(self, other: "GroupStatistics") -> "GroupStatistics":
+        return self._combine(other, 1)
+
+    def subtract(self, other: "GroupStatistics") -> "GroupStatistics":
+        return self._combine(other, -1)
+
+    def _combine(self, other: "GroupStatistics", sign: int) -> "GroupStatistics":
+        counts = self.counts.add(sign * other.counts, fill_value=0).astype("int64")
+        # Groups without any rows left are dropped, so their sums
+        # do not accumulate rounding errors
+        kept = counts.gt(0).any(axis="columns") | counts.columns.empty
+        sums = self.sums.add(sign * other.sums, fill_value=0)
+        value_counts = {}
+        for column, counts_of_values in self.value_counts.items():
+            combined = counts_of_values.add(
+                sign * other.value_counts[column], fill_value=0
+            ).astype("int64")
+            value_counts[column] = combined[combined > 0]
+        return GroupStatistics(
+            self.group,
+            self.mean_columns,
+            self.mode_columns,
+            sums[kept],
+            counts[kept],
+            value_counts,
+        )
+
+    def impute(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Fill missing values of `df` with the statistics of their groups.
+
+        Equivalent to `cleaning.impute_group` with statistics computed
+        from the rows these were built from rather than from `df`.
+        """
+        keys = self._keys(df)
+        means = self.sums / self.counts
+        for column in self.mean_columns:
+            df[column] = df[column].fillna(
+                pd.Series(means[column].reindex(keys).array, index=df.index)
+            )
+        for column in self.mode_columns:
+            modes = pd.Series(self.modes(column).reindex(keys).array, index=df.index)
+            # Categoricals only accept values with the categories of `df`
+            df[column] = df[column].fillna(modes.astype(df[column].dtype))
+        return df
+
+    def modes(self, column: str) -> pd.Series:
+        """Most frequent value of `column` in each group, the smallest on ties."""
+        counts = (
+            self.value_counts[column]
+            .reset_index(name="count")
+            .sort_values(["count", column], ascending=[False, True])
+        )
+        return counts.drop_duplicates(self.group).set_index(self.group)[column]
+
+    def _keys(self, df: pd.DataFrame) -> pd.Index:
+        if len(self.group) == 1:
+            return pd.Index(df[self.group[0]])
+        return pd.MultiIndex.from_frame(df[self.group])
+
+    def save(self, directory: Path) -> None:
+        directory.mkdir(parents=True, exist_ok=True)
+        self.sums.to_parquet(directory / "sums.parquet")
+        self.counts.to_parquet(directory / "counts.parquet")
+        for position, column in enumerate(self.mode_columns):
+            self.value_counts[column].to_frame().to_parquet(
+                directory / f"value-counts-{position}.parquet"
+            )
+        with (directory / "columns.json").open("w") as f:
+            json.dump(
+                {
+                    "group": self.group,
+                    "mean_columns": self.mean_columns,
+                    "mode_columns": self.mode_columns,
+                },
+                f,
+                indent=2,
+            )
+
+    @classmethod
+    def load(cls, directory: Path) -> "GroupStatistics":
+        with (directory / "columns.json").open() as f:
+            columns = json.load(f)
+        return cls(
+            **columns,
+            sums=pd.read_parquet(directory / "sums.parquet"),
+            counts=pd.read_parquet(directory / "counts.parquet"),
+            value_counts={
+                column: pd.read_parquet(directory / f"value-counts-{position}.parquet")[
+                    "count"
+                ]
+                for position, column in enumerate(columns["mode_columns"])
+            },
+        )
+
+
+@dataclass
+class IncrementalState:
+    """
+    What an incremental run needs to know about the previous one.
+
+    `rows` holds hashes of the permit number and of the contents of each
+    raw row, indexed by its position in the raw data, so changed permits
+    can be found. `corrections` holds the external street name and type
+    matched to each normalised spelling, missing if none matched, and
+    `observations` the values each of `statistics` was computed from,
+    indexed by raw position, so the rows of changed permits can be
+    subtracted from them.
+
+    `version` identifies the cleaning code and external data; a state
+    of another version is discarded, so all permits are cleaned again.
+    """
+
+    version: str
+    rows: pd.DataFrame
+    corrections: pd.DataFrame
+    observations: dict[str, pd.DataFrame]
+    statistics: dict[str, GroupStatistics]
+
+    @classmethod
+    def empty(cls, version: str) -> "IncrementalState":
+        return cls(
+            version,
+            pd.DataFrame({"permit": [], "row": []}, dtype="uint64"),
+            pd.DataFrame(columns=CORRECTION_COLUMNS, dtype="string"),
+            {},
+            {},
+        )
+
+    @classmethod
+    def load(cls, state_dir: Path, version: str) -> "IncrementalState":
+        metadata_path = state_dir / "metadata.json"
+        if not metadata_path.exists():
+            logger.info("No previous incremental state in {}", state_dir)
+            return cls.empty(version)
+        with metadata_path.open() as f:
+            metadata = json.load(f)
+        if metadata["version"] != version:
+            logger.warning("Cleaning code or external data changed since last run")
+            return cls.empty(version)
+        return cls(
+            version,
+            pd.read_parquet(state_dir / "rows.parquet"),
+            pd.read_parquet(state_dir / "corrections.parquet"),
+            {
+                name: pd.read_parquet(state_dir / "observations" / f"{slug}.parquet")
+                for name, slug in metadata["statistics"].items()
+            },
+            {
+                name: GroupStatistics.load(state_dir / "statistics" / slug)
+                for name, slug in metadata["statistics"].items()
+            },
+        )
+
+    def save(self, state_dir: Path) -> None:
+        slugs = {name: name.lower().replace(" ", "-") for name in self.statistics}
+        (state_dir / "observations").mkdir(parents=True, exist_ok=True)
+        self.rows.to_parquet(state_dir / "rows.parquet")
+        self.corrections.to_parquet(state_dir / "corrections.parquet")
+        for name, slug in slugs.items():
+            self.observations[name].to_parquet(
+                state_dir / "observations" / f"{slug}.parquet"
+            )
+            self.statistics[name].save(state_dir / "statistics" / slug)
+        # Metadata is written last, so an interrupted save is not reused
+        with (state_dir / "metadata.json").open("w") as f:
+            json.dump({"version": self.version, "statistics": slugs}, f, indent=2)
+
+    def observe(
+        self,
+        name: str,
+        observations: pd.DataFrame,
+        group: list[str],
+        mean_columns: Sequence[str] = (),
+        mode_columns: Sequence[str] = (),
+    ) -> GroupStatistics:
+        """Add `observations` to the statistic `name` and return it."""
+        statistics = GroupStatistics.from_frame(
+            observations, group, mean_columns, mode_columns
+        )
+        if name in self.statistics:
+            statistics = self.statistics[name].add(statistics)
+            observations = pd.concat([self.observations[name], observations])
+        self.statistics[name] = statistics
+        self.observations[name] = observations
+        return statistics
+
+    def forget(self, kept: pd.Series) -> None:
+        """
+        Keep only the rows at the old positions in the index of `kept`.
+
+        Observations of all other rows are subtracted from the statistics,
+        and kept rows are moved to their new positions, the values of `kept`.
+        """
+        self.rows = _move_rows(self.rows, kept)
+        for name, observations in self.observations.items():
+            removed = observations[~observations.index.isin(kept.index)]
+            self.statistics[name] = self.statistics[name].subtract(
+                GroupStatistics.from_frame(
+                    removed,
+                    self.statistics[name].group,
+                    self.statistics[name].mean_columns,
+                    self.statistics[name].mode_columns,
+                )
+            )
+            self.observations[name] = _move_rows(observations, kept)
+
+
+@app.command()
+def main(
+    input_path: Path = RAW_DATASET_PATH,
+    previous_path: Path = CLEAN_DATASET_PATH,
+    output_path: Path = CLEAN_DATASET_PATH,
+    state_dir: Path = INCREMENTAL_STATE_DIR,
+    workers: int = 1,
+):
+    """
+    Clean only the permits added or changed since the previous clean dataset.
+
+    Permits are keyed on `Permit Number`, and a permit is cleaned again
+    if any of its raw rows changed. The street name corrections and
+    imputation statistics of earlier runs are kept in `state_dir`,
+    so only new spellings are matched and statistics are updated with
+    new and changed rows. Rows of unchanged permits keep the values
+    imputed when they were first cleaned; run `cleaning.py` to impute
+    all rows from the latest statistics.
+    """
+    clean_df = clean_incrementally(
+        input_path,
+        previous_path,
+        state_dir,
+        workers,
+        NEIGHBOURHOOD_SHAPEFILE_PATH,
+        ZIP_CODE_SHAPEFILE_PATH,
+        STREET_NAMES_PATH,
+    )
+    logger.info("Saving clean data")
+    logger.debug("Saving clean data to {}", output_path)
+    clean_df.to_parquet(output_path)
+    logger.success("Saved clean data")
+
+
+def clean_incrementally(
+    input_path: Path,
+    previous_path: Path = CLEAN_DATASET_PATH,
+    state_dir: Path = INCREMENTAL_STATE_DIR,
+    workers: int = 1,
+    neighbourhood_path: Path = NEIGHBOURHOOD_SHAPEFILE_PATH,
+    zip_code_path: Path = ZIP_CODE_SHAPEFILE_PATH,
+    street_names_path: Path = STREET_NAMES_PATH,
+) -> pd.DataFrame:
+    """
+    Clean the permits of `input_path` which changed since the previous run.
+
+    Returns the rows of unchanged permits from `previous_path` merged
+    with the newly cleaned ones, and updates the state in `state_dir`.
+    """
+    version = state_version(neighbourhood_path, zip_code_path, street_names_path)
+    state = IncrementalState.load(state_dir, version)
+    if not state.rows.empty and not previous_path.exists():
+        logger.warning("Previous clean data {} not found", previous_path)
+        state = IncrementalState.empty(version)
+
+    raw_df = load_raw_permits(input_path)
+    rows = row_hashes(raw_df)
+    kept = unchanged_positions(state.rows, rows)
+    logger.info(
+        "Keeping {} unchanged rows and cleaning {} new or changed rows",
+        len(kept),
+        len(rows) - len(kept),
+    )
+    dfs = []
+    if not state.rows.empty:
+        logger.debug("Loading previous clean data from {}", previous_path)
+        dfs.append(_move_rows(pd.read_parquet(previous_path), kept))
+    state.forget(kept)
+    state.rows = rows
+
+    changed_df = raw_df[~raw_df.index.isin(kept.to_numpy())]
+    if not changed_df.empty:
+        dfs.append(
+            clean_permits(
+                changed_df.copy(),
+                state,
+                workers,
+                neighbourhood_path,
+                zip_code_path,
+                street_names_path,
+            )
+        )
+    clean_df = merge_permits(dfs)
+    logger.success("Incremental data cleaning complete")
+
+    logger.debug("Saving incremental state to {}", state_dir)
+    state.save(state_dir)
+    return clean_df
+
+
+def state_version(*reference_paths: Path) -> str:
+    digest = hashlib.sha256(code_digest(clean_permits).encode())
+    for path in reference_paths:
+        digest.update(file_digest(path).encode())
+    return digest.hexdigest()
+
+
+def row_hashes(raw_df: pd.DataFrame) -> pd.DataFrame:
+    """Hash the permit number and contents of each raw row."""
+    return pd.DataFrame(
+        {
+            "permit": pd.util.hash_pandas_object(raw_df["Permit Number"], index=False),
+            "row": pd.util.hash_pandas_object(raw_df, index=False),
+        }
+    )
+
+
+def permit_digests(rows: pd.DataFrame) -> pd.Series:
+    """Digest of the contents and order of the rows of each permit."""
+    rank = rows.groupby("permit").cumcount()
+    row_digests = pd.util.hash_pandas_object(
+        pd.DataFrame({"row": rows["row"], "rank": rank}), index=False
+    )
+    return row_digests.groupby(rows["permit"]).sum()
+
+
+def unchanged_positions(previous: pd.DataFrame, current: pd.DataFrame) -> pd.Series:
+    """
+    Map the previous positions of rows of unchanged permits to current ones.
+
+    A permit is unchanged if it holds the same rows in the same order.
+    Identical rows are told apart by their order of occurrence, which
+    is the same in both since they belong to the same permit.
+    """
+    digests = pd.concat(
+        [permit_digests(previous), permit_digests(current)],
+        axis="columns",
+        keys=["previous", "current"],
+        join="inner",
+    )
+    unchanged = digests.index[digests["previous"] == digests["current"]]
+
+    def occurrences(rows: pd.DataFrame) -> pd.DataFrame:
+        rows = rows[rows["permit"].isin(unchanged)]
+        return rows.assign(occurrence=rows.groupby("row").cumcount()).reset_index(
+            names="position"
+        )
+
+    positions = occurrences(previous).merge(
+        occurrences(current), on=["row", "occurrence"], suffixes=("", "_current")
+    )
+    return pd.Series(
+        positions["position_current"].to_numpy(),
+        index=pd.Index(positions["position"].to_numpy()),
+    )
+
+
+def clean_permits(
+    df: pd.DataFrame,
+    state: IncrementalState,
+    workers: int = 1,
+    neighbourhood_path: Path = NEIGHBOURHOOD_SHAPEFILE_PATH,
+    zip_code_path: Path = ZIP_CODE_SHAPEFILE_PATH,
+    street_names_path: Path = STREET_NAMES_PATH,
+) -> pd.DataFrame:
+    """
+    Apply the cleaning stages to new permits, using and updating `state`.
+
+    Stages which depend on other permits use the corrections and
+    statistics in `state`, which are first updated with `df`.
+    """
+    df = normalise(df)
+    layers = read_location_layers(neighbourhood_path, zip_code_path)
+    df = label_locations(df, layers)
+
+    street_names = map_unique(df["Street Name"], remove_punctuation)
+    state.corrections = update_corrections(
+        state.corrections,
+        pd.Series(street_names.dropna().unique(), name="Street Name"),
+        street_names_path,
+        workers,
+    )
+    df = apply_street_name_corrections(df, street_names, state.corrections)
+
+    labelled = df[COORDINATE_COLUMNS].copy()
+    df = string_to_boolean(df)
+    for name, (group, mean_columns, mode_columns) in LOCATION_IMPUTATION_GROUPS.items():
+        logger.info("Imputing based on {}", name)
+        statistics = state.observe(
+            name,
+            df[[*group, *mean_columns, *mode_columns]].copy(),
+            group,
+            mean_columns,
+            mode_columns,
+        )
+        df = statistics.impute(df)
+    logger.info("Reapplying neighbourhood and zipcode matching")
+    df = label_locations(df, layers, rows=coordinates_changed(df, labelled))
+
+    for determinant, dependent, min_confidence, overwrite in DISTRICT_DEPENDENCIES:
+        statistics = state.observe(
+            f"{determinant} to {dependent}",
+            df[[determinant, dependent]].copy(),
+            [determinant],
+            mode_columns=[dependent],
+        )
+        df = impute_from_dependency(
+            df,
+            determinant,
+            dependent,
+            min_confidence=min_confidence,
+            overwrite=overwrite,
+            counts=statistics.value_counts[dependent],
+        )
+
+    df = remove_permits_inconsistencies(df)
+    # Permit numbers identify duplicates, so rows of new permits
+    # cannot duplicate rows of unchanged ones
+    df = drop_duplicate_position_permits(df)
+    return df
+
+
+def update_corrections(
+    corrections: pd.DataFrame,
+    spellings: pd.Series,
+    street_names_path: Path = STREET_NAMES_PATH,
+    workers: int = 1,
+) -> pd.DataFrame:
+    """Add corrections of the spellings which were not matched before."""
+    unseen = spellings[~spellings.isin(corrections.index)]
+    logger.debug(
+        "{} of {} distinct street names were not seen before",
+        len(unseen),
+        len(spellings),
+    )
+    if unseen.empty:
+        return corrections
+    new_corrections = street_name_corrections(
+        unseen, street_names_path, workers
+    ).reindex(pd.Index(unseen.array))
+    if corrections.empty:
+        return new_corrections.astype("string")
+    return pd.concat([corrections, new_corrections]).astype("string")
+
+
+def merge_permits(dfs: list[pd.DataFrame]) -> pd.DataFrame:
+    """Merge clean rows of unchanged and new permits in raw data order."""
+    # Categories are chosen again once all rows are merged
+    df = pd.concat(
+        [
+            df.astype(
+                {
+                    column: df[column].cat.categories.dtype
+                    for column in df.select_dtypes("category")
+                }
+            )
+            for df in dfs
+            if not df.empty
+        ]
+    ).sort_index()
+    # Rows without a permit number are the only ones which may
+    # duplicate rows of other permits
+    without_permit = df[df["Permit Number"].isna()]
+    duplicated = without_permit.duplicated(subset=DUPLICATE_IDENTIFIERS)
+    df = df.drop(duplicated.index[duplicated])
+    return string_to_categorical(
+        df, CATEGORICAL_MAX_CARDINALITY, exclude=MISSING_AS_FALSE_COLUMNS
+    )
+
+
+def _move_rows(df: pd.DataFrame, positions: pd.Series) -> pd.DataFrame:
+    df = df[df.index.isin(positions.index)]
+    return df.set_axis(positions.loc[df.index].to_numpy())
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,164 @@
+from collections.abc import Callable
+import cProfile
+from dataclasses import dataclass, field
+from pathlib import Path
+import sys
+import time
+
+import pandas as pd
+
+from sf_permits.config import logger
+
+try:
+    import resource
+except ModuleNotFoundError:  # Not available on Windows
+    resource = None
+
+
+@dataclass
+class StageReport:
+    """
+    Performance and effect of a single pipeline stage.
+
+    Times are in seconds and memory in bytes. `status` is "run" for
+    stages which were executed, "skipped" for stages passed through
+    and "checkpoint" for stages whose output was read from disk.
+
+    The operating system only reports the peak resident set size of
+    the whole process, so `peak_rss_increase` is how much the stage
+    raised it: zero if the stage stayed below the peak of an earlier one.
+    `cells_changed` is only counted if requested, since hashing every
+    cell takes seconds per million rows.
+    """
+
+    name: str
+    status: str
+    wall_time: float = 0.0
+    cpu_time: float = 0.0
+    peak_rss_increase: int | None = None
+    memory_in: int | None = None
+    memory_out: int | None = None
+    memory_delta: int | None = None
+    rows_in: int | None = None
+    rows_out: int | None = None
+    cells_changed: int | None = None
+    missing_values: dict[str, int] = field(default_factory=dict)
+
+
+def peak_rss() -> int | None:
+    """Peak resident set size of this process so far."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, while macOS reports bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def dataframe_memory(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(deep=True).sum())
+
+
+def column_hashes(df: pd.DataFrame) -> dict[str, pd.Series]:
+    """Hash every value of each column, keeping the row index."""
+    return {
+        column: pd.Series(
+            pd.util.hash_pandas_object(df[column], index=False).to_numpy(),
+            index=df.index,
+        )
+        for column in df.columns
+    }
+
+
+def count_changed_cells(before: dict[str, pd.Series], df: pd.DataFrame) -> int | None:
+    """
+    Count cells of `df` which differ from the ones hashed in `before`.
+
+    Only rows present in both are compared, and every cell of a column
+    which was added counts as changed. Changes are not counted if
+    the index has duplicates, since rows cannot be aligned then.
+    """
+    if not df.index.is_unique or not all(
+        hashes.index.is_unique for hashes in before.values()
+    ):
+        return None
+    after = column_hashes(df)
+    changed = 0
+    for column, hashes in after.items():
+        if column not in before:
+            changed += len(hashes)
+            continue
+        previous = before[column]
+        common = hashes.index.intersection(previous.index)
+        changed += int((hashes.loc[common] != previous.loc[common]).sum())
+    return changed
+
+
+def measure_stage(
+    name: str,
+    call: Callable[[], pd.DataFrame],
+    df: pd.DataFrame | None,
+    profile_path: Path | None = None,
+    count_changes: bool = False,
+) -> tuple[pd.DataFrame, StageReport]:
+    """
+    Run `call`, which transforms `df`, and report on its performance.
+
+    Statistics of the input are taken beforehand, since stages may
+    modify it in place. If `profile_path` is given, the stage is run
+    under pyinstrument, if installed, or else cProfile, and the
+    profile is saved there, with the extension of the profiler appended.
+    """
+    report = StageReport(name, "run")
+    before = None
+    if df is not None:
+        report.rows_in = len(df)
+        report.memory_in = dataframe_memory(df)
+        if count_changes:
+            before = column_hashes(df)
+
+    peak_before = peak_rss()
+
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    output = call() if profile_path is None else _profile(call, profile_path)
+    report.wall_time = time.perf_counter() - wall_start
+    report.cpu_time = time.process_time() - cpu_start
+
+    if peak_before is not None:
+        report.peak_rss_increase = peak_rss() - peak_before
+    report.rows_out = len(output)
+    report.memory_out = dataframe_memory(output)
+    if report.memory_in is not None:
+        report.memory_delta = report.memory_out - report.memory_in
+    if before is not None:
+        report.cells_changed = count_changed_cells(before, output)
+    report.missing_values = {
+        column: int(count) for column, count in output.isna().sum().items()
+    }
+    logger.debug(
+        "Stage {} took {:.2f}s for {} rows, changing {} cells",
+        name,
+        report.wall_time,
+        report.rows_out,
+        report.cells_changed,
+    )
+    return output, report
+
+
+def _profile(call: Callable[[], pd.DataFrame], path: Path) -> pd.DataFrame:
+    # The extension is appended, so a stage name given as a suffix is kept
+    try:
+        from pyinstrument import Profiler
+    except ModuleNotFoundError:
+        profiler = cProfile.Profile()
+        output = profiler.runcall(call)
+        profile_path = path.with_name(f"{path.name}.prof")
+        profiler.dump_stats(profile_path)
+        logger.info("Saved cProfile statistics to {}", profile_path)
+        return output
+
+    with Profiler() as profiler:
+        output = call()
+    profile_path = path.with_name(f"{path.name}.html")
+    profiler.write_html(profile_path)
+    logger.info("Saved pyinstrument profile to {}", profile_path)
+    return output
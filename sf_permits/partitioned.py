@@ -0,0 +1,446 @@
+from collections.abc import Callable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+from pathlib import Path
+import shutil
+from typing import Any
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import typer
+
+from sf_permits.cleaning import (
+    CATEGORICAL_MAX_CARDINALITY,
+    COORDINATE_COLUMNS,
+    DISTRICT_DEPENDENCIES,
+    DUPLICATE_IDENTIFIERS,
+    LOCATION_IMPUTATION_GROUPS,
+    MISSING_AS_FALSE_COLUMNS,
+    apply_street_name_corrections,
+    coordinates_changed,
+    label_locations,
+    label_permit_locations,
+    normalise,
+    read_location_layers,
+    read_street_names,
+    remove_permits_inconsistencies,
+    remove_punctuation,
+    street_name_corrections,
+    string_to_boolean,
+)
+from sf_permits.config import (
+    CLEAN_DATASET_PATH,
+    NEIGHBOURHOOD_SHAPEFILE_PATH,
+    PARTITION_DIR,
+    RAW_DATASET_PATH,
+    STREET_NAMES_PATH,
+    ZIP_CODE_SHAPEFILE_PATH,
+    logger,
+)
+from sf_permits.dataset import iter_permits, read_parquet
+from sf_permits.incremental import GroupStatistics
+from sf_permits.reference import load_reference
+from sf_permits.utils.functional_dependencies import impute_from_dependency
+from sf_permits.utils.unique_values import map_unique
+
+app = typer.Typer()
+
+PARTITION_ROWS = 250_000
+# Raw data are read in blocks smaller than a partition, so a partition
+# is never held in memory twice while it is being split
+SPLIT_BLOCK_SIZE = 16 * 2**20
+
+
+@app.command()
+def main(
+    input_path: Path = RAW_DATASET_PATH,
+    output_path: Path = CLEAN_DATASET_PATH,
+    partition_dir: Path = PARTITION_DIR,
+    partition_rows: int = PARTITION_ROWS,
+    workers: int = 1,
+):
+    """
+    Clean the dataset in partitions, without loading all of it at once.
+
+    `input_path` is either a CSV file, split into partitions of at most
+    `partition_rows` rows, or a directory of CSV files, each of which is
+    a partition. Each worker holds one partition at a time, so memory
+    grows with the partition size and the number of workers rather
+    than with the size of the dataset.
+    """
+    logger.info("Starting partitioned data cleaning")
+    paths = clean_partitioned(
+        input_path,
+        partition_dir,
+        partition_rows,
+        workers,
+        NEIGHBOURHOOD_SHAPEFILE_PATH,
+        ZIP_CODE_SHAPEFILE_PATH,
+        STREET_NAMES_PATH,
+    )
+    logger.success("Partitioned data cleaning complete")
+
+    logger.info("Saving clean data")
+    logger.debug("Saving clean data to {}", output_path)
+    write_partitions(paths, output_path)
+    shutil.rmtree(partition_dir)
+    logger.success("Saved clean data")
+
+
+def clean_partitioned(
+    input_path: Path,
+    partition_dir: Path = PARTITION_DIR,
+    partition_rows: int = PARTITION_ROWS,
+    workers: int = 1,
+    neighbourhood_path: Path = NEIGHBOURHOOD_SHAPEFILE_PATH,
+    zip_code_path: Path = ZIP_CODE_SHAPEFILE_PATH,
+    street_names_path: Path = STREET_NAMES_PATH,
+) -> list[Path]:
+    """
+    Apply the cleaning stages to the partitions of `input_path`.
+
+    Row-local stages run on each partition in a process pool, while
+    stages which depend on other rows run in two steps: each partition
+    is summarised, with the distinct street spellings, the distinct
+    values of string columns, the statistics of imputation groups or
+    the hashes of duplicate identifiers, and the merged summaries are
+    then sent back to every partition. Only these summaries are held
+    in this process.
+
+    Returns the paths of the clean partitions, in raw data order.
+    """
+    paths = split_permits(input_path, partition_dir, partition_rows)
+    # Reference data are cached before any worker needs them,
+    # so workers do not build the same cache concurrently
+    read_location_layers(neighbourhood_path, zip_code_path)
+    load_reference(street_names_path, read_street_names)
+    location_params = {
+        "neighbourhood_path": neighbourhood_path,
+        "zip_code_path": zip_code_path,
+    }
+    # Statistics observed for each imputation step, in order
+    observations = [*LOCATION_IMPUTATION_GROUPS.values()] + [
+        ([determinant], [], [dependent])
+        for determinant, dependent, _, _ in DISTRICT_DEPENDENCIES
+    ]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+
+        def transform(step: Callable, **arguments) -> list:
+            return map_partitions(executor, paths, step, arguments)
+
+        spellings, rows = zip(*transform(prepare_partition, **location_params))
+        spellings = pd.concat(spellings, ignore_index=True).drop_duplicates()
+        logger.debug("{} distinct street names", len(spellings))
+        corrections = street_name_corrections(spellings, street_names_path, workers)
+
+        # Columns are categorised right after street names are corrected,
+        # as in `cleaning_stages`, so columns with more distinct values
+        # than this in any one partition cannot be categorical
+        values = transform(
+            correct_partition,
+            corrections=corrections,
+            limit=sum(rows) * CATEGORICAL_MAX_CARDINALITY,
+        )
+        distinct, counts = zip(*values)
+        statistics = transform(
+            categorise_partition,
+            dtypes=categorical_dtypes(distinct, _add_counts(counts)),
+            observe=observations[0],
+        )
+        for position, name in enumerate(LOCATION_IMPUTATION_GROUPS, start=1):
+            logger.info("Imputing based on {}", name)
+            statistics = transform(
+                impute_partition,
+                statistics=reduce(GroupStatistics.add, statistics),
+                observe=observations[position],
+                **location_params,
+            )
+        for position, (determinant, dependent, min_confidence, overwrite) in enumerate(
+            DISTRICT_DEPENDENCIES, start=len(LOCATION_IMPUTATION_GROUPS) + 1
+        ):
+            logger.info("Imputing {} from {}", dependent, determinant)
+            statistics = transform(
+                fill_partition,
+                determinant=determinant,
+                dependent=dependent,
+                min_confidence=min_confidence,
+                overwrite=overwrite,
+                counts=reduce(GroupStatistics.add, statistics).value_counts[dependent],
+                observe=observations[position]
+                if position < len(observations)
+                else None,
+            )
+
+        duplicated = pd.concat(statistics).sort_index().duplicated()
+        logger.debug("Dropping {} duplicate rows", duplicated.sum())
+        map_partitions(
+            executor,
+            paths,
+            drop_partition_duplicates,
+            {},
+            [
+                {"duplicated": keys.index[duplicated.loc[keys.index]]}
+                for keys in statistics
+            ],
+        )
+    return paths
+
+
+def map_partitions(
+    executor: ProcessPoolExecutor,
+    paths: list[Path],
+    step: Callable[..., tuple[pd.DataFrame, Any]],
+    arguments: dict[str, Any],
+    partition_arguments: list[dict[str, Any]] | None = None,
+) -> list:
+    """
+    Apply `step` to each partition in place, returning its summaries.
+
+    `step` takes a partition and `arguments`, along with the entry of
+    `partition_arguments` for that partition if given, and returns the
+    transformed partition and a summary of it.
+    """
+    from tqdm import tqdm
+
+    futures = [
+        executor.submit(
+            _transform_partition,
+            path,
+            step,
+            arguments | (partition_arguments[position] if partition_arguments else {}),
+        )
+        for position, path in enumerate(paths)
+    ]
+    return [
+        future.result()
+        for future in tqdm(futures, desc=step.__name__.replace("_", " ").capitalize())
+    ]
+
+
+def _transform_partition(path: Path, step: Callable, arguments: dict[str, Any]) -> Any:
+    df, summary = step(read_parquet(path), **arguments)
+    # The index holds raw positions, so it is always written out
+    df.to_parquet(path, index=True)
+    return summary
+
+
+def split_permits(
+    input_path: Path, partition_dir: Path, partition_rows: int
+) -> list[Path]:
+    """
+    Write the raw permits of `input_path` as Parquet partitions.
+
+    Rows are indexed by their position in the raw data, counting across
+    all files of a directory in name order, as `load_permits` does.
+    """
+    if partition_dir.exists():
+        shutil.rmtree(partition_dir)
+    partition_dir.mkdir(parents=True)
+    paths = []
+    start = 0
+    for df in _raw_partitions(input_path, partition_rows):
+        path = partition_dir / f"part-{len(paths):05d}.parquet"
+        df.set_axis(pd.RangeIndex(start, start + len(df))).to_parquet(path, index=True)
+        paths.append(path)
+        start += len(df)
+    logger.info("Split {} rows into {} partitions", start, len(paths))
+    return paths
+
+
+def _raw_partitions(input_path: Path, partition_rows: int) -> Iterator[pd.DataFrame]:
+    if input_path.is_dir():
+        for path in sorted(input_path.glob("*.csv")):
+            yield pd.concat(iter_permits(path, SPLIT_BLOCK_SIZE), ignore_index=True)
+        return
+    chunks: list[pd.DataFrame] = []
+    rows = 0
+    for chunk in iter_permits(input_path, SPLIT_BLOCK_SIZE):
+        while rows + len(chunk) >= partition_rows:
+            split = partition_rows - rows
+            yield pd.concat([*chunks, chunk.iloc[:split]], ignore_index=True)
+            chunk = chunk.iloc[split:]
+            chunks, rows = [], 0
+        if len(chunk):
+            chunks.append(chunk)
+            rows += len(chunk)
+    if chunks:
+        yield pd.concat(chunks, ignore_index=True)
+
+
+def prepare_partition(
+    df: pd.DataFrame, neighbourhood_path: Path, zip_code_path: Path
+) -> tuple[pd.DataFrame, tuple[pd.Series, int]]:
+    """
+    Normalise and label a partition.
+
+    Returns its distinct street names and its number of rows.
+    """
+    df = df.dropna(how="all", axis="index")
+    df = normalise(df)
+    df = label_permit_locations(df, neighbourhood_path, zip_code_path)
+    street_names = map_unique(df["Street Name"], remove_punctuation)
+    return df, (pd.Series(street_names.dropna().unique(), name="Street Name"), len(df))
+
+
+def correct_partition(
+    df: pd.DataFrame, corrections: pd.DataFrame, limit: float
+) -> tuple[pd.DataFrame, tuple[dict[str, pd.Series | None], pd.Series]]:
+    """
+    Correct the street names of a partition.
+
+    Returns the distinct values of its string columns, except for
+    columns with more than `limit` of them, and the number of
+    non-missing values of each column.
+    """
+    street_names = map_unique(df["Street Name"], remove_punctuation)
+    df = apply_street_name_corrections(df, street_names, corrections)
+    values = {}
+    for column in _string_columns(df):
+        distinct = df[column].dropna().drop_duplicates()
+        values[column] = (
+            distinct.reset_index(drop=True) if len(distinct) <= limit else None
+        )
+    return df, (values, df.count())
+
+
+def categorise_partition(
+    df: pd.DataFrame, dtypes: dict[str, pd.CategoricalDtype], observe: tuple
+) -> tuple[pd.DataFrame, GroupStatistics]:
+    """
+    Store columns as categoricals with the same categories in all partitions.
+
+    Returns the statistics of the first imputation group.
+    """
+    df = df.astype(dtypes)
+    df = string_to_boolean(df)
+    return df, GroupStatistics.from_frame(df, *observe)
+
+
+def impute_partition(
+    df: pd.DataFrame,
+    statistics: GroupStatistics,
+    observe: tuple,
+    neighbourhood_path: Path,
+    zip_code_path: Path,
+) -> tuple[pd.DataFrame, GroupStatistics]:
+    """
+    Impute a partition from the statistics of all partitions.
+
+    Only missing coordinates are imputed, so the locations of permits
+    whose coordinates were filled are labelled again right away.
+    Returns the statistics of the next group to observe.
+    """
+    labelled = df[COORDINATE_COLUMNS].copy()
+    df = statistics.impute(df)
+    df = label_locations(
+        df,
+        read_location_layers(neighbourhood_path, zip_code_path),
+        rows=coordinates_changed(df, labelled),
+    )
+    return df, GroupStatistics.from_frame(df, *observe)
+
+
+def fill_partition(
+    df: pd.DataFrame,
+    determinant: str,
+    dependent: str,
+    min_confidence: float,
+    overwrite: bool,
+    counts: pd.Series,
+    observe: tuple | None,
+) -> tuple[pd.DataFrame, Any]:
+    """
+    Impute a dependent column from value counts of all partitions.
+
+    Returns the statistics of the next dependency to observe, or,
+    after the last one, the hashes of the duplicate identifiers of
+    each consistent row.
+    """
+    df = impute_from_dependency(
+        df,
+        determinant,
+        dependent,
+        min_confidence=min_confidence,
+        overwrite=overwrite,
+        counts=counts,
+    )
+    if observe is not None:
+        return df, GroupStatistics.from_frame(df, *observe)
+    df = remove_permits_inconsistencies(df)
+    return df, pd.util.hash_pandas_object(df[DUPLICATE_IDENTIFIERS], index=False)
+
+
+def drop_partition_duplicates(
+    df: pd.DataFrame, duplicated: pd.Index
+) -> tuple[pd.DataFrame, None]:
+    """Drop the rows of a partition which duplicate earlier ones."""
+    return df[~df.index.isin(duplicated)], None
+
+
+def categorical_dtypes(
+    values: list[dict[str, pd.Series | None]],
+    counts: pd.Series,
+    max_cardinality: float = CATEGORICAL_MAX_CARDINALITY,
+) -> dict[str, pd.CategoricalDtype]:
+    """
+    Categories of columns with few distinct values among all partitions.
+
+    Columns are chosen as `string_to_categorical` does, from the
+    distinct values of each partition and the number of non-missing
+    values of each column in all of them.
+    """
+    dtypes = {}
+    for column in values[0]:
+        distinct = [partition_values[column] for partition_values in values]
+        if any(partition_values is None for partition_values in distinct):
+            continue
+        categories = pd.concat(distinct, ignore_index=True).drop_duplicates()
+        if len(categories) > max_cardinality * counts[column]:
+            continue
+        dtypes[column] = pd.CategoricalDtype(pd.Index(categories).sort_values())
+        logger.debug(
+            "Storing {} with {} distinct values as categorical",
+            column,
+            len(categories),
+        )
+    return dtypes
+
+
+def _add_counts(counts: list[pd.Series]) -> pd.Series:
+    return reduce(lambda left, right: left.add(right, fill_value=0), counts)
+
+
+def _string_columns(df: pd.DataFrame) -> list[str]:
+    return [
+        column
+        for column in df.columns.difference(MISSING_AS_FALSE_COLUMNS, sort=False)
+        if pd.api.types.is_string_dtype(df[column].dtype)
+        or pd.api.types.is_object_dtype(df[column].dtype)
+    ]
+
+
+def write_partitions(paths: list[Path], output_path: Path) -> None:
+    """
+    Concatenate partitions into a single Parquet file, one at a time.
+
+    Columns which are entirely missing in some partitions are written
+    with the type they have in the others.
+    """
+    schemas = [pq.read_schema(path) for path in paths]
+    fields = []
+    for name in schemas[0].names:
+        types = [schema.field(name).type for schema in schemas]
+        fields.append(
+            pa.field(name, next((t for t in types if t != pa.null()), pa.null()))
+        )
+    schema = pa.schema(fields, metadata=schemas[0].metadata)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with pq.ParquetWriter(output_path, schema) as writer:
+        for path in paths:
+            writer.write_table(pq.read_table(path).cast(schema))
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,279 @@
+from collections.abc import Callable
+from dataclasses import dataclass, field, fields, is_dataclass
+from functools import partial
+import hashlib
+import inspect
+import json
+from pathlib import Path, PurePath
+import re
+import types
+from typing import Any
+
+import pandas as pd
+
+from sf_permits.config import CHECKPOINT_DIR, logger
+from sf_permits.dataset import read_parquet
+from sf_permits.instrumentation import StageReport, measure_stage
+
+# Constants referenced by stage code are part of its version; scalars
+# are hashed by value and containers by their contents
+_SCALAR_TYPES = (str, bytes, int, float, complex, bool, type(None), PurePath)
+_CONTAINER_TYPES = (tuple, list, dict, frozenset, set)
+_MEMORY_ADDRESS = re.compile(r" at 0x[0-9a-fA-F]+")
+
+
+@dataclass
+class Stage:
+    """
+    Named step of a pipeline, which transforms the output of the previous one.
+
+    `func` is called with the previous output, or with no DataFrame if
+    it is the first stage, followed by `params` and `options` as keyword
+    arguments. Only `params` are part of the checkpoint key, so `options`
+    must not change the output. Path parameters are keyed by their contents,
+    as are `references`, the files the stage reads on its own.
+
+    `requires` maps keyword arguments to the names of earlier stages
+    and the columns of their outputs which the stage needs; these are
+    read back from the checkpoints of those stages.
+    """
+
+    name: str
+    func: Callable[..., pd.DataFrame]
+    params: dict[str, Any] = field(default_factory=dict)
+    options: dict[str, Any] = field(default_factory=dict)
+    references: list[Path] = field(default_factory=list)
+    requires: dict[str, tuple[str, list[str]]] = field(default_factory=dict)
+
+
+def file_digest(path: Path) -> str:
+    """Hash the contents of a file, or of every file in a directory."""
+    digest = hashlib.sha256()
+    paths = sorted(path.rglob("*")) if path.is_dir() else [path]
+    for file_path in paths:
+        if file_path.is_file():
+            digest.update(file_path.relative_to(path).as_posix().encode())
+            with file_path.open("rb") as f:
+                digest.update(hashlib.file_digest(f, "sha256").digest())
+    return digest.hexdigest()
+
+
+def code_digest(func: Callable) -> str:
+    """
+    Hash the source of `func` and of the project code it depends on.
+
+    Functions and constants it references from its module are followed
+    recursively, and the source of referenced classes is included,
+    so the digest changes whenever any of them is edited.
+
+    Constants are described by their contents rather than their repr,
+    which may hold memory addresses or, for sets, depend on the hash
+    seed of the process. Project functions in them are followed and
+    other callables are named, while other objects are described by
+    their repr, unless it holds a memory address, in which case a
+    `TypeError` is raised, so the digest is the same in every process.
+    """
+    digest = hashlib.sha256()
+    seen = set()
+
+    def visit(func: Callable) -> None:
+        if func in seen:
+            return
+        seen.add(func)
+        digest.update(inspect.getsource(func).encode())
+        for name in sorted(_referenced_names(func.__code__)):
+            value = func.__globals__.get(name)
+            if isinstance(value, type) and _is_project_code(value):
+                describe(value)
+            elif isinstance(
+                value, (types.FunctionType, *_SCALAR_TYPES, *_CONTAINER_TYPES)
+            ):
+                digest.update(f"{name}={describe(value)}".encode())
+
+    def describe(value: Any) -> str:
+        if isinstance(value, _SCALAR_TYPES):
+            return repr(value)
+        if isinstance(value, (tuple, list)):
+            return f"{type(value).__name__}({', '.join(map(describe, value))})"
+        if isinstance(value, dict):
+            items = (
+                f"{describe(key)}: {describe(item)}" for key, item in value.items()
+            )
+            return f"dict({', '.join(items)})"
+        if isinstance(value, (set, frozenset)):
+            # Set order depends on the hash seed, so elements are sorted
+            return f"{type(value).__name__}({', '.join(sorted(map(describe, value)))})"
+        if isinstance(value, types.FunctionType) and _is_project_code(value):
+            visit(value)
+            return f"{value.__module__}.{value.__qualname__}"
+        if isinstance(value, type) and _is_project_code(value):
+            if value not in seen:
+                seen.add(value)
+                digest.update(inspect.getsource(value).encode())
+            return f"{value.__module__}.{value.__qualname__}"
+        if is_dataclass(value):
+            arguments = (
+                f"{field.name}={describe(getattr(value, field.name))}"
+                for field in fields(value)
+            )
+            return f"{describe(type(value))}({', '.join(arguments)})"
+        if callable(value) and hasattr(value, "__qualname__"):
+            return f"{getattr(value, '__module__', None)}.{value.__qualname__}"
+        if _MEMORY_ADDRESS.search(description := repr(value)):
+            raise TypeError(
+                f"Cannot digest {description} the same way in every process"
+            )
+        return description
+
+    visit(func)
+    return digest.hexdigest()
+
+
+def _is_project_code(value: Any) -> bool:
+    return (getattr(value, "__module__", None) or "").startswith("sf_permits")
+
+
+def _referenced_names(code: types.CodeType) -> set[str]:
+    names = set(code.co_names)
+    for constant in code.co_consts:
+        if isinstance(constant, types.CodeType):
+            names |= _referenced_names(constant)
+    return names
+
+
+def _param_digest(value: Any) -> str:
+    if isinstance(value, Path):
+        return file_digest(value)
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+def stage_keys(stages: list[Stage], skip: set[str] = frozenset()) -> list[str]:
+    """
+    Compute the checkpoint key of each stage.
+
+    Each key chains the key of the previous stage with the stage name,
+    parameters, references and code, so it identifies the output of the
+    stage without looking at any data.
+    """
+    keys = []
+    previous = ""
+    for stage in stages:
+        digest = hashlib.sha256(previous.encode())
+        digest.update(stage.name.encode())
+        if stage.name in skip:
+            digest.update(b"skipped")
+        else:
+            for name, value in sorted(stage.params.items()):
+                digest.update(f"{name}={_param_digest(value)}".encode())
+            for path in stage.references:
+                digest.update(file_digest(path).encode())
+            digest.update(code_digest(stage.func).encode())
+        previous = digest.hexdigest()
+        keys.append(previous)
+    return keys
+
+
+def checkpoint_path(
+    checkpoint_dir: Path, position: int, stage: Stage, key: str
+) -> Path:
+    return checkpoint_dir / f"{position:02d}-{stage.name}-{key[:16]}.parquet"
+
+
+def run_pipeline(
+    stages: list[Stage],
+    checkpoint_dir: Path = CHECKPOINT_DIR,
+    force: set[str] = frozenset(),
+    skip: set[str] = frozenset(),
+    profile_stage: str | None = None,
+    profile_path: Path | None = None,
+    count_changes: bool = False,
+) -> tuple[pd.DataFrame, list[StageReport]]:
+    """
+    Run `stages` in order, resuming from the last valid checkpoint.
+
+    Stages in `force` and all stages after them are rerun even if
+    checkpointed, while stages in `skip` pass their input through.
+    The output of every stage which is run is checkpointed as Parquet
+    in `checkpoint_dir`, replacing older checkpoints of that stage.
+
+    Returns the output of the last stage and a report on each stage.
+    If `profile_stage` is run, its profile is saved to `profile_path`
+    with the extension of the profiler appended. Cells changed by each
+    stage are only counted if `count_changes`.
+    """
+    names = [stage.name for stage in stages]
+    if unknown := (set(force) | set(skip) | {profile_stage} - {None}) - set(names):
+        raise ValueError(f"Unknown stages {sorted(unknown)}, expected one of {names}")
+    if stages[0].name in skip:
+        raise ValueError(f"The first stage {stages[0].name} cannot be skipped")
+
+    keys = stage_keys(stages, skip)
+    paths = [
+        checkpoint_path(checkpoint_dir, position, stage, key)
+        for position, (stage, key) in enumerate(zip(stages, keys))
+    ]
+    start = _resume_position(stages, paths, force)
+
+    df = None
+    reports = [StageReport(name, "checkpoint") for name in names[:start]]
+    if start > 0:
+        logger.info("Resuming from checkpoint of stage {}", names[start - 1])
+        df, reports[-1] = measure_stage(
+            names[start - 1], lambda: read_parquet(paths[start - 1]), None
+        )
+        reports[-1].status = "checkpoint"
+
+    checkpoint_dir.mkdir(parents=True, exist_ok=True)
+    for position in range(start, len(stages)):
+        stage = stages[position]
+        if stage.name in skip:
+            logger.warning("Skipping stage {}", stage.name)
+            reports.append(StageReport(stage.name, "skipped"))
+        else:
+            logger.info("Running stage {}", stage.name)
+            required = {}
+            for argument, (name, columns) in stage.requires.items():
+                if name in skip:
+                    raise ValueError(f"Stage {stage.name} requires skipped {name}")
+                required[argument] = read_parquet(paths[names.index(name)], columns)
+            arguments = {**stage.params, **stage.options, **required}
+            df, report = measure_stage(
+                stage.name,
+                partial(stage.func, **arguments)
+                if df is None
+                else partial(stage.func, df, **arguments),
+                df,
+                profile_path if stage.name == profile_stage else None,
+                count_changes,
+            )
+            reports.append(report)
+        _save_checkpoint(df, paths[position], stage)
+    return df, reports
+
+
+def _resume_position(stages: list[Stage], paths: list[Path], force: set[str]) -> int:
+    """Position of the first stage to run, after the last usable checkpoint."""
+    names = [stage.name for stage in stages]
+    first_forced = min((names.index(name) for name in force), default=len(stages))
+    for start in range(first_forced, 0, -1):
+        if not paths[start - 1].exists():
+            continue
+        # Stages which are not rerun must have left their checkpoints behind
+        # for the stages which require them
+        required = [
+            names.index(name)
+            for stage in stages[start:]
+            for name, _ in stage.requires.values()
+        ]
+        if all(position >= start or paths[position].exists() for position in required):
+            return start
+    return 0
+
+
+def _save_checkpoint(df: pd.DataFrame, path: Path, stage: Stage) -> None:
+    for previous in path.parent.glob(f"{path.name[:2]}-{stage.name}-*.parquet"):
+        if previous != path:
+            logger.debug("Removing outdated checkpoint {}", previous)
+            previous.unlink()
+    logger.debug("Saving checkpoint of stage {} to {}", stage.name, path)
+    df.to_parquet(path)
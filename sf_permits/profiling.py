@@ -1,45 +1,312 @@
+from collections.abc import Callable, Iterable
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+from functools import cached_property
 import json
-from typing import Callable, TypeVar
 from pathlib import Path
+from typing import Any, Self, TypeVar
 
 import numpy as np
 import pandas as pd
 import typer
-from tqdm import tqdm
 
 from sf_permits.config import PROFILING_DATA_DIR, RAW_DATA_DIR, logger
+from sf_permits.dataset import (
+    DEFAULT_BLOCK_SIZE,
+    from_arrow_buffer,
+    infer_permit_dtypes,
+    iter_permits,
+    load_permits,
+    to_arrow_buffer,
+)
+from sf_permits.utils.sketches import (
+    CoMoments,
+    HeavyHitters,
+    HyperLogLog,
+    Moments,
+    TDigest,
+    hash_values,
+    quantiles_from_counts,
+)
+
+# Distinct values tracked per attribute when profiling in chunks
+DEFAULT_SKETCH_CAPACITY = 100_000
+APPROXIMATE_SKETCH_CAPACITY = 1_000
+DESCRIBE_QUANTILES = [0.25, 0.5, 0.75]
+_QUANTILE_LABELS = ["25%", "50%", "75%"]
+
+
+class ColumnStatistics:
+    """
+    Intermediate results shared by the metrics of a single attribute.
+
+    Each statistic is computed on first access and cached, so every
+    metric derived from it reuses the same pass over the column.
+    """
+
+    def __init__(self, series: pd.Series):
+        self.series = series
+
+    @property
+    def name(self) -> str:
+        return self.series.name
+
+    @property
+    def dtype(self):
+        return self.series.dtype
+
+    @cached_property
+    def size(self) -> int:
+        return len(self.series)
+
+    @cached_property
+    def null_count(self) -> int:
+        return int(self.series.isna().sum())
+
+    @property
+    def non_null_count(self) -> int:
+        return self.size - self.null_count
+
+    @cached_property
+    def value_counts(self) -> pd.Series:
+        """Frequency of each non-null value, most common first."""
+        return self.series.value_counts(sort=True, ascending=False, dropna=True)
+
+    @property
+    def distinct_count(self) -> int:
+        return len(self.value_counts)
+
+    @property
+    def untracked_count(self) -> int:
+        """Number of non-null values missing from `value_counts`."""
+        return 0
+
+    @property
+    def count_error(self) -> int:
+        """Upper bound on how much each of `value_counts` is underestimated."""
+        return 0
+
+    @property
+    def distinct_count_error(self) -> float:
+        """Standard error of `distinct_count`."""
+        return 0.0
+
+    @cached_property
+    def description(self) -> pd.Series:
+        return self.series.describe()
+
+    @property
+    def quantile_errors(self) -> dict[str, float] | None:
+        """Rank error of the quantiles in `description`, if approximate."""
+        return None
+
+
+class TableStatistics:
+    """
+    Intermediate results shared by the metrics of the entire dataset.
+
+    Null counts are taken from the column statistics, if available,
+    instead of scanning the dataset again.
+    """
+
+    def __init__(self, df: pd.DataFrame, null_counts: dict[str, int] | None = None):
+        self.df = df
+        self.null_counts = null_counts
+
+    @property
+    def dtypes(self) -> pd.Series:
+        return self.df.dtypes
+
+    @cached_property
+    def inferred_dtypes(self) -> pd.Series:
+        return self.df.convert_dtypes().dtypes
+
+    @cached_property
+    def correlation(self) -> pd.DataFrame:
+        return self.df.corr(numeric_only=True)
+
+    @cached_property
+    def row_counts(self) -> pd.Series:
+        """Frequency of each tuple without missing values, most common first."""
+        return self.df.value_counts(sort=True, ascending=False)
+
+    @property
+    def complete_count(self) -> int:
+        """Number of tuples without missing values."""
+        return int(self.row_counts.sum())
+
+    @property
+    def distinct_row_count(self) -> int:
+        return len(self.row_counts)
+
+    @property
+    def row_count_error(self) -> int:
+        """Upper bound on how much each of `row_counts` is underestimated."""
+        return 0
 
+    @property
+    def distinct_row_count_error(self) -> float:
+        """Standard error of `distinct_row_count`."""
+        return 0.0
 
-def original_dtypes(df: pd.DataFrame) -> dict:
-    return df.dtypes.astype("string").to_dict()
+    @cached_property
+    def size(self) -> int:
+        return int(np.prod(self.df.shape))
 
+    @cached_property
+    def null_count(self) -> int:
+        if self.null_counts is None:
+            return int(self.df.isna().sum().sum())
+        return sum(self.null_counts.values())
 
-def inferred_dtypes(df: pd.DataFrame) -> dict:
-    return df.convert_dtypes().dtypes.astype("string").to_dict()
 
+TABLE_METRICS: dict[str, Callable[[TableStatistics], Any]] = {}
+SERIES_METRICS: dict[str, Callable[[ColumnStatistics], Any]] = {}
+# Error bounds of metrics computed from approximate statistics,
+# which return None if the statistics they depend on are exact
+TABLE_ERROR_BOUNDS: dict[str, Callable[[TableStatistics], Any]] = {}
+SERIES_ERROR_BOUNDS: dict[str, Callable[[ColumnStatistics], Any]] = {}
 
-def correlation(df: pd.DataFrame) -> dict:
-    return df.corr(numeric_only=True).to_dict()
 
+def table_metric(name: str) -> Callable:
+    """Decorator to register a metric computed over the entire dataset."""
 
-def size(input_: pd.Series | pd.DataFrame) -> np.ndarray:
-    return np.prod(input_.shape)
+    def register(func: Callable[[TableStatistics], Any]):
+        TABLE_METRICS[name] = func
+        return func
 
+    return register
 
-def duplication(input_: pd.Series | pd.DataFrame) -> int | None:
+
+def series_metric(name: str) -> Callable:
+    """Decorator to register a metric computed over each attribute."""
+
+    def register(func: Callable[[ColumnStatistics], Any]):
+        SERIES_METRICS[name] = func
+        return func
+
+    return register
+
+
+def table_error_bound(name: str) -> Callable:
+    """Decorator to register the error bound of a table metric."""
+
+    def register(func: Callable[[TableStatistics], Any]):
+        TABLE_ERROR_BOUNDS[name] = func
+        return func
+
+    return register
+
+
+def series_error_bound(name: str) -> Callable:
+    """Decorator to register the error bound of a series metric."""
+
+    def register(func: Callable[[ColumnStatistics], Any]):
+        SERIES_ERROR_BOUNDS[name] = func
+        return func
+
+    return register
+
+
+def metric_names() -> list[str]:
+    return sorted(TABLE_METRICS.keys() | SERIES_METRICS.keys())
+
+
+@table_metric("original_dtypes")
+def original_dtypes(table: TableStatistics) -> dict:
+    return table.dtypes.astype("string").to_dict()
+
+
+@table_metric("inferred_dtypes")
+def inferred_dtypes(table: TableStatistics) -> dict:
+    return table.inferred_dtypes.astype("string").to_dict()
+
+
+@table_metric("correlation")
+def correlation(table: TableStatistics) -> dict:
+    return table.correlation.to_dict()
+
+
+@table_metric("duplication")
+def table_duplication(table: TableStatistics) -> float | None:
     """Assess number of duplicated tuples."""
-    input_ = input_.dropna()
-    if input_.empty:
+    if table.complete_count == 0:
+        return None
+    duplicate_count = table.complete_count - table.distinct_row_count
+    return duplicate_count / (table.complete_count * len(table.dtypes))
+
+
+@table_error_bound("duplication")
+def table_duplication_error(table: TableStatistics) -> float | None:
+    if table.distinct_row_count_error == 0:
         return None
-    return (input_.duplicated().sum() / size(input_)).item()
+    return table.distinct_row_count_error / (table.complete_count * len(table.dtypes))
 
 
-def completeness(input_: pd.Series | pd.DataFrame) -> int:
+@series_metric("duplication")
+def duplication(column: ColumnStatistics) -> float | None:
+    """Assess number of duplicated values."""
+    if column.non_null_count == 0:
+        return None
+    duplicate_count = column.non_null_count - column.distinct_count
+    return duplicate_count / column.non_null_count
+
+
+@series_error_bound("duplication")
+def duplication_error(column: ColumnStatistics) -> float | None:
+    if column.distinct_count_error == 0:
+        return None
+    return column.distinct_count_error / column.non_null_count
+
+
+@table_metric("completeness")
+def table_completeness(table: TableStatistics) -> float:
+    """Assess number of missing values."""
+    return 1 - table.null_count / table.size
+
+
+@series_metric("completeness")
+def completeness(column: ColumnStatistics) -> float:
     """Assess number of missing values."""
-    return 1 - (input_.isna().sum().sum() / size(input_)).item()
+    return 1 - column.null_count / column.size
+
+
+def _interestingness(value_counts: pd.Series) -> float | None:
+    if value_counts.empty:
+        return None
+    return float(value_counts.iloc[0] / value_counts.iloc[-1])
 
 
-def interestingness(input_: pd.Series | pd.DataFrame) -> float | None:
+def _interestingness_error(
+    value_counts: pd.Series, count_error: int
+) -> dict[str, float] | None:
+    """
+    Bound the frequency ratio given how much counts may be underestimated.
+
+    Values which are not tracked may be as infrequent as a single
+    occurrence, which gives the upper bound.
+    """
+    if count_error == 0 or value_counts.empty:
+        return None
+    return {
+        "lower": float(value_counts.iloc[0] / (value_counts.iloc[-1] + count_error)),
+        "upper": float(value_counts.iloc[0] + count_error),
+    }
+
+
+@table_metric("interestingness")
+def table_interestingness(table: TableStatistics) -> float | None:
+    # TODO Investigate why `df.value_counts()` returns an empty Series
+    return _interestingness(table.row_counts)
+
+
+@table_error_bound("interestingness")
+def table_interestingness_error(table: TableStatistics) -> dict[str, float] | None:
+    return _interestingness_error(table.row_counts, table.row_count_error)
+
+
+@series_metric("interestingness")
+def interestingness(column: ColumnStatistics) -> float | None:
     """
     Assess variability of attribute.
 
@@ -47,64 +314,612 @@ def interestingness(input_: pd.Series | pd.DataFrame) -> float | None:
     of the most common value and the frequency of the least
     common value.
     """
-    value_counts = input_.value_counts(sort=True, ascending=False)
-    # TODO Investigate why `df.value_counts()` returns an empty Series
-    if value_counts.empty:
-        return None
-    return (value_counts.iloc[0] / value_counts.iloc[-1]).item()
+    return _interestingness(column.value_counts)
 
 
-def uniqueness(series: pd.Series, cutoff: int = 9) -> dict[str, int]:
+@series_error_bound("interestingness")
+def interestingness_error(column: ColumnStatistics) -> dict[str, float] | None:
+    return _interestingness_error(column.value_counts, column.count_error)
+
+
+@series_metric("uniqueness")
+def uniqueness(column: ColumnStatistics, cutoff: int = 9) -> dict[str, int]:
     """Assess number of unique values."""
-    counts = series.value_counts(
-        normalize=True, sort=True, ascending=False, dropna=True
-    )
+    counts = column.value_counts / column.non_null_count
     other_count = counts.iloc[cutoff:].sum()
+    if column.untracked_count:
+        other_count += column.untracked_count / column.non_null_count
     counts = counts.iloc[:cutoff]
     counts["other"] = other_count
     return counts.to_dict()
 
 
+@series_error_bound("uniqueness")
+def uniqueness_error(column: ColumnStatistics) -> float | None:
+    """Bound the error of each frequency in `uniqueness`."""
+    if column.count_error == 0:
+        return None
+    return column.count_error / column.non_null_count
+
+
 T = TypeVar("T")
 
 
 def numeric_guard(func: Callable[..., T]) -> T | None:
     """Decorator to check if attribute is numeric."""
 
-    def wrapper(series: pd.Series, *args, **kwargs):
-        if not pd.api.types.is_numeric_dtype(series.dtype):
-            logger.warning(f"Attribute {series.name} is not numeric.")
+    def wrapper(column: ColumnStatistics, *args, **kwargs):
+        if not pd.api.types.is_numeric_dtype(column.dtype):
+            logger.warning(f"Attribute {column.name} is not numeric.")
             return None
-        return func(series, *args, **kwargs)
+        return func(column, *args, **kwargs)
 
     wrapper.__name__ = func.__name__
     return wrapper
 
 
+@series_metric("distribution")
 @numeric_guard
-def distribution(series: pd.Series) -> dict[str, float]:
+def distribution(column: ColumnStatistics) -> dict[str, float]:
     """Assess distribution of numeric attribute."""
-    return series.describe().to_dict()
+    return column.description.to_dict()
+
+
+@series_error_bound("distribution")
+def distribution_error(column: ColumnStatistics) -> dict[str, float] | None:
+    return column.quantile_errors
 
 
-DATAFRAME_METRICS = {
-    original_dtypes,
-    inferred_dtypes,
-    correlation,
-    duplication,
-    completeness,
-    interestingness,
-}
+def _evaluate(metrics: dict[str, Callable], statistics) -> dict[str, Any]:
+    results = {}
+    for name, metric in metrics.items():
+        if (result := metric(statistics)) is not None:
+            results[name] = result
+    return results
 
-SERIES_METRICS = {
-    duplication,
-    completeness,
-    interestingness,
-    uniqueness,
-    distribution,
-}
 
-ALL_METRICS = DATAFRAME_METRICS | SERIES_METRICS
+def profile_attribute(column: ColumnStatistics) -> dict[str, Any]:
+    """Compute every series metric over an attribute, skipping empty results."""
+    return _evaluate(SERIES_METRICS, column)
+
+
+def profile_column(series: pd.Series) -> tuple[dict[str, Any], int]:
+    """
+    Compute every series metric over a single attribute.
+
+    Returns the non-null results by metric name and the null count
+    of the attribute, which is reused by the table metrics.
+    """
+    logger.debug("Computing over attribute {}", series.name)
+    column = ColumnStatistics(series)
+    return profile_attribute(column), column.null_count
+
+
+def _profile_column_in_worker(column) -> tuple[dict[str, Any], int]:
+    if not isinstance(column, pd.Series):
+        column = from_arrow_buffer(column).iloc[:, 0]
+    return profile_column(column)
+
+
+def _column_payload(series: pd.Series):
+    # Columns of Python objects may mix types, which Arrow cannot store,
+    # and would come back as Arrow strings, so they are pickled instead
+    if pd.api.types.is_object_dtype(series.dtype):
+        return series
+    return to_arrow_buffer(series.to_frame())
+
+
+def profile_table(table: TableStatistics) -> dict[str, Any]:
+    """Compute every table metric, skipping empty results."""
+    results = {}
+    for name in sorted(TABLE_METRICS):
+        logger.debug("Computing metric {} over entire dataset", name)
+        if (result := TABLE_METRICS[name](table)) is not None:
+            results[name] = result
+    return results
+
+
+def _report(
+    table_results: dict[str, Any],
+    attribute_results: dict[str, dict],
+    table_errors: dict[str, Any] | None = None,
+    attribute_errors: dict[str, dict] | None = None,
+) -> dict[str, dict]:
+    table_errors = table_errors or {}
+    attribute_errors = attribute_errors or {}
+    report = {}
+    for name in metric_names():
+        result = {}
+        if name in table_results:
+            result["table"] = table_results[name]
+        if name in SERIES_METRICS:
+            result["attributes"] = attribute_results[name]
+        errors = {}
+        if name in table_errors:
+            errors["table"] = table_errors[name]
+        if attribute_errors.get(name):
+            errors["attributes"] = attribute_errors[name]
+        if errors:
+            result["errors"] = errors
+        report[name] = result
+    return report
+
+
+def profile(df: pd.DataFrame, workers: int = 1) -> dict[str, dict]:
+    """
+    Compute every registered metric, making a single pass per attribute.
+
+    With more than one worker, each typed attribute is sent to a process
+    pool as an Arrow buffer and the table metrics are computed in this process
+    while the attributes are profiled. Results are collected in column
+    order, so the report is the same as in a serial run.
+    """
+    from tqdm import tqdm
+
+    attribute_results = {name: {} for name in SERIES_METRICS}
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(_profile_column_in_worker, _column_payload(df[column]))
+                for column in df.columns
+            ]
+            # Column null counts are not available yet, so completeness
+            # is computed from the table itself
+            table_results = profile_table(TableStatistics(df))
+            for column, future in tqdm(
+                zip(df.columns, futures), total=len(futures), desc="Attribute"
+            ):
+                results, _ = future.result()
+                for name, result in results.items():
+                    attribute_results[name][column] = result
+    else:
+        null_counts = {}
+        for column in tqdm(df.columns, desc="Attribute"):
+            results, null_counts[column] = profile_column(df[column])
+            for name, result in results.items():
+                attribute_results[name][column] = result
+        table_results = profile_table(TableStatistics(df, null_counts))
+
+    return _report(table_results, attribute_results)
+
+
+class ColumnState(ColumnStatistics):
+    """
+    Mergeable statistics of an attribute, built from chunks of it.
+
+    Value counts are kept in a heavy hitters summary, so they and the
+    metrics derived from them are only exact while the attribute has
+    at most `capacity` distinct values. A HyperLogLog of the distinct
+    values estimates their number beyond that, and approximate states
+    also keep a t-digest of numeric values to estimate quantiles.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        dtype: str,
+        size: int = 0,
+        null_count: int = 0,
+        heavy_hitters: HeavyHitters | None = None,
+        moments: Moments | None = None,
+        distinct: HyperLogLog | None = None,
+        digest: TDigest | None = None,
+    ):
+        self._name = name
+        self._dtype = dtype
+        self.size = size
+        self.null_count = null_count
+        self.heavy_hitters = HeavyHitters() if heavy_hitters is None else heavy_hitters
+        self.moments = moments
+        self.distinct = distinct
+        self.digest = digest
+
+    @classmethod
+    def from_series(
+        cls,
+        series: pd.Series,
+        capacity: int | None = DEFAULT_SKETCH_CAPACITY,
+        approximate: bool = False,
+    ) -> Self:
+        values = series.dropna()
+        numeric = pd.api.types.is_numeric_dtype(series.dtype)
+        moments = digest = None
+        if numeric:
+            moments = Moments.from_values(values.to_numpy(dtype=float))
+            if approximate:
+                digest = TDigest().update(values.to_numpy(dtype=float))
+        # Distinct values are tracked in exact states too, since
+        # they may have more than `capacity` of them
+        distinct = HyperLogLog().update(hash_values(values))
+        return cls(
+            series.name,
+            str(series.dtype),
+            len(series),
+            len(series) - len(values),
+            HeavyHitters(capacity).update(values),
+            moments,
+            distinct,
+            digest,
+        )
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def dtype(self):
+        return pd.api.types.pandas_dtype(self._dtype)
+
+    @property
+    def value_counts(self) -> pd.Series:
+        return self.heavy_hitters.counts
+
+    @property
+    def distinct_count(self) -> int:
+        if self.heavy_hitters.exact:
+            return len(self.value_counts)
+        if self.distinct is None:
+            # States saved before distinct values were always tracked
+            logger.warning(
+                "Attribute {} has more distinct values than tracked, "
+                "its distinct count is underestimated",
+                self.name,
+            )
+            return len(self.value_counts)
+        estimate = round(self.distinct.estimate())
+        return min(max(estimate, len(self.value_counts)), self.non_null_count)
+
+    @property
+    def untracked_count(self) -> int:
+        return self.non_null_count - int(self.value_counts.sum())
+
+    @property
+    def count_error(self) -> int:
+        return self.heavy_hitters.error
+
+    @property
+    def distinct_count_error(self) -> float:
+        if self.heavy_hitters.exact or self.distinct is None:
+            return 0.0
+        return self.distinct_count * self.distinct.relative_error
+
+    @property
+    def description(self) -> pd.Series:
+        moments = self.moments
+        quantiles = [np.nan] * len(DESCRIBE_QUANTILES)
+        if moments.count > 0:
+            if self.heavy_hitters.exact:
+                quantiles = quantiles_from_counts(self.value_counts, DESCRIBE_QUANTILES)
+            elif self.digest is not None:
+                quantiles = self.digest.quantiles(DESCRIBE_QUANTILES)
+            else:
+                logger.warning("Quantiles of attribute {} are not exact", self.name)
+        else:
+            moments = Moments(minimum=np.nan, maximum=np.nan, mean=np.nan)
+        return pd.Series(
+            [
+                float(moments.count),
+                moments.mean,
+                np.sqrt(moments.variance),
+                moments.minimum,
+                *quantiles,
+                moments.maximum,
+            ],
+            index=["count", "mean", "std", "min", *_QUANTILE_LABELS, "max"],
+        )
+
+    @property
+    def quantile_errors(self) -> dict[str, float] | None:
+        if self.heavy_hitters.exact or self.digest is None or not self.digest.count:
+            return None
+        return dict(zip(_QUANTILE_LABELS, self.digest.rank_errors(DESCRIBE_QUANTILES)))
+
+    def merge(self, other: Self) -> Self:
+        self.size += other.size
+        self.null_count += other.null_count
+        self.heavy_hitters.merge(other.heavy_hitters)
+        if self.moments is not None:
+            self.moments.merge(other.moments)
+        if self.distinct is None or other.distinct is None:
+            self.distinct = None
+        else:
+            self.distinct.merge(other.distinct)
+        if self.digest is not None:
+            self.digest.merge(other.digest)
+        return self
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "dtype": self._dtype,
+            "size": self.size,
+            "null_count": self.null_count,
+            "heavy_hitters": self.heavy_hitters.to_dict(),
+            "moments": None if self.moments is None else asdict(self.moments),
+            "distinct": None if self.distinct is None else self.distinct.to_dict(),
+            "digest": None if self.digest is None else self.digest.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict) -> Self:
+        return cls(
+            state["name"],
+            state["dtype"],
+            state["size"],
+            state["null_count"],
+            HeavyHitters.from_dict(state["heavy_hitters"]),
+            None if state["moments"] is None else Moments(**state["moments"]),
+            None
+            if state["distinct"] is None
+            else HyperLogLog.from_dict(state["distinct"]),
+            None if state["digest"] is None else TDigest.from_dict(state["digest"]),
+        )
+
+
+class TableState(TableStatistics):
+    """
+    Mergeable statistics of the entire dataset, built from chunks of it.
+
+    Tuples without missing values are counted by their hash, while
+    pairwise co-moments of the numeric attributes give the correlation.
+    Approximate states only track the most frequent tuples and estimate
+    the number of distinct ones with a HyperLogLog.
+    """
+
+    def __init__(
+        self,
+        dtypes: dict[str, str],
+        row_count: int = 0,
+        inferred: dict[str, list[str]] | None = None,
+        comoments: CoMoments | None = None,
+        row_hashes: HeavyHitters | None = None,
+        complete_count: int = 0,
+        distinct_rows: HyperLogLog | None = None,
+    ):
+        self._dtypes = dtypes
+        self.row_count = row_count
+        self.inferred = (
+            {column: [] for column in dtypes} if inferred is None else inferred
+        )
+        self.comoments = CoMoments([]) if comoments is None else comoments
+        self.row_hashes = HeavyHitters() if row_hashes is None else row_hashes
+        self._complete_count = complete_count
+        self.distinct_rows = distinct_rows
+        self.null_counts = {}
+
+    @classmethod
+    def from_frame(
+        cls,
+        df: pd.DataFrame,
+        capacity: int | None = None,
+        approximate: bool = False,
+    ) -> Self:
+        numeric = [
+            column
+            for column in df.columns
+            if pd.api.types.is_numeric_dtype(df[column].dtype)
+        ]
+        row_hashes = hash_values(df.dropna())
+        return cls(
+            df.dtypes.astype("string").to_dict(),
+            len(df),
+            {
+                column: [str(dtype)]
+                for column, dtype in df.convert_dtypes().dtypes.items()
+            },
+            CoMoments.from_frame(df[numeric]),
+            HeavyHitters(capacity).update(pd.Series(row_hashes)),
+            len(row_hashes),
+            HyperLogLog().update(row_hashes) if approximate else None,
+        )
+
+    @property
+    def dtypes(self) -> pd.Series:
+        return pd.Series(self._dtypes, dtype="string")
+
+    @property
+    def inferred_dtypes(self) -> pd.Series:
+        return pd.Series(
+            {
+                column: _common_dtype(dtypes, self._dtypes[column])
+                for column, dtypes in self.inferred.items()
+            },
+            dtype="string",
+        )
+
+    @property
+    def correlation(self) -> pd.DataFrame:
+        return self.comoments.correlation()
+
+    @property
+    def row_counts(self) -> pd.Series:
+        return self.row_hashes.counts
+
+    @property
+    def complete_count(self) -> int:
+        return self._complete_count
+
+    @property
+    def distinct_row_count(self) -> int:
+        if self.row_hashes.exact or self.distinct_rows is None:
+            return len(self.row_counts)
+        estimate = round(self.distinct_rows.estimate())
+        return min(max(estimate, len(self.row_counts)), self.complete_count)
+
+    @property
+    def row_count_error(self) -> int:
+        return self.row_hashes.error
+
+    @property
+    def distinct_row_count_error(self) -> float:
+        if self.row_hashes.exact or self.distinct_rows is None:
+            return 0.0
+        return self.distinct_row_count * self.distinct_rows.relative_error
+
+    @property
+    def size(self) -> int:
+        return self.row_count * len(self._dtypes)
+
+    @property
+    def null_count(self) -> int:
+        return sum(self.null_counts.values())
+
+    def merge(self, other: Self) -> Self:
+        self.row_count += other.row_count
+        for column, dtypes in other.inferred.items():
+            self.inferred[column] = sorted(set(self.inferred[column]) | set(dtypes))
+        if not self.comoments.columns:
+            self.comoments = other.comoments
+        else:
+            self.comoments.merge(other.comoments)
+        self.row_hashes.merge(other.row_hashes)
+        self._complete_count += other.complete_count
+        if self.distinct_rows is not None:
+            self.distinct_rows.merge(other.distinct_rows)
+        return self
+
+    def to_dict(self) -> dict:
+        return {
+            "dtypes": self._dtypes,
+            "row_count": self.row_count,
+            "inferred": self.inferred,
+            "comoments": self.comoments.to_dict(),
+            "row_hashes": self.row_hashes.to_dict(),
+            "complete_count": self.complete_count,
+            "distinct_rows": None
+            if self.distinct_rows is None
+            else self.distinct_rows.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict) -> Self:
+        return cls(
+            state["dtypes"],
+            state["row_count"],
+            state["inferred"],
+            CoMoments.from_dict(state["comoments"]),
+            HeavyHitters.from_dict(state["row_hashes"]),
+            state["complete_count"],
+            None
+            if state["distinct_rows"] is None
+            else HyperLogLog.from_dict(state["distinct_rows"]),
+        )
+
+
+def _common_dtype(dtypes: list[str], original: str) -> str:
+    """Type which holds the values inferred as any of `dtypes` in some chunk."""
+    if len(dtypes) == 1:
+        return dtypes[0]
+    if set(dtypes) <= {"Int64", "Float64"}:
+        return "Float64"
+    return original
+
+
+class ProfileState:
+    """
+    Mergeable partial profile of a chunk, file or partition of the dataset.
+
+    States can be saved to JSON and merged later on, so that a new file
+    only needs to be profiled once to be included in the report.
+    """
+
+    def __init__(
+        self,
+        columns: dict[str, ColumnState] | None = None,
+        table: TableState | None = None,
+    ):
+        self.columns = {} if columns is None else columns
+        self.table = table
+
+    @classmethod
+    def from_frame(
+        cls,
+        df: pd.DataFrame,
+        capacity: int | None = DEFAULT_SKETCH_CAPACITY,
+        approximate: bool = False,
+    ) -> Self:
+        return cls(
+            {
+                column: ColumnState.from_series(df[column], capacity, approximate)
+                for column in df.columns
+            },
+            # Exact states count every complete tuple, as `df.value_counts` does
+            TableState.from_frame(df, capacity if approximate else None, approximate),
+        )
+
+    def merge(self, other: Self) -> Self:
+        if self.table is None:
+            self.columns, self.table = other.columns, other.table
+            return self
+        if list(self.columns) != list(other.columns):
+            raise ValueError("Cannot merge profiles of different attributes")
+        # Only approximate states estimate the number of distinct rows
+        if (self.table.distinct_rows is None) != (other.table.distinct_rows is None):
+            raise ValueError("Cannot merge exact and approximate profiles")
+        for column, state in other.columns.items():
+            self.columns[column].merge(state)
+        self.table.merge(other.table)
+        return self
+
+    def report(self) -> dict[str, dict]:
+        """
+        Compute every registered metric from the merged statistics.
+
+        Metrics computed from approximate statistics are reported
+        along with their error bounds.
+        """
+        attribute_results = {name: {} for name in SERIES_METRICS}
+        attribute_errors = {name: {} for name in SERIES_ERROR_BOUNDS}
+        for column, state in self.columns.items():
+            for name, result in profile_attribute(state).items():
+                attribute_results[name][column] = result
+            for name, error in _evaluate(SERIES_ERROR_BOUNDS, state).items():
+                attribute_errors[name][column] = error
+        self.table.null_counts = {
+            column: state.null_count for column, state in self.columns.items()
+        }
+        return _report(
+            profile_table(self.table),
+            attribute_results,
+            _evaluate(TABLE_ERROR_BOUNDS, self.table),
+            attribute_errors,
+        )
+
+    def save(self, path: Path) -> None:
+        logger.debug("Saving profile state to {}", path)
+        state = {
+            "columns": [state.to_dict() for state in self.columns.values()],
+            "table": self.table.to_dict(),
+        }
+        with path.open("w") as f:
+            json.dump(state, f)
+
+    @classmethod
+    def load(cls, path: Path) -> Self:
+        logger.debug("Loading profile state from {}", path)
+        with path.open() as f:
+            state = json.load(f)
+        columns = [ColumnState.from_dict(column) for column in state["columns"]]
+        return cls(
+            {column.name: column for column in columns},
+            TableState.from_dict(state["table"]),
+        )
+
+
+def profile_chunks(
+    chunks: Iterable[pd.DataFrame],
+    capacity: int | None = DEFAULT_SKETCH_CAPACITY,
+    approximate: bool = False,
+) -> ProfileState:
+    """Build the profile state of a dataset one chunk at a time."""
+    from tqdm import tqdm
+
+    state = ProfileState()
+    for chunk in tqdm(chunks, desc="Chunk"):
+        state.merge(ProfileState.from_frame(chunk, capacity, approximate))
+    return state
+
 
 app = typer.Typer()
 
@@ -113,29 +928,50 @@ app = typer.Typer()
 def main(
     input_path: Path = RAW_DATA_DIR / "building_permits.csv",
     output_dir: Path = PROFILING_DATA_DIR,
+    workers: int = 1,
+    chunked: bool = False,
+    approximate: bool = False,
+    block_size: int = DEFAULT_BLOCK_SIZE,
+    sketch_capacity: int | None = None,
+    state_path: Path | None = None,
+    previous_state: list[Path] | None = None,
 ):
+    """
+    Profile the dataset and save the results of each metric to `output_dir`.
+
+    Attributes are profiled with the types inferred from the whole raw
+    file, with dates as they are written, in both modes. In chunked mode,
+    the input is streamed in blocks of `block_size` bytes and summarised
+    into a mergeable state, which is saved to `state_path` if given.
+    States of previously profiled files are merged into the report with
+    `--previous-state`.
+
+    Approximate mode is chunked mode with bounded memory: only
+    `sketch_capacity` values are tracked per attribute and the
+    report includes the error bounds of approximate metrics.
+    """
     logger.info("Starting data profiling")
     logger.debug("Loading data from {} and saving to {}", input_path, output_dir)
-    df = pd.read_csv(input_path)
-
-    for metric in tqdm(ALL_METRICS, desc="Metric"):
-        metric_name = metric.__name__
-        logger.info("Computing metric {}", metric_name)
-        result = {}
-
-        if metric in DATAFRAME_METRICS:
-            logger.debug("Computing over entire dataset")
-            if (table_result := metric(df)) is not None:
-                result["table"] = table_result
-
-        if metric in SERIES_METRICS:
-            attribute_results = {}
-            for column in tqdm(df.columns, desc="Attribute"):
-                logger.debug("Computing over attribute {}", column)
-                if (attribute_result := metric(df[column])) is not None:
-                    attribute_results[column] = attribute_result
-            result["attributes"] = attribute_results
 
+    schema = infer_permit_dtypes(input_path, block_size)
+    if chunked or approximate or state_path is not None or previous_state:
+        if sketch_capacity is None:
+            sketch_capacity = (
+                APPROXIMATE_SKETCH_CAPACITY if approximate else DEFAULT_SKETCH_CAPACITY
+            )
+        chunks = iter_permits(input_path, block_size, schema=schema)
+        input_state = profile_chunks(chunks, sketch_capacity, approximate)
+        if state_path is not None:
+            input_state.save(state_path)
+        state = ProfileState()
+        for path in previous_state or []:
+            state.merge(ProfileState.load(path))
+        report = state.merge(input_state).report()
+    else:
+        df = load_permits(input_path, schema=schema)
+        report = profile(df, workers=workers)
+
+    for metric_name, result in report.items():
         output_path = output_dir / f"{metric_name}.json"
         if output_path.exists():
             logger.warning("File {} already exists, overwriting", output_path)
@@ -0,0 +1,99 @@
+from collections.abc import Callable
+import hashlib
+import json
+from pathlib import Path
+import sys
+
+import pandas as pd
+
+from sf_permits.config import REFERENCE_CACHE_DIR, logger
+from sf_permits.pipeline import code_digest, file_digest
+
+
+def source_fingerprint(path: Path) -> list[list]:
+    """Size and modification time of a file, or of every file in a directory."""
+    paths = sorted(path.rglob("*")) if path.is_dir() else [path]
+    return [
+        [file_path.relative_to(path).as_posix(), stat.st_size, stat.st_mtime_ns]
+        for file_path in paths
+        if file_path.is_file() and (stat := file_path.stat())
+    ]
+
+
+def load_reference(
+    source: Path,
+    build: Callable[[Path], dict[str, pd.DataFrame]],
+    cache_dir: Path = REFERENCE_CACHE_DIR,
+) -> dict[str, pd.DataFrame]:
+    """
+    Load the tables which `build` derives from external data in `source`.
+
+    Tables are cached as Parquet, or GeoParquet for geometry, and rebuilt
+    only if `source` or the code of `build` changed. Sources are first
+    compared by size and modification time, and only by contents if
+    those differ, so unchanged files are not read on warm runs.
+    """
+    entry_dir = cache_dir / _entry_name(source, build)
+    metadata_path = entry_dir / "metadata.json"
+    fingerprint = source_fingerprint(source)
+    version = code_digest(build)
+
+    metadata = None
+    if metadata_path.exists():
+        with metadata_path.open() as f:
+            metadata = json.load(f)
+    if metadata is not None and metadata["version"] == version:
+        if metadata["fingerprint"] == fingerprint:
+            return _read_tables(entry_dir, metadata["tables"])
+        if metadata["digest"] == file_digest(source):
+            logger.debug("{} was touched but not modified", source)
+            metadata["fingerprint"] = fingerprint
+            _write_metadata(metadata_path, metadata)
+            return _read_tables(entry_dir, metadata["tables"])
+
+    logger.info("Preparing reference data from {}", source)
+    tables = build(source)
+    entry_dir.mkdir(parents=True, exist_ok=True)
+    for name, table in tables.items():
+        table.to_parquet(entry_dir / f"{name}.parquet")
+    # Metadata is written last, so an interrupted build is not reused
+    _write_metadata(
+        metadata_path,
+        {
+            "source": str(source),
+            "version": version,
+            "fingerprint": fingerprint,
+            "digest": file_digest(source),
+            "tables": {name: _is_geometry(table) for name, table in tables.items()},
+        },
+    )
+    logger.debug("Cached reference data in {}", entry_dir)
+    return tables
+
+
+def _entry_name(source: Path, build: Callable) -> str:
+    path_digest = hashlib.sha256(str(source.resolve()).encode()).hexdigest()
+    return f"{source.stem}-{build.__name__}-{path_digest[:12]}"
+
+
+def _is_geometry(table: pd.DataFrame) -> bool:
+    # A table cannot hold geometry unless geopandas was imported to build it
+    gpd = sys.modules.get("geopandas")
+    return gpd is not None and isinstance(table, gpd.GeoDataFrame)
+
+
+def _read_tables(entry_dir: Path, tables: dict[str, bool]) -> dict[str, pd.DataFrame]:
+    logger.debug("Loading cached reference data from {}", entry_dir)
+    if any(tables.values()):
+        import geopandas as gpd
+    return {
+        name: (gpd.read_parquet if is_geometry else pd.read_parquet)(
+            entry_dir / f"{name}.parquet"
+        )
+        for name, is_geometry in tables.items()
+    }
+
+
+def _write_metadata(path: Path, metadata: dict) -> None:
+    with path.open("w") as f:
+        json.dump(metadata, f, indent=2)
@@ -0,0 +1,566 @@
+from collections.abc import Iterator
+from dataclasses import dataclass
+from pathlib import Path
+import shutil
+from typing import TYPE_CHECKING
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pyarrow import compute as pc
+from pyarrow import csv
+import typer
+
+from sf_permits.config import (
+    BENCHMARK_DATA_DIR,
+    NEIGHBOURHOOD_SHAPEFILE_PATH,
+    RAW_DATASET_FILENAME,
+    STREET_NAMES_PATH,
+    ZIP_CODE_SHAPEFILE_PATH,
+    logger,
+)
+from sf_permits.dataset import PERMIT_DTYPES
+
+if TYPE_CHECKING:
+    import geopandas as gpd
+
+app = typer.Typer()
+
+# Longitude and latitude bounds of San Francisco
+SF_BOUNDS = (-122.515, 37.708, -122.357, 37.833)
+NEIGHBOURHOOD_GRID_SHAPE = (6, 7)
+ZIP_CODE_GRID_SHAPE = (5, 6)
+SUPERVISOR_DISTRICT_COUNT = 11
+FIRST_DATE = pd.Timestamp("2013-01-01")
+DATE_RANGE_DAYS = 1882
+DEFAULT_CHUNK_ROWS = 500_000
+PERMITS_PER_BLOCK = 20
+LOTS_PER_BLOCK = 4
+MISSPELLINGS_PER_STREET = 4
+STREET_WORDS = [
+    "alemany", "arguello", "army", "bay", "bayshore", "broadway", "brotherhood",
+    "bush", "california", "castro", "cesar chavez", "church", "clay", "clement",
+    "columbus", "divisadero", "dolores", "ellis", "embarcadero", "fillmore",
+    "folsom", "fulton", "geary", "golden gate", "grant", "green", "guerrero",
+    "haight", "harrison", "hayes", "howard", "irving", "jackson", "judah",
+    "kearny", "la playa", "larkin", "lombard", "market", "masonic", "mission",
+    "noriega", "o'farrell", "ocean", "pacific", "pine", "polk", "portola",
+    "post", "potrero", "san bruno", "san jose", "sansome", "st. francis",
+    "stockton", "sutter", "taraval", "turk", "union", "valencia", "van ness",
+    "vicente", "washington", "yosemite",
+]  # fmt: skip
+STREET_TYPES = ["st", "ave", "blvd", "way", "ter", "ct", "dr", "pl", "ln", "rd"]
+MISSING_STREET_NAMES = ["unknown", "situs to be assigned"]
+PERMIT_TYPE_DEFINITIONS = {
+    1: "new construction",
+    2: "new construction wood frame",
+    3: "additions alterations or repairs",
+    4: "sign - erect",
+    5: "grade or quarry or fill or excavate",
+    6: "demolitions",
+    7: "wall or painted sign",
+    8: "otc alterations permit",
+}
+STATUSES = ["complete", "issued", "filed", "expired", "cancelled", "withdrawn"]
+STATUS_PROBABILITIES = [0.45, 0.3, 0.1, 0.08, 0.05, 0.02]
+USES = [
+    "1 family dwelling", "2 family dwelling", "apartments", "office",
+    "retail sales", "food/beverage hndlng", "warehouse,no frnitur", "vacant lot",
+]  # fmt: skip
+CONSTRUCTION_TYPES = {
+    1: "constr type 1",
+    2: "constr type 2",
+    3: "constr type 3",
+    4: "constr type 4",
+    5: "wood frame (5)",
+}
+DESCRIPTIONS = [
+    "reroofing", "kitchen remodel", "bathroom remodel", "street space",
+    "replace windows", "seismic upgrade", "new sign", "comply with nov",
+]  # fmt: skip
+
+
+@dataclass
+class SyntheticPaths:
+    """Files of a synthetic dataset, laid out as the real data directories."""
+
+    permits: Path
+    street_names: Path
+    neighbourhoods: Path
+    zip_codes: Path
+
+    @classmethod
+    def in_directory(cls, directory: Path) -> "SyntheticPaths":
+        return cls(
+            directory / RAW_DATASET_FILENAME,
+            directory / STREET_NAMES_PATH.name,
+            directory / NEIGHBOURHOOD_SHAPEFILE_PATH.name,
+            directory / ZIP_CODE_SHAPEFILE_PATH.name,
+        )
+
+    def exist(self) -> bool:
+        return all(
+            path.exists()
+            for path in (
+                self.permits,
+                self.street_names,
+                self.neighbourhoods,
+                self.zip_codes,
+            )
+        )
+
+
+def generate_street_names(streets: int, rng: np.random.Generator) -> pd.DataFrame:
+    """
+    Generate a street name table in the format of `street-names.csv`.
+
+    Names are ordinal numbers, words from `STREET_WORDS` and pairs of
+    them, as many as needed for `streets` distinct names. Some names
+    are shared by streets of different types, and some have a direction.
+    """
+    ordinals = [f"{i}{_ordinal_suffix(i)}" for i in range(1, 49)]
+    candidates = ordinals + STREET_WORDS
+    if streets > len(candidates):
+        first, second = np.meshgrid(STREET_WORDS, STREET_WORDS)
+        pairs = [f"{a} {b}" for a, b in zip(first.ravel(), second.ravel()) if a != b]
+        candidates += list(rng.permutation(pairs))
+    if streets > len(candidates):
+        raise ValueError(f"Cannot generate more than {len(candidates)} street names")
+    names = np.array(candidates[:streets], dtype=object)
+
+    # Some names are used by several streets, such as `19th st` and `19th ave`
+    shared = names[rng.random(streets) < 0.1]
+    names = np.concatenate([names, shared])
+    types = rng.choice(STREET_TYPES, len(names), p=_zipf_probabilities(10))
+    directions = np.where(
+        rng.random(len(names)) < 0.03, rng.choice(["n", "s"], len(names)), None
+    )
+    df = pd.DataFrame(
+        {
+            "CNN": np.arange(len(names)) + 100_000,
+            "StreetName": names,
+            "StreetType": types,
+            "PostDirection": directions,
+        }
+    ).drop_duplicates(["StreetName", "StreetType"], ignore_index=True)
+    df["FullStreetName"] = (
+        df["StreetName"]
+        + " "
+        + df["StreetType"]
+        + np.where(df["PostDirection"].isna(), "", " " + df["PostDirection"].fillna(""))
+    )
+    for column in ["StreetName", "StreetType", "PostDirection", "FullStreetName"]:
+        df[column] = df[column].str.upper()
+    return df[["CNN", "FullStreetName", "StreetName", "StreetType", "PostDirection"]]
+
+
+def _ordinal_suffix(number: int) -> str:
+    if 10 <= number % 100 <= 20:
+        return "th"
+    return {1: "st", 2: "nd", 3: "rd"}.get(number % 10, "th")
+
+
+def _zipf_probabilities(size: int, exponent: float = 1.1) -> np.ndarray:
+    weights = 1 / np.arange(1, size + 1) ** exponent
+    return weights / weights.sum()
+
+
+def misspell(name: str, rng: np.random.Generator) -> str:
+    """Apply a random deletion, insertion, substitution or transposition."""
+    position = int(rng.integers(len(name)))
+    letter = chr(int(rng.integers(ord("a"), ord("z") + 1)))
+    match rng.integers(4):
+        case 0 if len(name) > 3:
+            return name[:position] + name[position + 1 :]
+        case 1:
+            return name[:position] + letter + name[position:]
+        case 2:
+            return name[:position] + letter + name[position + 1 :]
+        case _ if position < len(name) - 1:
+            return (
+                name[:position]
+                + name[position + 1]
+                + name[position]
+                + name[position + 2 :]
+            )
+    return name + letter
+
+
+def grid_polygons(
+    shape: tuple[int, int],
+    label_column: str,
+    labels: list,
+    bounds: tuple[float, float, float, float] = SF_BOUNDS,
+) -> "gpd.GeoDataFrame":
+    """
+    Split `bounds` into a grid of `shape` rows and columns of rectangles.
+
+    Cells are numbered row by row from the south west corner and
+    labelled in that order, which `grid_cells` relies on.
+    """
+    import geopandas as gpd
+    from shapely.geometry import box
+
+    min_x, min_y, max_x, max_y = bounds
+    rows, columns = shape
+    width, height = (max_x - min_x) / columns, (max_y - min_y) / rows
+    polygons = [
+        box(
+            min_x + column * width,
+            min_y + row * height,
+            min_x + (column + 1) * width,
+            min_y + (row + 1) * height,
+        )
+        for row in range(rows)
+        for column in range(columns)
+    ]
+    return gpd.GeoDataFrame({label_column: labels}, geometry=polygons, crs="EPSG:4326")
+
+
+def grid_cells(
+    longitude: np.ndarray,
+    latitude: np.ndarray,
+    shape: tuple[int, int],
+    bounds: tuple[float, float, float, float] = SF_BOUNDS,
+) -> np.ndarray:
+    """Position in `grid_polygons` of the cell containing each point."""
+    min_x, min_y, max_x, max_y = bounds
+    rows, columns = shape
+    row = ((latitude - min_y) / (max_y - min_y) * rows).astype(int)
+    column = ((longitude - min_x) / (max_x - min_x) * columns).astype(int)
+    return np.clip(row, 0, rows - 1) * columns + np.clip(column, 0, columns - 1)
+
+
+def neighbourhood_names() -> list[str]:
+    return [
+        f"Neighbourhood {i:02d}"
+        for i in range(NEIGHBOURHOOD_GRID_SHAPE[0] * NEIGHBOURHOOD_GRID_SHAPE[1])
+    ]
+
+
+def zip_codes() -> list[str]:
+    return [
+        str(94100 + i) for i in range(ZIP_CODE_GRID_SHAPE[0] * ZIP_CODE_GRID_SHAPE[1])
+    ]
+
+
+@dataclass
+class _Blocks:
+    """Street and position of each block, shared by all chunks of permits."""
+
+    streets: np.ndarray
+    longitude: np.ndarray
+    latitude: np.ndarray
+
+
+def _generate_blocks(
+    count: int, street_df: pd.DataFrame, rng: np.random.Generator
+) -> _Blocks:
+    min_x, min_y, max_x, max_y = SF_BOUNDS
+    return _Blocks(
+        # Few streets have most of the permits
+        streets=rng.choice(
+            len(street_df), count, p=_zipf_probabilities(len(street_df), 0.8)
+        ),
+        longitude=rng.uniform(min_x, max_x, count),
+        latitude=rng.uniform(min_y, max_y, count),
+    )
+
+
+def iter_synthetic_permits(
+    rows: int,
+    street_df: pd.DataFrame,
+    seed: int = 0,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    misspelling_rate: float = 0.05,
+    missing_location_rate: float = 0.05,
+    error_rate: float = 0.02,
+) -> Iterator[pa.Table]:
+    """
+    Generate `rows` permits in tables of at most `chunk_rows` rows.
+
+    Permits are grouped in blocks of lots along streets of `street_df`,
+    and their locations lie within the grids of `grid_polygons`.
+    Street names are misspelled at `misspelling_rate` and locations
+    missing at `missing_location_rate`, while neighbourhoods, districts
+    and completion dates are wrong or missing at `error_rate`.
+    """
+    rng = np.random.default_rng(seed)
+    blocks = _generate_blocks(max(1, rows // PERMITS_PER_BLOCK), street_df, rng)
+    spellings = street_df["StreetName"].str.lower().to_numpy()
+    misspellings = np.array(
+        [
+            [misspell(name, rng).title() for _ in range(MISSPELLINGS_PER_STREET)]
+            for name in spellings
+        ],
+        dtype=object,
+    ).reshape(len(spellings), MISSPELLINGS_PER_STREET)
+    spellings = np.array([name.title() for name in spellings], dtype=object)
+    suffixes = street_df["StreetType"].str.title().to_numpy()
+    neighbourhoods = np.array(neighbourhood_names(), dtype=object)
+    districts = (
+        np.arange(len(neighbourhoods))
+        * SUPERVISOR_DISTRICT_COUNT
+        // len(neighbourhoods)
+        + 1
+    )
+    zip_code_values = np.array(zip_codes(), dtype=int)
+    dates = _date_strings()
+
+    for offset in range(0, rows, chunk_rows):
+        # Each chunk has its own stream, so chunks can be generated independently
+        chunk_rng = np.random.default_rng([seed, offset])
+        size = min(chunk_rows, rows - offset)
+        yield _generate_chunk(
+            offset,
+            size,
+            chunk_rng,
+            blocks,
+            spellings,
+            misspellings,
+            suffixes,
+            neighbourhoods,
+            districts,
+            zip_code_values,
+            dates,
+            misspelling_rate,
+            missing_location_rate,
+            error_rate,
+        )
+
+
+def _date_strings() -> np.ndarray:
+    """Every date in the generated range as text, followed by a missing date."""
+    days = pd.date_range(FIRST_DATE, periods=DATE_RANGE_DAYS + 2 * 365, freq="D")
+    return np.append(days.strftime(r"%m/%d/%Y").to_numpy(dtype=object), None)
+
+
+def _generate_chunk(
+    offset: int,
+    size: int,
+    rng: np.random.Generator,
+    blocks: _Blocks,
+    spellings: np.ndarray,
+    misspellings: np.ndarray,
+    suffixes: np.ndarray,
+    neighbourhoods: np.ndarray,
+    districts: np.ndarray,
+    zip_code_values: np.ndarray,
+    dates: np.ndarray,
+    misspelling_rate: float,
+    missing_location_rate: float,
+    error_rate: float,
+) -> pa.Table:
+    def missing(rate: float) -> np.ndarray:
+        return rng.random(size) < rate
+
+    def choice(values: list, missing_rate: float) -> pa.Array:
+        return pa.array(
+            np.asarray(values, dtype=object)[rng.integers(len(values), size=size)],
+            mask=missing(missing_rate),
+        )
+
+    def date_column(days: np.ndarray, mask: np.ndarray) -> pa.Array:
+        days = np.clip(days, 0, len(dates) - 2)
+        return pa.array(dates[np.where(mask, len(dates) - 1, days)], pa.string())
+
+    block = rng.integers(len(blocks.streets), size=size)
+    lot = rng.integers(LOTS_PER_BLOCK, size=size)
+    street = blocks.streets[block]
+
+    # Permits on the same lot are at about the same location
+    longitude = blocks.longitude[block] + lot * 1e-4 + rng.normal(0, 1e-5, size)
+    latitude = blocks.latitude[block] + lot * 1e-4 + rng.normal(0, 1e-5, size)
+    location = pc.binary_join_element_wise(
+        "(",
+        pc.cast(pa.array(latitude), pa.string()),
+        ", ",
+        pc.cast(pa.array(longitude), pa.string()),
+        ")",
+        "",
+    )
+    location = pc.if_else(pa.array(missing(missing_location_rate)), None, location)
+
+    street_names = spellings[street]
+    misspelled = missing(misspelling_rate)
+    street_names[misspelled] = misspellings[
+        street[misspelled], rng.integers(MISSPELLINGS_PER_STREET, size=misspelled.sum())
+    ]
+    unnamed = missing(error_rate / 4)
+    street_names[unnamed] = rng.choice(MISSING_STREET_NAMES, unnamed.sum())
+
+    neighbourhood = grid_cells(longitude, latitude, NEIGHBOURHOOD_GRID_SHAPE)
+    wrong_neighbourhood = missing(error_rate)
+    neighbourhood[wrong_neighbourhood] = rng.integers(
+        len(neighbourhoods), size=wrong_neighbourhood.sum()
+    )
+    zip_code = zip_code_values[grid_cells(longitude, latitude, ZIP_CODE_GRID_SHAPE)]
+
+    # Over-the-counter alterations are the most common permits by far
+    permit_type = rng.choice(
+        [8, 3, 2, 1, 4, 6, 7, 5], size, p=_zipf_probabilities(8, 2.5)
+    )
+    status = rng.choice(len(STATUSES), size, p=STATUS_PROBABILITIES)
+    complete = status == STATUSES.index("complete")
+    not_issued = np.isin(status, [STATUSES.index(s) for s in ("filed", "withdrawn")])
+
+    created = rng.integers(DATE_RANGE_DAYS, size=size)
+    issued = created + rng.exponential(30, size).astype(int)
+    completed = issued + rng.exponential(200, size).astype(int)
+    # Some permits which are not complete still have a completion date
+    has_completion = complete | missing(error_rate)
+
+    existing_stories = np.where(
+        np.isin(permit_type, [3, 4, 8]), rng.integers(1, 10, size), np.nan
+    )
+    construction_type = rng.integers(1, 6, size)
+    proposed_construction_type = rng.integers(1, 6, size)
+    construction_descriptions = np.array(
+        list(CONSTRUCTION_TYPES.values()), dtype=object
+    )
+    estimated_cost = np.round(rng.lognormal(9, 1.5, size), 2)
+
+    # A few permits are recorded more than once with the same number
+    permit_number = (offset + np.arange(size)) * 7 + 201300000000
+    repeated = missing(error_rate)
+    permit_number[repeated] = rng.choice(permit_number, repeated.sum())
+
+    columns = {
+        "Permit Number": pc.cast(pa.array(permit_number), pa.string()),
+        "Permit Type": pa.array(permit_type, pa.int64()),
+        "Permit Type Definition": pa.array(
+            [PERMIT_TYPE_DEFINITIONS[t] for t in range(1, 9)], pa.string()
+        ).take(pa.array(permit_type - 1)),
+        "Permit Creation Date": date_column(created, missing(0.0)),
+        "Block": pc.utf8_lpad(pc.cast(pa.array(block), pa.string()), 4, "0"),
+        "Lot": pc.utf8_lpad(pc.cast(pa.array(lot), pa.string()), 3, "0"),
+        "Street Number": pa.array(rng.integers(1, 4000, size), pa.int64()),
+        "Street Number Suffix": choice(["a", "b", "c"], 0.99),
+        "Street Name": pa.array(street_names, pa.string()),
+        "Street Suffix": pa.array(suffixes[street], mask=missing(error_rate)),
+        "Unit": pa.array(rng.integers(1, 50, size), pa.int64(), mask=missing(0.85)),
+        "Unit Suffix": choice(["a", "b"], 0.99),
+        "Description": choice(DESCRIPTIONS, 0.01),
+        "Current Status": pa.array(np.array(STATUSES, dtype=object)[status]),
+        "Current Status Date": date_column(
+            np.where(complete, completed, issued), missing(0.0)
+        ),
+        "Filed Date": date_column(created, missing(0.0)),
+        "Issued Date": date_column(issued, not_issued),
+        "Completed Date": date_column(completed, ~has_completion),
+        "First Construction Document Date": date_column(issued, not_issued),
+        "Structural Notification": choice(["Y"], 0.96),
+        "Number of Existing Stories": pa.array(
+            existing_stories, mask=np.isnan(existing_stories)
+        ),
+        "Number of Proposed Stories": pa.array(
+            existing_stories + rng.integers(0, 2, size),
+            mask=np.isnan(existing_stories),
+        ),
+        "Voluntary Soft-Story Retrofit": choice(["Y"], 0.99),
+        "Fire Only Permit": choice(["Y"], 0.9),
+        "Permit Expiration Date": date_column(issued + 360, not_issued),
+        "Estimated Cost": pa.array(estimated_cost, mask=missing(0.2)),
+        "Revised Cost": pa.array(estimated_cost * 1.1, mask=missing(0.05)),
+        "Existing Use": choice(USES, 0.2),
+        "Existing Units": pa.array(rng.integers(0, 10, size), pa.int64()),
+        "Proposed Use": choice(USES, 0.2),
+        "Proposed Units": pa.array(rng.integers(0, 10, size), pa.int64()),
+        "Plansets": pa.array(rng.integers(0, 3, size), pa.int64()),
+        "TIDF Compliance": choice(["Y", "N"], 0.99),
+        "Existing Construction Type": pa.array(
+            construction_type, pa.int64(), mask=missing(0.2)
+        ),
+        "Existing Construction Type Description": pa.array(
+            construction_descriptions[construction_type - 1], mask=missing(0.2)
+        ),
+        "Proposed Construction Type": pa.array(
+            proposed_construction_type, pa.int64(), mask=missing(0.2)
+        ),
+        "Proposed Construction Type Description": pa.array(
+            construction_descriptions[proposed_construction_type - 1],
+            mask=missing(0.2),
+        ),
+        "Site Permit": choice(["Y"], 0.97),
+        "Supervisor District": pa.array(
+            districts[neighbourhood], pa.int64(), mask=missing(error_rate)
+        ),
+        "Neighborhoods - Analysis Boundaries": pa.array(
+            neighbourhoods[neighbourhood], mask=missing(error_rate)
+        ),
+        "Zipcode": pa.array(zip_code, pa.int64(), mask=missing(error_rate)),
+        "Location": location,
+        "Record ID": pa.array(offset + np.arange(size) + 10**12, pa.int64()),
+    }
+    assert list(columns) == list(PERMIT_DTYPES)
+    return pa.table(columns)
+
+
+def write_synthetic_data(
+    output_dir: Path,
+    rows: int,
+    seed: int = 0,
+    streets: int = 1000,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+) -> SyntheticPaths:
+    """
+    Write synthetic permits and matching external data to `output_dir`.
+
+    Files are named as in the data directories, so the cleaning
+    pipeline can run on them offline. Permits are written one chunk
+    at a time, so any number of rows fits in memory. Files left by an
+    earlier run are replaced, and permits are only written to their
+    final path once complete, so interrupted runs are not reused.
+    """
+    rng = np.random.default_rng(seed)
+    paths = SyntheticPaths.in_directory(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    logger.debug("Generating {} street names", streets)
+    street_df = generate_street_names(streets, rng)
+    street_df.to_csv(paths.street_names, index=False)
+
+    logger.debug("Generating neighbourhood and zip code grids")
+    # Shapefiles are written as directories, which cannot be overwritten
+    for layer_path in (paths.neighbourhoods, paths.zip_codes):
+        if layer_path.is_dir():
+            shutil.rmtree(layer_path)
+        else:
+            layer_path.unlink(missing_ok=True)
+    grid_polygons(NEIGHBOURHOOD_GRID_SHAPE, "nhood", neighbourhood_names()).to_file(
+        paths.neighbourhoods
+    )
+    grid_polygons(ZIP_CODE_GRID_SHAPE, "zip", zip_codes()).to_file(paths.zip_codes)
+
+    logger.debug("Generating {} permits to {}", rows, paths.permits)
+    partial_path = paths.permits.with_name(f"{paths.permits.name}.partial")
+    writer = None
+    for table in iter_synthetic_permits(rows, street_df, seed, chunk_rows):
+        if writer is None:
+            writer = csv.CSVWriter(partial_path, table.schema)
+        writer.write_table(table)
+    writer.close()
+    partial_path.replace(paths.permits)
+    return paths
+
+
+@app.command()
+def main(
+    output_dir: Path = BENCHMARK_DATA_DIR / "synthetic",
+    rows: int = 100_000,
+    seed: int = 0,
+    streets: int = 1000,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+):
+    """
+    Generate a synthetic dataset with its street names and location layers.
+
+    The same `seed` and `chunk_rows` always generate the same data.
+    """
+    logger.info("Generating synthetic data")
+    write_synthetic_data(output_dir, rows, seed, streets, chunk_rows)
+    logger.success("Saved synthetic data to {}", output_dir)
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,92 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from sf_permits.config import logger
+
+# Predicates which conditions may apply to a column; missing values
+# are neither in nor not in any list of values
+PREDICATES = ("in", "not in", "missing", "present")
+
+
+@dataclass
+class Rule:
+    """
+    Consistency constraint on the attributes of a row.
+
+    A row violates the rule if it meets all of its `conditions`, which
+    map columns to a predicate name and its arguments, such as
+    `("in", [1, 2])` or `("missing",)`. Violating rows are dropped,
+    unless the rule names a `repair` column, which is set to missing.
+    """
+
+    name: str
+    conditions: dict[str, tuple]
+    repair: str | None = None
+
+
+def evaluate(values: pd.Series, predicate: str, *arguments) -> pd.Series:
+    """Whether each of `values` satisfies `predicate` with `arguments`."""
+    # Predicates are dispatched by name rather than stored as functions,
+    # so the code digest of rules does not depend on function addresses
+    match predicate:
+        case "in":
+            return values.isin(*arguments)
+        case "not in":
+            return values.notna() & ~values.isin(*arguments)
+        case "missing":
+            return values.isna()
+        case "present":
+            return values.notna()
+    raise ValueError(f"Unknown predicate {predicate!r}, expected one of {PREDICATES}")
+
+
+def violations(df: pd.DataFrame, rules: list[Rule]) -> pd.DataFrame:
+    """
+    Whether each row violates each rule, with a boolean column per rule.
+
+    Conditions shared by several rules are evaluated only once.
+    """
+    conditions: dict[tuple, np.ndarray] = {}
+    violated = {}
+    for rule in rules:
+        mask = np.ones(len(df), dtype=bool)
+        for column, (predicate, *arguments) in rule.conditions.items():
+            key = (column, predicate, repr(arguments))
+            if key not in conditions:
+                conditions[key] = np.asarray(
+                    evaluate(df[column], predicate, *arguments), dtype=bool
+                )
+            mask &= conditions[key]
+        violated[rule.name] = mask
+    return pd.DataFrame(violated, index=df.index)
+
+
+def apply_rules(df: pd.DataFrame, rules: list[Rule]) -> pd.DataFrame:
+    """
+    Repair or drop the rows of `df` which violate any of `rules`.
+
+    Violations of all rules are found in a single pass and applied
+    with one assignment per repaired column and one filter for all
+    dropped rows. The number of rows violating each rule is logged.
+    """
+    violated = violations(df, rules)
+    for name, count in violated.sum().items():
+        logger.info("{} rows violate rule {}", count, name)
+
+    repairs: dict[str, np.ndarray] = {}
+    for rule in rules:
+        if rule.repair is not None:
+            repairs[rule.repair] = (
+                repairs.get(rule.repair, np.zeros(len(df), dtype=bool))
+                | violated[rule.name].to_numpy()
+            )
+    for column, mask in repairs.items():
+        df.loc[mask, column] = pd.NA
+
+    dropped = violated[[rule.name for rule in rules if rule.repair is None]].any(
+        axis="columns"
+    )
+    logger.debug("Dropping {} inconsistent rows", dropped.sum())
+    return df[~dropped.to_numpy()]
@@ -0,0 +1,98 @@
+import pandas as pd
+
+from sf_permits.config import logger
+
+
+def dependency_counts(df: pd.DataFrame, determinant: str, dependent: str) -> pd.Series:
+    """
+    Count the rows holding each pair of `determinant` and `dependent` values.
+
+    Counts of disjoint sets of rows can be added together, so mappings
+    can be learned from data which is never held in memory at once.
+    """
+    return df[[determinant, dependent]].value_counts(dropna=True).rename("support")
+
+
+def dominant_value_mapping(
+    df: pd.DataFrame,
+    determinant: str,
+    dependent: str,
+    min_support: int = 1,
+    min_confidence: float = 0.0,
+    counts: pd.Series | None = None,
+) -> pd.Series:
+    """
+    Learn the most frequent `dependent` value of each `determinant` value.
+
+    The support of a mapping is the number of rows which hold both values
+    and its confidence is the fraction of rows with the `determinant`
+    value which hold the `dependent` one. Mappings below either threshold
+    are discarded, so the result only covers `determinant` values for which
+    the approximate functional dependency actually holds.
+
+    Support is taken from `counts`, as returned by `dependency_counts`,
+    if given, instead of from `df`.
+    """
+    if counts is None:
+        counts = dependency_counts(df, determinant, dependent)
+    counts = counts[counts > 0].reset_index(name="support")
+    distinct_count = counts[determinant].nunique()
+    counts["confidence"] = counts["support"] / counts.groupby(
+        determinant, observed=True
+    )["support"].transform("sum")
+    counts = counts.sort_values(
+        [determinant, "support", dependent], ascending=[True, False, True]
+    ).drop_duplicates(determinant)
+    counts = counts[
+        (counts["support"] >= min_support) & (counts["confidence"] >= min_confidence)
+    ]
+    logger.debug(
+        "{} of {} values of {} determine {}",
+        len(counts),
+        distinct_count,
+        determinant,
+        dependent,
+    )
+    return counts.set_index(determinant)[dependent]
+
+
+def impute_from_dependency(
+    df: pd.DataFrame,
+    determinant: str,
+    dependent: str,
+    min_support: int = 1,
+    min_confidence: float = 0.0,
+    overwrite: bool = False,
+    counts: pd.Series | None = None,
+) -> pd.DataFrame:
+    """
+    Impute `dependent` from `determinant` through their dominant value mapping.
+
+    Missing values are always filled; if `overwrite`, existing values
+    which disagree with the mapping are replaced as well. The mapping
+    is learned from `counts` if given, or else from `df`.
+    """
+    mapping = dominant_value_mapping(
+        df, determinant, dependent, min_support, min_confidence, counts
+    )
+    implied = df[determinant].map(mapping)
+    has_implied = implied.notna()
+    missing = df[dependent].isna()
+
+    fill_mask = has_implied & missing
+    if overwrite:
+        differs = (df[dependent] != implied).fillna(False).astype(bool)
+        overwrite_mask = has_implied & ~missing & differs
+    else:
+        overwrite_mask = pd.Series(False, index=df.index)
+
+    update_mask = fill_mask | overwrite_mask
+    df.loc[update_mask, dependent] = implied[update_mask]
+    logger.info(
+        "Filled {} and overwrote {} values of {} based on {}",
+        fill_mask.sum(),
+        overwrite_mask.sum(),
+        dependent,
+        determinant,
+    )
+    return df
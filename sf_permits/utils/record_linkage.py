@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+
+from sf_permits.config import logger
+
+
+def block_pairs(keys: pd.Series, max_block_size: int | None = None) -> np.ndarray:
+    """
+    Pairs of positions of rows which share the same blocking key.
+
+    Rows with missing keys are not paired. Blocks larger than
+    `max_block_size` are skipped, since they are typically placeholder
+    values which would dominate the number of pairs.
+
+    Returns an array of shape `(pairs, 2)` with the smaller position first,
+    built without looping over blocks, so time is linear in the number
+    of rows and pairs.
+
+    >>> block_pairs(pd.Series(["a", "b", "a", None, "a"]))
+    array([[0, 2],
+           [0, 4],
+           [2, 4]])
+    """
+    codes, _ = pd.factorize(keys)
+    positions = np.flatnonzero(codes >= 0)
+    # Sorting is stable, so positions are increasing within each block
+    order = positions[np.argsort(codes[positions], kind="stable")]
+    sorted_codes = codes[order]
+    sizes = np.bincount(sorted_codes)
+    if max_block_size is not None:
+        large = sizes > max_block_size
+        logger.debug(
+            "Skipping {} blocks larger than {} rows", large.sum(), max_block_size
+        )
+        kept = ~large[sorted_codes]
+        order, sorted_codes = order[kept], sorted_codes[kept]
+
+    block_starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    block_sizes = np.diff(np.r_[block_starts, len(sorted_codes)])
+    ranks = np.arange(len(sorted_codes)) - np.repeat(block_starts, block_sizes)
+    # Each row is paired with every later row of its block
+    partners = np.repeat(block_sizes, block_sizes) - ranks - 1
+    left = np.repeat(np.arange(len(order)), partners)
+    offsets = np.arange(len(left)) - np.repeat(np.cumsum(partners) - partners, partners)
+    return np.column_stack([order[left], order[left + offsets + 1]])
+
+
+def sorted_neighbourhood_pairs(keys: pd.Series, window: int) -> np.ndarray:
+    """
+    Pairs of positions of rows within `window` of each other when sorted by key.
+
+    Unlike blocking, rows with similar but different keys are paired,
+    as long as they sort close together. Rows with missing keys are not
+    paired. Returns pairs as `block_pairs` does.
+    """
+    values = keys.to_numpy(dtype=object)
+    positions = np.flatnonzero(keys.notna().to_numpy())
+    order = positions[np.argsort(values[positions].astype(str), kind="stable")]
+    pairs = [
+        np.column_stack([order[:-distance], order[distance:]])
+        for distance in range(1, min(window, len(order)))
+    ]
+    if not pairs:
+        return np.zeros((0, 2), dtype=np.int64)
+    return np.sort(np.concatenate(pairs), axis=1)
+
+
+def unique_pairs(pairs: list[np.ndarray], rows: int) -> np.ndarray:
+    """Distinct pairs among those generated by several methods, in order."""
+    if not pairs:
+        return np.zeros((0, 2), dtype=np.int64)
+    # Pairs are encoded as single integers, which sort faster than rows
+    combined = np.concatenate(pairs).astype(np.int64)
+    codes = np.sort(combined[:, 0] * rows + combined[:, 1])
+    codes = codes[np.r_[True, codes[1:] != codes[:-1]][: len(codes)]]
+    return np.column_stack([codes // rows, codes % rows])
+
+
+def connected_components(pairs: np.ndarray, rows: int) -> np.ndarray:
+    """
+    Label each row with the smallest position in its connected component.
+
+    Rows are linked by `pairs`, and rows in no pair are their own
+    component. Components are found as in union-find, hooking the root
+    of each row onto the smaller root of its pair and then compressing
+    paths, but for all pairs at once, so it takes a few vectorised passes
+    rather than a loop over pairs.
+
+    >>> connected_components(np.array([[3, 4], [1, 3], [0, 2]]), 6)
+    array([0, 1, 0, 1, 1, 5])
+    """
+    labels = np.arange(rows)
+    if len(pairs) == 0:
+        return labels
+    left, right = pairs[:, 0], pairs[:, 1]
+    while True:
+        left_roots, right_roots = labels[left], labels[right]
+        roots = np.minimum(left_roots, right_roots)
+        hooked = labels.copy()
+        np.minimum.at(hooked, left_roots, roots)
+        np.minimum.at(hooked, right_roots, roots)
+        # Path compression, until every row points at its root
+        while not np.array_equal(hooked, hooked[hooked]):
+            hooked = hooked[hooked]
+        if np.array_equal(hooked, labels):
+            return labels
+        labels = hooked
@@ -0,0 +1,393 @@
+from dataclasses import dataclass, field
+from typing import Self
+
+import numpy as np
+import pandas as pd
+
+
+class HeavyHitters:
+    """
+    Mergeable summary of the most frequent values of an attribute.
+
+    Counts are exact until more than `capacity` distinct values have
+    been seen. From then on, only the `capacity` most frequent values
+    are kept and `error` bounds how much any count may be
+    underestimated. If `capacity` is None, every value is kept.
+    """
+
+    def __init__(
+        self,
+        capacity: int | None = None,
+        counts: pd.Series | None = None,
+        error: int = 0,
+    ):
+        self.capacity = capacity
+        self.counts = pd.Series(dtype="int64") if counts is None else counts
+        self.error = error
+
+    @property
+    def exact(self) -> bool:
+        return self.error == 0
+
+    def update(self, values: pd.Series) -> Self:
+        """Add the non-null `values` to the summary."""
+        return self._add(values.value_counts(dropna=True, sort=False))
+
+    def merge(self, other: Self) -> Self:
+        self.error += other.error
+        return self._add(other.counts)
+
+    def _add(self, counts: pd.Series) -> Self:
+        if counts.empty:
+            return self
+        if not self.counts.empty:
+            counts = pd.concat([self.counts, counts]).groupby(level=0).sum()
+        # Ties are broken by value, so the order does not depend on chunking
+        counts = (
+            counts.astype("int64")
+            .sort_index(kind="stable")
+            .sort_values(ascending=False, kind="stable")
+        )
+        if self.capacity is not None and len(counts) > self.capacity:
+            self.error += int(counts.iloc[self.capacity])
+            counts = counts.iloc[: self.capacity]
+        self.counts = counts
+        return self
+
+    def to_dict(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "error": self.error,
+            "values": self.counts.index.tolist(),
+            "counts": self.counts.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict) -> Self:
+        counts = pd.Series(state["counts"], index=state["values"], dtype="int64")
+        return cls(state["capacity"], counts, state["error"])
+
+
+@dataclass
+class Moments:
+    """
+    Mergeable count, mean, sum of squared deviations and range of values.
+
+    Partial moments are combined with the pairwise update of Chan et al.,
+    which stays accurate when merging many chunks.
+    """
+
+    count: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+    minimum: float = np.inf
+    maximum: float = -np.inf
+
+    @classmethod
+    def from_values(cls, values: np.ndarray) -> Self:
+        if len(values) == 0:
+            return cls()
+        mean = values.mean()
+        return cls(
+            len(values),
+            float(mean),
+            float(((values - mean) ** 2).sum()),
+            float(values.min()),
+            float(values.max()),
+        )
+
+    @property
+    def variance(self) -> float:
+        """Sample variance, as computed by pandas."""
+        if self.count < 2:
+            return np.nan
+        return self.m2 / (self.count - 1)
+
+    def merge(self, other: Self) -> Self:
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.minimum, self.maximum = other.minimum, other.maximum
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta**2 * self.count * other.count / count
+        self.count = count
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        return self
+
+
+@dataclass
+class CoMoments:
+    """
+    Mergeable pairwise co-moments of a set of numeric attributes.
+
+    For each pair of attributes, only rows in which both are present
+    are considered, as in `pd.DataFrame.corr`. Entry `[i, j]` of `mean`
+    and `m2` refers to attribute `i` over the rows shared with `j`.
+    """
+
+    columns: list[str]
+    count: np.ndarray = field(default=None)
+    mean: np.ndarray = field(default=None)
+    m2: np.ndarray = field(default=None)
+    comoment: np.ndarray = field(default=None)
+
+    def __post_init__(self):
+        shape = (len(self.columns), len(self.columns))
+        for name in ("count", "mean", "m2", "comoment"):
+            if getattr(self, name) is None:
+                setattr(self, name, np.zeros(shape))
+            else:
+                setattr(self, name, np.asarray(getattr(self, name), dtype=float))
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> Self:
+        moments = cls(list(df.columns))
+        values = df.to_numpy(dtype=float, na_value=np.nan)
+        present = ~np.isnan(values)
+        for i in range(len(moments.columns)):
+            for j in range(i, len(moments.columns)):
+                shared = present[:, i] & present[:, j]
+                if not shared.any():
+                    continue
+                x, y = values[shared, i], values[shared, j]
+                dx, dy = x - x.mean(), y - y.mean()
+                moments.count[i, j] = moments.count[j, i] = shared.sum()
+                moments.mean[i, j], moments.mean[j, i] = x.mean(), y.mean()
+                moments.m2[i, j], moments.m2[j, i] = (dx**2).sum(), (dy**2).sum()
+                moments.comoment[i, j] = moments.comoment[j, i] = (dx * dy).sum()
+        return moments
+
+    def merge(self, other: Self) -> Self:
+        count = self.count + other.count
+        with np.errstate(divide="ignore", invalid="ignore"):
+            weight = np.where(count > 0, self.count * other.count / count, 0)
+            delta = other.mean - self.mean
+            self.mean = np.where(count > 0, self.mean + delta * other.count / count, 0)
+        self.m2 = self.m2 + other.m2 + delta**2 * weight
+        self.comoment = self.comoment + other.comoment + delta * delta.T * weight
+        self.count = count
+        return self
+
+    def correlation(self) -> pd.DataFrame:
+        """Pearson correlation of every pair of attributes."""
+        with np.errstate(divide="ignore", invalid="ignore"):
+            divisor = np.sqrt(self.m2 * self.m2.T)
+            correlation = np.where(divisor > 0, self.comoment / divisor, np.nan)
+        return pd.DataFrame(
+            np.clip(correlation, -1, 1), index=self.columns, columns=self.columns
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "columns": self.columns,
+            "count": self.count.tolist(),
+            "mean": self.mean.tolist(),
+            "m2": self.m2.tolist(),
+            "comoment": self.comoment.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict) -> Self:
+        return cls(**state)
+
+
+def quantiles_from_counts(counts: pd.Series, q: list[float]) -> list[float]:
+    """
+    Compute quantiles of the values with frequencies `counts` exactly.
+
+    Uses linear interpolation between the closest ranks,
+    as `pd.Series.quantile` does.
+    """
+    counts = counts.sort_index()
+    values = counts.index.to_numpy(dtype=float)
+    cumulative = counts.to_numpy().cumsum()
+    positions = (cumulative[-1] - 1) * np.asarray(q)
+    lower = np.floor(positions)
+    below = values[np.searchsorted(cumulative, lower, side="right")]
+    above = values[
+        np.minimum(
+            np.searchsorted(cumulative, lower + 1, side="right"), len(values) - 1
+        )
+    ]
+    # Interpolate from the closest end, as `np.percentile` does
+    fraction = positions - lower
+    difference = above - below
+    return np.where(
+        fraction >= 0.5,
+        above - difference * (1 - fraction),
+        below + difference * fraction,
+    ).tolist()
+
+
+def hash_values(values: pd.Series | pd.DataFrame) -> np.ndarray:
+    """Hash values, or tuples of a DataFrame, to 64 bit integers."""
+    return pd.util.hash_pandas_object(values, index=False).to_numpy()
+
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    # Each half is exactly representable as a float, so `log2` is exact
+    high = (values >> np.uint64(32)).astype(np.float64)
+    low = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    with np.errstate(divide="ignore"):
+        high_length = np.where(high > 0, np.floor(np.log2(high)) + 33, 0)
+        low_length = np.where(low > 0, np.floor(np.log2(low)) + 1, 0)
+    return np.where(high > 0, high_length, low_length).astype(np.uint8)
+
+
+class HyperLogLog:
+    """
+    Mergeable estimate of the number of distinct values.
+
+    Uses `2 ** precision` registers of one byte each, for a relative
+    standard error of `1.04 / sqrt(2 ** precision)`.
+    """
+
+    def __init__(self, precision: int = 14, registers: np.ndarray | None = None):
+        self.precision = precision
+        self.registers = (
+            np.zeros(2**precision, dtype=np.uint8)
+            if registers is None
+            else np.asarray(registers, dtype=np.uint8)
+        )
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / np.sqrt(len(self.registers))
+
+    def update(self, hashes: np.ndarray) -> Self:
+        """Add values, given as hashes from `hash_values`."""
+        hashes = hashes.astype(np.uint64)
+        suffix_length = 64 - self.precision
+        buckets = (hashes >> np.uint64(suffix_length)).astype(np.int64)
+        suffixes = hashes & np.uint64(2**suffix_length - 1)
+        ranks = suffix_length - _bit_length(suffixes) + 1
+        np.maximum.at(self.registers, buckets, ranks.astype(np.uint8))
+        return self
+
+    def merge(self, other: Self) -> Self:
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLogs of different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self) -> float:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m**2 / np.sum(np.exp2(-self.registers.astype(float)))
+        zeros = np.count_nonzero(self.registers == 0)
+        if estimate <= 2.5 * m and zeros > 0:
+            # Linear counting is more accurate for small cardinalities
+            estimate = m * np.log(m / zeros)
+        return float(estimate)
+
+    def to_dict(self) -> dict:
+        return {"precision": self.precision, "registers": self.registers.tolist()}
+
+    @classmethod
+    def from_dict(cls, state: dict) -> Self:
+        return cls(state["precision"], state["registers"])
+
+
+class TDigest:
+    """
+    Mergeable summary of a distribution for estimating its quantiles.
+
+    Values are clustered into weighted centroids, which are smaller
+    near the tails so that extreme quantiles remain accurate. Higher
+    `compression` gives more centroids and more accurate quantiles.
+    """
+
+    def __init__(
+        self,
+        compression: float = 200,
+        means: np.ndarray | None = None,
+        weights: np.ndarray | None = None,
+        minimum: float = np.inf,
+        maximum: float = -np.inf,
+    ):
+        self.compression = compression
+        self.means = np.empty(0) if means is None else np.asarray(means, dtype=float)
+        self.weights = (
+            np.empty(0) if weights is None else np.asarray(weights, dtype=float)
+        )
+        self.minimum = minimum
+        self.maximum = maximum
+
+    @property
+    def count(self) -> float:
+        return float(self.weights.sum())
+
+    def update(self, values: np.ndarray) -> Self:
+        if len(values) == 0:
+            return self
+        self.minimum = min(self.minimum, float(values.min()))
+        self.maximum = max(self.maximum, float(values.max()))
+        return self._compress(
+            np.concatenate([self.means, values]),
+            np.concatenate([self.weights, np.ones(len(values))]),
+        )
+
+    def merge(self, other: Self) -> Self:
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        return self._compress(
+            np.concatenate([self.means, other.means]),
+            np.concatenate([self.weights, other.weights]),
+        )
+
+    def _compress(self, means: np.ndarray, weights: np.ndarray) -> Self:
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        cumulative = weights.cumsum()
+        # Centroids are grouped by unit intervals of the arcsine scale function,
+        # which bounds their size by how close they are to the tails
+        left = (cumulative - weights) / cumulative[-1]
+        groups = np.floor(
+            self.compression / (2 * np.pi) * np.arcsin(2 * left - 1)
+        ).astype(np.int64)
+        boundaries = np.flatnonzero(np.diff(groups)) + 1
+        starts = np.concatenate([[0], boundaries])
+        self.weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / self.weights
+        return self
+
+    def quantiles(self, q: list[float]) -> list[float]:
+        centres = self.weights.cumsum() - self.weights / 2
+        ranks = np.asarray(q) * self.count
+        return np.interp(
+            ranks,
+            np.concatenate([[0], centres, [self.count]]),
+            np.concatenate([[self.minimum], self.means, [self.maximum]]),
+        ).tolist()
+
+    def rank_errors(self, q: list[float]) -> list[float]:
+        """
+        Estimate the error of `quantiles` as a fraction of the values.
+
+        This is half the relative weight of the centroid each quantile
+        falls in, within which values are interpolated.
+        """
+        cumulative = self.weights.cumsum()
+        indices = np.minimum(
+            np.searchsorted(cumulative, np.asarray(q) * self.count),
+            len(self.weights) - 1,
+        )
+        return (self.weights[indices] / (2 * self.count)).tolist()
+
+    def to_dict(self) -> dict:
+        return {
+            "compression": self.compression,
+            "means": self.means.tolist(),
+            "weights": self.weights.tolist(),
+            "minimum": self.minimum,
+            "maximum": self.maximum,
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict) -> Self:
+        return cls(**state)
@@ -1,31 +1,246 @@
 from collections import defaultdict
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from math import ceil
+import os
 
+import numpy as np
 import pandas as pd
 from strsimpy.levenshtein import Levenshtein
 from strsimpy.jaro_winkler import JaroWinkler
-from tqdm import tqdm
 
 from sf_permits.config import logger
 
+_JARO_WINKLER = JaroWinkler()
+_LEVENSHTEIN = Levenshtein()
+# Margin guarding upper bounds against floating point rounding
+_BOUND_TOLERANCE = 1e-9
+# Base values are split into more chunks than workers to balance the load
+CHUNKS_PER_WORKER = 4
+
+
+class QGramIndex:
+    """
+    Inverted index from character q-grams to the values of a Series.
+
+    Values are padded at both ends so that prefixes and suffixes
+    produce their own q-grams. Candidates for a string are the
+    values which share at least a fraction `min_overlap` of its q-grams.
+
+    The filter is a heuristic: similar short strings, such as a name
+    with two letters transposed, may share few q-grams and be missed.
+    Use `matching_recall` against the exhaustive scan to check whether
+    the loss is acceptable before passing an index to `get_matching_strings`.
+    """
+
+    def __init__(
+        self,
+        target: pd.Series,
+        q: int = 2,
+        min_overlap: float = 0.5,
+        padding: str = "#",
+    ):
+        self.target = target
+        self.q = q
+        self.min_overlap = min_overlap
+        self.padding = padding
+        # Index distinct values only, since many rows share the same string
+        self.codes, self.uniques = pd.factorize(target, use_na_sentinel=True)
+        postings: dict[str, list[int]] = defaultdict(list)
+        for unique_index, value in enumerate(self.uniques):
+            for qgram in self.qgrams(value):
+                postings[qgram].append(unique_index)
+        self.postings = {
+            qgram: np.array(indices, dtype=np.int64)
+            for qgram, indices in postings.items()
+        }
+        logger.debug(
+            "Indexed {} distinct values with {} {}-grams",
+            len(self.uniques),
+            len(self.postings),
+            q,
+        )
+
+    def qgrams(self, value: str) -> set[str]:
+        padded = self.padding * (self.q - 1) + value + self.padding * (self.q - 1)
+        return {padded[i : i + self.q] for i in range(len(padded) - self.q + 1)}
+
+    def shared_counts(self, qgrams: set[str]) -> np.ndarray:
+        """Number of `qgrams` shared with each distinct indexed value."""
+        postings = [self.postings[qgram] for qgram in qgrams if qgram in self.postings]
+        if not postings:
+            return np.zeros(len(self.uniques), dtype=np.int64)
+        return np.bincount(np.concatenate(postings), minlength=len(self.uniques))
+
+    def candidates(self, value: str) -> pd.Series:
+        """Values in the indexed Series which share enough q-grams with `value`."""
+        qgrams = self.qgrams(value)
+        min_shared = max(ceil(self.min_overlap * len(qgrams)), 1)
+        candidate_uniques = np.flatnonzero(self.shared_counts(qgrams) >= min_shared)
+        return self.target[np.isin(self.codes, candidate_uniques)]
+
+
+class JaroWinklerIndex(QGramIndex):
+    """
+    Lossless index of the values whose Jaro-Winkler similarity may exceed `threshold`.
+
+    Characters are indexed with their number of occurrence, so the
+    count shared with a value is the size of the intersection of both
+    character multisets, which bounds the number of Jaro matches.
+    Candidates are the values for which that bound, with no
+    transpositions and the longest possible common prefix, exceeds
+    `threshold`, so no pair with a higher similarity is ever missed.
+    Longer q-grams give no such guarantee, since Jaro matches
+    characters out of order within a window.
+    """
+
+    def __init__(self, target: pd.Series, threshold: float):
+        self.threshold = threshold
+        super().__init__(target, q=1, min_overlap=0, padding="")
+        self.lengths = np.array([len(value) for value in self.uniques], dtype=np.int64)
+
+    def qgrams(self, value: str) -> set[str]:
+        occurrences: dict[str, int] = defaultdict(int)
+        qgrams = set()
+        for character in value:
+            occurrences[character] += 1
+            qgrams.add(f"{character}{occurrences[character]}")
+        return qgrams
+
+    def candidates(self, value: str) -> pd.Series:
+        """Values in the indexed Series which may be similar enough to `value`."""
+        matches = self.shared_counts(self.qgrams(value))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            jaro_bound = (matches / len(value) + matches / self.lengths + 1) / 3
+        jaro_bound = np.where(matches == 0, 0.0, jaro_bound)
+        max_lengths = np.maximum(len(value), self.lengths)
+        prefix = np.minimum(len(value), self.lengths)
+        with np.errstate(divide="ignore"):
+            boost = np.minimum(0.1, 1.0 / max_lengths) * prefix
+        bound = np.where(
+            jaro_bound > 0.7, jaro_bound + boost * (1 - jaro_bound), jaro_bound
+        )
+        candidate_uniques = np.flatnonzero(bound + _BOUND_TOLERANCE > self.threshold)
+        return self.target[np.isin(self.codes, candidate_uniques)]
+
 
 def get_matching_strings(
     base: pd.Series,
     target: pd.Series,
     similarity,
     block_length: int = 0,
+    index: QGramIndex | None = None,
+    vectorised: bool = False,
+    workers: int = 1,
 ) -> tuple[dict[int, list], dict[str, list]]:
+    """
+    Match each value in `base` to similar values in `target`.
+
+    Candidates are either all values in `target` which share the first
+    `block_length` characters with the base value or, if a prebuilt
+    `index` over `target` is given, the candidates it returns.
+
+    If `vectorised`, `similarity` is called once per base value with
+    the Series of candidates and must return a boolean array, as
+    the batch similarity functions in this module allow.
+
+    With more than one worker, base values are split into chunks which
+    are matched in a process pool. `target`, `similarity` and `index`
+    are sent to each worker once, so they must be picklable, and
+    the results are merged in chunk order to match the serial run.
+    """
     logger.info("Starting string matching")
 
+    from tqdm import tqdm
+
     matching_indices: dict[int, list] = defaultdict(list)
     matching_values: dict[str, list] = defaultdict(list)  # Only for visualisation
 
+    if base.empty:
+        logger.success("String matching complete")
+        return {}, {}
+
+    if workers > 1:
+        chunks = np.array_split(
+            np.arange(len(base)), min(len(base), workers * CHUNKS_PER_WORKER)
+        )
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_initialise_matching_worker,
+            initargs=(target, similarity, block_length, index, vectorised),
+        ) as executor:
+            chunk_results = executor.map(
+                _match_chunk_in_worker, (base.iloc[chunk] for chunk in chunks)
+            )
+            for chunk_indices, chunk_values in tqdm(
+                chunk_results, total=len(chunks), desc="String matching"
+            ):
+                for key, value in chunk_indices.items():
+                    matching_indices[key].extend(value)
+                for key, value in chunk_values.items():
+                    matching_values[key].extend(value)
+    else:
+        matching_indices, matching_values = _match_chunk(
+            base, target, similarity, block_length, index, vectorised
+        )
+
+    matching_indices = {key: value for key, value in matching_indices.items() if value}
+    matching_values = {key: value for key, value in matching_values.items() if value}
+
+    logger.success("String matching complete")
+
+    return matching_indices, matching_values
+
+
+# State shared by all chunks matched in a worker process
+_matching_worker_state: tuple = ()
+
+
+def _initialise_matching_worker(*state) -> None:
+    global _matching_worker_state
+    _matching_worker_state = state
+
+
+def _match_chunk_in_worker(
+    base: pd.Series,
+) -> tuple[dict[int, list], dict[str, list]]:
+    return _match_chunk(base, *_matching_worker_state, progress=False)
+
+
+def _match_chunk(
+    base: pd.Series,
+    target: pd.Series,
+    similarity,
+    block_length: int,
+    index: QGramIndex | None,
+    vectorised: bool,
+    progress: bool = True,
+) -> tuple[dict[int, list], dict[str, list]]:
+    from tqdm import tqdm
+
+    matching_indices: dict[int, list] = defaultdict(list)
+    matching_values: dict[str, list] = defaultdict(list)
+
     for base_index, base_value in tqdm(
-        base.items(), total=len(base), desc="String matching"
+        base.items(), total=len(base), desc="String matching", disable=not progress
     ):
         logger.debug("Processing base value {}", base_value)
-        block_key = base_value[:block_length]
-        block = target[target.str.startswith(block_key)]
-        logger.debug("{} candidates in block '{}'", len(block), block_key)
+        if index is None:
+            block_key = base_value[:block_length]
+            block = target[target.str.startswith(block_key)]
+            logger.debug("{} candidates in block '{}'", len(block), block_key)
+        else:
+            block = index.candidates(base_value)
+            logger.debug("{} candidates in index", len(block))
+        if vectorised:
+            block = block[block != base_value]
+            # Score each distinct candidate once
+            codes, uniques = pd.factorize(block)
+            similar = np.asarray(similarity(base_value, pd.Series(uniques)), dtype=bool)
+            matches = block[similar[codes]]
+            matching_indices[base_index].extend(matches.index)
+            matching_values[base_value].extend(matches)
+            continue
         for i, value in block.items():
             if value == base_value:
                 continue
@@ -40,11 +255,6 @@ def get_matching_strings(
                 "{} matches in for '{}'", len(matching_indices[base_value]), base_value
             )
 
-    matching_indices = {key: value for key, value in matching_indices.items() if value}
-    matching_values = {key: value for key, value in matching_values.items() if value}
-
-    logger.success("String matching complete")
-
     return matching_indices, matching_values
 
 
@@ -60,10 +270,319 @@ def jaccard(base: str, target: str, normalise: bool = True) -> float:
 
 
 def levenshtein(base: str, target: str) -> float:
-    distance = Levenshtein().distance(base, target)
+    distance = _LEVENSHTEIN.distance(base, target)
     combined_length = len(base) + len(target)
     return 1 - distance / combined_length
 
 
 def jaro_winkler(base: str, target: str) -> float:
-    return JaroWinkler().similarity(base, target)
+    return _JARO_WINKLER.similarity(base, target)
+
+
+def to_code_points(strings: Sequence[str]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Convert strings to a zero-padded array of Unicode code points.
+
+    Returns the array of shape `(len(strings), max_length)` and
+    the length of each string.
+    """
+    array = np.asarray(strings, dtype=object).astype(np.str_)
+    if array.size == 0:
+        return np.zeros((0, 0), dtype=np.uint32), np.zeros(0, dtype=np.int64)
+    max_length = array.dtype.itemsize // np.dtype(np.uint32).itemsize
+    codes = array.view(np.uint32).reshape(len(array), max_length)
+    lengths = np.char.str_len(array).astype(np.int64)
+    return codes, lengths
+
+
+def _align(
+    base: str | Sequence[str], target: Sequence[str]
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Code points of `base` and `target`, broadcasting a single base string."""
+    target_codes, target_lengths = to_code_points(target)
+    if isinstance(base, str):
+        base_codes, base_lengths = to_code_points([base])
+        base_codes = np.broadcast_to(
+            base_codes, (len(target_codes), base_codes.shape[1])
+        )
+        base_lengths = np.broadcast_to(base_lengths, len(target_codes))
+    else:
+        base_codes, base_lengths = to_code_points(base)
+        if len(base_codes) != len(target_codes):
+            raise ValueError("Base and target must have the same length")
+    # Pad both arrays to the same width so positions can be compared directly
+    width = max(base_codes.shape[1], target_codes.shape[1])
+    base_codes = np.pad(base_codes, ((0, 0), (0, width - base_codes.shape[1])))
+    target_codes = np.pad(target_codes, ((0, 0), (0, width - target_codes.shape[1])))
+    return base_codes, base_lengths, target_codes, target_lengths
+
+
+def jaro_winkler_batch(base: str | Sequence[str], target: Sequence[str]) -> np.ndarray:
+    """
+    Jaro-Winkler similarity between `base` and each string in `target`.
+
+    `base` is either a single string, compared against every target,
+    or a sequence aligned with `target`. Results are identical to
+    `jaro_winkler`, including the unbounded prefix length used by `strsimpy`.
+    """
+    base_codes, base_lengths, target_codes, target_lengths = _align(base, target)
+    rows = np.arange(len(target_codes))
+    positions = np.arange(base_codes.shape[1])
+
+    # `strsimpy` searches characters of the shorter string in the longer one
+    swap = base_lengths > target_lengths
+    min_codes = np.where(swap[:, None], target_codes, base_codes)
+    max_codes = np.where(swap[:, None], base_codes, target_codes)
+    min_lengths = np.minimum(base_lengths, target_lengths)
+    max_lengths = np.maximum(base_lengths, target_lengths)
+    match_range = np.maximum(max_lengths // 2 - 1, 0)[:, None]
+
+    min_flags = np.zeros(min_codes.shape, dtype=bool)
+    max_flags = np.zeros(max_codes.shape, dtype=bool)
+    for i in range(min_codes.shape[1]):
+        window = (
+            (positions >= i - match_range)
+            & (positions <= i + match_range)
+            & (positions < max_lengths[:, None])
+        )
+        candidates = (
+            window
+            & ~max_flags
+            & (max_codes == min_codes[:, i : i + 1])
+            & (i < min_lengths)[:, None]
+        )
+        found = candidates.any(axis=1)
+        max_flags[rows[found], candidates[found].argmax(axis=1)] = True
+        min_flags[:, i] = found
+    matches = min_flags.sum(axis=1)
+
+    # Matched characters in order of appearance in each string
+    min_matched = np.take_along_axis(
+        min_codes, np.argsort(~min_flags, axis=1, kind="stable"), axis=1
+    )
+    max_matched = np.take_along_axis(
+        max_codes, np.argsort(~max_flags, axis=1, kind="stable"), axis=1
+    )
+    transpositions = (
+        (min_matched != max_matched) & (positions < matches[:, None])
+    ).sum(axis=1) // 2
+
+    prefix_equal = (base_codes == target_codes) & (positions < min_lengths[:, None])
+    prefix = np.cumprod(prefix_equal, axis=1).sum(axis=1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        jaro = (
+            matches / base_lengths
+            + matches / target_lengths
+            + (matches - transpositions) / matches
+        ) / 3
+        winkler = jaro + np.minimum(0.1, 1.0 / max_lengths) * prefix * (1 - jaro)
+    similarity = np.where(jaro > 0.7, winkler, jaro)
+    similarity = np.where(matches == 0, 0.0, similarity)
+    equal = (base_lengths == target_lengths) & (base_codes == target_codes).all(axis=1)
+    return np.where(equal, 1.0, similarity)
+
+
+def levenshtein_batch(base: str | Sequence[str], target: Sequence[str]) -> np.ndarray:
+    """
+    Normalised Levenshtein similarity between `base` and each string in `target`.
+
+    Equivalent to `levenshtein`, except that comparing two empty
+    strings results in NaN rather than an exception.
+    """
+    base_codes, base_lengths, target_codes, target_lengths = _align(base, target)
+    rows = np.arange(len(target_codes))
+    columns = np.arange(target_codes.shape[1] + 1)
+
+    # Each iteration computes one row of the dynamic programming matrix
+    # for all pairs at once; the insertion term, which depends on
+    # the current row, is resolved with a cumulative minimum
+    previous = np.broadcast_to(columns, (len(target_codes), len(columns))).copy()
+    for i in range(base_codes.shape[1]):
+        cost = (target_codes != base_codes[:, i : i + 1]).astype(np.int64)
+        current = np.empty_like(previous)
+        current[:, 0] = i + 1
+        current[:, 1:] = np.minimum(previous[:, 1:] + 1, previous[:, :-1] + cost)
+        current = np.minimum.accumulate(current - columns, axis=1) + columns
+        active = (i < base_lengths)[:, None]
+        previous = np.where(active, current, previous)
+    distance = previous[rows, target_lengths]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return 1 - distance / (base_lengths + target_lengths)
+
+
+def jaccard_batch(
+    base: str | Sequence[str], target: Sequence[str], normalise: bool = True
+) -> np.ndarray:
+    """
+    Word-level Jaccard similarity between `base` and each string in `target`.
+
+    Words are encoded as integers so that comparisons operate on
+    padded integer arrays. Results are identical to `jaccard`.
+    """
+    vocabulary: dict[str, int] = {}
+
+    def encode(strings: Sequence[str]) -> np.ndarray:
+        # Split only distinct strings, since values repeat often
+        codes, uniques = pd.factorize(np.asarray(strings, dtype=object))
+        words_list = [value.split() for value in uniques]
+        width = max((len(words) for words in words_list), default=0)
+        encoded = np.full((len(words_list), width), -1, dtype=np.int64)
+        for row, words in enumerate(words_list):
+            encoded[row, : len(words)] = [
+                vocabulary.setdefault(word, len(vocabulary)) for word in words
+            ]
+        return encoded[codes]
+
+    target_ids = encode(target)
+    if isinstance(base, str):
+        base_ids = encode([base])[np.zeros(len(target_ids), dtype=np.int64)]
+    else:
+        base_ids = encode(base)
+        if len(base_ids) != len(target_ids):
+            raise ValueError("Base and target must have the same length")
+    target_valid = target_ids >= 0
+
+    in_base = (target_ids[:, :, None] == base_ids[:, None, :]).any(axis=2)
+    intersection = (in_base & target_valid).sum(axis=1)
+    if not normalise:
+        return intersection.astype(np.float64)
+
+    def distinct_count(ids: np.ndarray) -> np.ndarray:
+        ids = np.sort(ids, axis=1)
+        first = np.ones(ids.shape, dtype=bool)
+        first[:, 1:] = ids[:, 1:] != ids[:, :-1]
+        return (first & (ids >= 0)).sum(axis=1)
+
+    # Distinct target words missing from base plus distinct base words
+    missing_ids = np.where(in_base, -1, target_ids)
+    union = distinct_count(base_ids) + distinct_count(missing_ids)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return intersection / union
+
+
+def _winkler_bound(jaro_bound: float, prefix: int, max_length: int) -> float:
+    """Jaro-Winkler similarity implied by an upper bound on the Jaro similarity."""
+    if jaro_bound <= 0.7:
+        return jaro_bound
+    return jaro_bound + min(0.1, 1.0 / max_length) * prefix * (1 - jaro_bound)
+
+
+def jaro_winkler_upper_bound(base: str, target: str) -> float:
+    """
+    Upper bound on `jaro_winkler` computed from character counts only.
+
+    The number of Jaro matches cannot exceed the size of the intersection
+    of the character multisets of both strings, and the Winkler boost
+    grows with the Jaro similarity, so the bound assumes no transpositions.
+    """
+    if base == target:
+        return 1.0
+    if not base or not target:
+        return 0.0
+    matches = sum(
+        min(base.count(character), target.count(character)) for character in set(base)
+    )
+    if matches == 0:
+        return 0.0
+    jaro_bound = (matches / len(base) + matches / len(target) + 1) / 3
+    prefix = len(os.path.commonprefix((base, target)))
+    return _winkler_bound(jaro_bound, prefix, max(len(base), len(target)))
+
+
+def jaro_winkler_exceeds(base: str, target: str, threshold: float) -> bool:
+    """
+    Whether `jaro_winkler(base, target) > threshold`.
+
+    Pairs are rejected from their lengths and character counts
+    before computing the full similarity, so most dissimilar pairs
+    never reach the quadratic matching step.
+    """
+    if base == target:
+        return 1.0 > threshold
+    min_length = min(len(base), len(target))
+    max_length = max(len(base), len(target))
+    # Every character of the shorter string matching, without transpositions
+    # and with the longest possible common prefix
+    length_bound = _winkler_bound(
+        (min_length / max(max_length, 1) + 2) / 3, min_length, max_length
+    )
+    if length_bound + _BOUND_TOLERANCE <= threshold:
+        return False
+    if jaro_winkler_upper_bound(base, target) + _BOUND_TOLERANCE <= threshold:
+        return False
+    return jaro_winkler(base, target) > threshold
+
+
+def jaro_winkler_exceeds_batch(
+    base: str | Sequence[str], target: Sequence[str], threshold: float
+) -> np.ndarray:
+    """
+    Vectorised equivalent of `jaro_winkler_exceeds`.
+
+    Upper bounds are computed for all pairs at once and
+    `jaro_winkler_batch` only runs on the pairs which survive them.
+    """
+    base_codes, base_lengths, target_codes, target_lengths = _align(base, target)
+    valid_base = np.arange(base_codes.shape[1]) < base_lengths[:, None]
+    matches = np.zeros(len(target_codes), dtype=np.int64)
+    for character in np.unique(base_codes[valid_base]):
+        matches += np.minimum(
+            (base_codes == character).sum(axis=1),
+            (target_codes == character).sum(axis=1),
+        )
+    max_lengths = np.maximum(base_lengths, target_lengths)
+    prefix = np.cumprod(
+        (base_codes == target_codes)
+        & (
+            np.arange(base_codes.shape[1])
+            < np.minimum(base_lengths, target_lengths)[:, None]
+        ),
+        axis=1,
+    ).sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        jaro_bound = (matches / base_lengths + matches / target_lengths + 1) / 3
+    jaro_bound = np.where(matches == 0, 0.0, jaro_bound)
+    with np.errstate(divide="ignore"):
+        boost = np.minimum(0.1, 1.0 / max_lengths) * prefix
+    bound = np.where(
+        jaro_bound > 0.7, jaro_bound + boost * (1 - jaro_bound), jaro_bound
+    )
+    equal = (base_lengths == target_lengths) & (base_codes == target_codes).all(axis=1)
+    bound = np.where(equal, 1.0, bound)
+
+    exceeds = np.zeros(len(target_codes), dtype=bool)
+    candidates = np.flatnonzero(bound + _BOUND_TOLERANCE > threshold)
+    if len(candidates) == 0:
+        return exceeds
+    target_values = np.asarray(target, dtype=object)[candidates]
+    base_values = (
+        base if isinstance(base, str) else np.asarray(base, dtype=object)[candidates]
+    )
+    exceeds[candidates] = jaro_winkler_batch(base_values, target_values) > threshold
+    return exceeds
+
+
+def matching_recall(
+    reference_indices: dict[int, list], indices: dict[int, list]
+) -> float:
+    """
+    Fraction of matches in `reference_indices` which also appear in `indices`.
+
+    Used to compare indexed candidate generation with the exhaustive scan
+    performed when `get_matching_strings` is called without an index.
+    """
+    reference_pairs = {
+        (base_index, target_index)
+        for base_index, target_indices in reference_indices.items()
+        for target_index in target_indices
+    }
+    if not reference_pairs:
+        return 1.0
+    pairs = {
+        (base_index, target_index)
+        for base_index, target_indices in indices.items()
+        for target_index in target_indices
+    }
+    return len(reference_pairs & pairs) / len(reference_pairs)
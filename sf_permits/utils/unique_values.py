@@ -0,0 +1,38 @@
+from collections.abc import Callable
+
+import numpy as np
+import pandas as pd
+
+
+def map_unique[T: (pd.Series, pd.DataFrame)](
+    values: pd.Series, func: Callable[[pd.Series], T]
+) -> T:
+    """
+    Apply `func` to the distinct values of `values` and broadcast the result.
+
+    `func` receives the distinct non-missing values as a Series and must
+    return a Series, or a DataFrame with a row per value, in the same order.
+    The result is spread back to every row through the factorized codes,
+    with missing values wherever `values` is missing, so the work done
+    by `func` depends on the cardinality of `values` and not its length.
+
+    >>> values = pd.Series(["A", None, "b", "A"], dtype="string")
+    >>> map_unique(values, lambda v: v.str.lower())
+    0       a
+    1    <NA>
+    2       b
+    3       a
+    dtype: string
+    """
+    codes, uniques = pd.factorize(values)
+    transformed = func(pd.Series(uniques))
+    if isinstance(transformed, pd.DataFrame):
+        return pd.DataFrame(
+            {column: _take(transformed[column], codes) for column in transformed},
+            index=values.index,
+        )
+    return pd.Series(_take(transformed, codes), index=values.index, name=values.name)
+
+
+def _take(values: pd.Series, codes: np.ndarray):
+    return values.array.take(codes, allow_fill=True)